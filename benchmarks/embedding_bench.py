@@ -0,0 +1,96 @@
+"""
+CPU embedding throughput on our corpus.
+
+    python -m benchmarks.embedding_bench
+    python -m benchmarks.embedding_bench --batch-sizes 8 16 32 64 --limit 512 --threads 4
+
+Chunks the corpus the way ingestion does (ingestion.chunker), then encodes
+the first --limit chunks with the embedding model at each batch size and
+reports texts/sec. The best batch size is what EMBEDDING_BATCH_SIZE should be
+set to on that machine.
+
+Finally the same chunks go through the EmbeddingService twice with a fresh
+on-disk cache, to show what re-ingesting unchanged chunks costs.
+"""
+import time
+import argparse
+import tempfile
+
+import numpy as np
+
+
+def load_chunks(limit):
+    from ingestion.chunker import chunk_page
+    from ingestion.stream_ingest import iter_pages
+
+    texts = [chunk["text"] for url, markdown in iter_pages() for chunk in chunk_page(url, markdown)]
+    return texts[:limit]
+
+
+def bench_batch_size(model, texts, batch_size, repeat):
+    # One warm-up batch so lazy init is not billed to the first size measured.
+    model.encode(texts[:batch_size], batch_size=batch_size, convert_to_numpy=True)
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        model.encode(texts, batch_size=batch_size, convert_to_numpy=True, normalize_embeddings=True)
+        best = min(best, time.perf_counter() - start)
+    return len(texts) / best
+
+
+def bench_service(model, texts, batch_size, dtype):
+    from common.registry import EMBEDDING_MODEL_NAME
+    from common.embedding_service import EmbeddingService, EmbeddingStore
+
+    dim = model.get_sentence_embedding_dimension()
+    with tempfile.TemporaryDirectory() as store_dir:
+        service = EmbeddingService(
+            encode=lambda batch, size: model.encode(batch, batch_size=size, convert_to_numpy=True, normalize_embeddings=True),
+            model_name=EMBEDDING_MODEL_NAME,
+            dim=dim,
+            batch_size=batch_size,
+            store=EmbeddingStore(store_dir, EMBEDDING_MODEL_NAME, dim, dtype=dtype),
+        )
+        timings = []
+        for _ in range(2):
+            start = time.perf_counter()
+            service.embed(texts)
+            timings.append(time.perf_counter() - start)
+        return timings, service.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 8, 16, 32, 64, 128])
+    parser.add_argument("--limit", type=int, default=1024, help="number of corpus chunks to encode")
+    parser.add_argument("--repeat", type=int, default=2, help="runs per batch size; the fastest is reported")
+    parser.add_argument("--threads", type=int, help="torch CPU threads (default: torch's choice)")
+    parser.add_argument("--cache-dtype", choices=["float32", "int8"], default="float32")
+    args = parser.parse_args()
+
+    from common.registry import get_registry
+
+    model = get_registry().embedding_model()
+    if args.threads:
+        import torch
+        torch.set_num_threads(args.threads)
+
+    texts = load_chunks(args.limit)
+    lengths = np.array([len(text) for text in texts])
+    print(f"{len(texts)} chunks, {int(np.median(lengths))} chars median, {lengths.max()} max")
+
+    print(f"{'batch':>6}{'texts/s':>10}")
+    results = {}
+    for batch_size in args.batch_sizes:
+        results[batch_size] = bench_batch_size(model, texts, batch_size, args.repeat)
+        print(f"{batch_size:>6}{results[batch_size]:>10.1f}")
+    best = max(results, key=results.get)
+    print(f"Fastest: batch size {best} (EMBEDDING_BATCH_SIZE={best})")
+
+    (cold, warm), stats = bench_service(model, texts, best, args.cache_dtype)
+    print(f"Service, empty cache: {cold:.2f}s ({len(texts) / cold:.1f} texts/s)")
+    print(f"Service, warm cache:  {warm:.3f}s ({stats['store_hits']} of {stats['texts']} texts from the {args.cache_dtype} cache)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,397 @@
+"""
+Local stand-ins for the external APIs the chat flow calls: Gemini, Groq,
+Ragie, LlamaCloud retrieval and Supabase (PostgREST). One HTTP server serves
+all of them under path prefixes, with configurable latency, error rate and
+429 behaviour per service, and counts every call.
+
+Used by benchmarks/load_test.py; can also be run on its own to point a dev
+instance of the app at it:
+
+    python -m benchmarks.fake_services --port 8765
+"""
+import re
+import json
+import time
+import random
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+SERVICES = ("gemini", "groq", "ragie", "llamacloud", "supabase")
+
+WORDS = """
+the institute offers national diploma and higher national diploma programmes in petroleum engineering
+welding fabrication industrial safety environmental technology electrical mechanical and chemical
+engineering applicants need five credits including english and mathematics and must sit the screening
+exercise fees are paid through the portal and the registry handles admission letters and transcripts
+""".split()
+
+
+class ServiceConfig:
+    """Behaviour of one stand-in: response latency, failures and a requests-per-second quota."""
+
+    def __init__(self, latency=0.3, jitter=0.3, error_rate=0.0, rate_limit=0.0, token_delay=0.01, answer_tokens=120):
+        self.latency = latency          # median seconds before the response (or first streamed chunk)
+        self.jitter = jitter            # log-normal spread around the median
+        self.error_rate = error_rate    # fraction of calls answered with a 503
+        self.rate_limit = rate_limit    # requests/s before 429s (0 = unlimited)
+        self.token_delay = token_delay  # seconds between streamed words
+        self.answer_tokens = answer_tokens
+
+    def delay(self, rng):
+        return self.latency * float(rng.lognormvariate(0, self.jitter)) if self.latency > 0 else 0.0
+
+    def update(self, spec):
+        # "latency=0.8,error_rate=0.05"
+        for item in filter(None, spec.split(",")):
+            name, value = item.split("=", 1)
+            if not hasattr(self, name):
+                raise ValueError(f"Unknown service setting '{name}'")
+            setattr(self, name, type(getattr(self, name))(value))
+        return self
+
+
+class TokenBucket:
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+
+class FakeServices:
+    """The shared state behind the HTTP handler: configs, quotas, call counts and stored rows."""
+
+    def __init__(self, configs=None, seed=0):
+        self.configs = {name: ServiceConfig() for name in SERVICES}
+        self.configs["supabase"] = ServiceConfig(latency=0.05)
+        self.configs.update(configs or {})
+        self.buckets = {name: TokenBucket(config.rate_limit) for name, config in self.configs.items() if config.rate_limit > 0}
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.rows = []
+        self.server = None
+
+    def count(self, service, endpoint, status):
+        with self.lock:
+            key = (service, endpoint, status)
+            self.calls[key] = self.calls.get(key, 0) + 1
+
+    def call_counts(self):
+        with self.lock:
+            return dict(self.calls)
+
+    def admit(self, service):
+        """None to serve the call, else the (status, error body) to fail it with."""
+        config = self.configs[service]
+        bucket = self.buckets.get(service)
+        if bucket is not None and not bucket.take():
+            return 429, {"error": {"code": 429, "message": "Resource has been exhausted (e.g. check quota).", "status": "RESOURCE_EXHAUSTED"}}
+        with self.lock:
+            failed = self.rng.random() < config.error_rate
+        if failed:
+            return 503, {"error": {"code": 503, "message": "The service is currently unavailable.", "status": "UNAVAILABLE"}}
+        return None
+
+    def text(self, words):
+        with self.lock:
+            return " ".join(self.rng.choice(WORDS) for _ in range(words))
+
+    def start(self, host="127.0.0.1", port=0):
+        handler = type("Handler", (FakeServiceHandler,), {"services": self})
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name="fake-services", daemon=True).start()
+        return self
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def environment(self):
+        """Environment variables that point the app's clients at these stand-ins."""
+        return {
+            "GEMINI_BASE_URL": f"{self.url}/gemini/",
+            "GOOGLE_API_KEY": "fake-key",
+            "GROQ_BASE_URL": f"{self.url}/groq",
+            "GROQ_API_KEY": "fake-key",
+            "RAGIE_BASE_URL": f"{self.url}/ragie",
+            "RAGIE_API_KEY": "fake-key",
+            "LLAMA_CLOUD_BASE_URL": f"{self.url}/llamacloud",
+            "LLMA_INDEX_API_KEY": "fake-key",
+            "LLMA_INDEX_ORG_ID": "fake-org",
+            "SUPABASE_URL": f"{self.url}/supabase",
+            "SUPABASE_KEY": "fake-key",
+        }
+
+
+class FakeServiceHandler(BaseHTTPRequestHandler):
+    services = None
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.dispatch("GET")
+
+    def do_POST(self):
+        self.dispatch("POST")
+
+    def do_PATCH(self):
+        self.dispatch("PATCH")
+
+    def dispatch(self, method):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        try:
+            body = json.loads(raw) if raw else {}
+        except ValueError:
+            body = {}
+
+        service, _, path = self.path.lstrip("/").partition("/")
+        route = ROUTES.get(service)
+        if route is None:
+            return self.reply(404, {"error": f"unknown service {service}"})
+
+        endpoint, handler = route(method, "/" + path.split("?", 1)[0])
+        # Quota rejections come back at once; everything else after the service's latency.
+        failure = self.services.admit(service)
+        if failure is None or failure[0] != 429:
+            time.sleep(self.services.configs[service].delay(random))
+        if failure is not None:
+            self.services.count(service, endpoint, failure[0])
+            return self.reply(failure[0], failure[1], headers={"Retry-After": "1"} if failure[0] == 429 else None)
+
+        self.services.count(service, endpoint, 200)
+        handler(self, self.services.configs[service], body)
+
+    def reply(self, status, payload, headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def stream(self, events, delay):
+        # Server-sent events, the way both Gemini (alt=sse) and Groq stream.
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for i, event in enumerate(events):
+            if i:
+                time.sleep(delay)
+            data = f"data: {event}\r\n\r\n".encode("utf-8")
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def answer_words(self, config):
+        return self.services.text(config.answer_tokens).split()
+
+
+# --- Gemini (generativelanguage v1beta) ---
+
+def _gemini_chunk(text, final=False):
+    chunk = {"candidates": [{"content": {"parts": [{"text": text}], "role": "model"}, "index": 0}]}
+    if final:
+        chunk["candidates"][0]["finishReason"] = "STOP"
+        chunk["usageMetadata"] = {"promptTokenCount": 0, "candidatesTokenCount": 0, "totalTokenCount": 0}
+    return chunk
+
+
+def gemini_generate(handler, config, body):
+    handler.reply(200, _gemini_chunk(" ".join(handler.answer_words(config)), final=True))
+
+
+def gemini_stream(handler, config, body):
+    words = handler.answer_words(config)
+    events = [json.dumps(_gemini_chunk(" ".join(words[i:i + 4]) + " ", final=i + 4 >= len(words))) for i in range(0, len(words), 4)]
+    handler.stream(events, config.token_delay * 4)
+
+
+def gemini_model(handler, config, body):
+    name = handler.path.split("?", 1)[0].rsplit("/", 1)[-1]
+    handler.reply(200, {
+        "name": f"models/{name}", "version": "001", "displayName": name,
+        "inputTokenLimit": 1048576, "outputTokenLimit": 8192,
+        "supportedGenerationMethods": ["generateContent", "countTokens", "createCachedContent"],
+    })
+
+
+def gemini_routes(method, path):
+    if path.endswith(":streamGenerateContent"):
+        return "streamGenerateContent", gemini_stream
+    if ":generateContent" in path:
+        return "generateContent", gemini_generate
+    if method == "GET" and re.search(r"/models/[^/:]+$", path):
+        return "models.get", gemini_model
+    return "other", lambda handler, config, body: handler.reply(200, {})
+
+
+# --- Groq (OpenAI-compatible chat completions) ---
+
+def groq_completion(handler, config, body):
+    words = handler.answer_words(config)
+    model = body.get("model", "groq/compound")
+    if not body.get("stream"):
+        return handler.reply(200, {
+            "id": "chatcmpl-fake", "object": "chat.completion", "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": " ".join(words)}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": len(words), "total_tokens": len(words)},
+        })
+
+    events = [
+        json.dumps({
+            "id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "delta": {"content": " ".join(words[i:i + 4]) + " "}, "finish_reason": None}],
+        })
+        for i in range(0, len(words), 4)
+    ]
+    handler.stream(events + ["[DONE]"], config.token_delay * 4)
+
+
+def groq_routes(method, path):
+    if path.endswith("/chat/completions"):
+        return "chat.completions", groq_completion
+    return "other", lambda handler, config, body: handler.reply(404, {"error": {"message": "not found"}})
+
+
+# --- Ragie retrievals ---
+
+def ragie_retrieve(handler, config, body):
+    chunks = [
+        {"id": f"chunk-{i}", "document_id": f"doc-{i % 7}", "document_name": f"page-{i % 7}.md",
+         "text": handler.services.text(200), "score": round(1 - i * 0.03, 3), "document_metadata": {}}
+        for i in range(int(body.get("top_k", 8)))
+    ]
+    handler.reply(200, {"scored_chunks": chunks})
+
+
+def ragie_routes(method, path):
+    return "retrievals", ragie_retrieve
+
+
+# --- LlamaCloud: project/pipeline lookup and pipeline retrieval ---
+
+PROJECT_ID = "00000000-0000-0000-0000-000000000001"
+PIPELINE_ID = "00000000-0000-0000-0000-000000000002"
+NOW = "2025-01-01T00:00:00Z"
+
+
+def llamacloud_projects(handler, config, body):
+    handler.reply(200, [{"id": PROJECT_ID, "name": "Default", "organization_id": "fake-org", "is_default": True, "created_at": NOW, "updated_at": NOW}])
+
+
+def llamacloud_pipelines(handler, config, body):
+    handler.reply(200, [{
+        "id": PIPELINE_ID, "name": "pti_data", "project_id": PROJECT_ID, "pipeline_type": "MANAGED",
+        "created_at": NOW, "updated_at": NOW,
+        "embedding_config": {"type": "OPENAI_EMBEDDING", "component": {}},
+        "transform_config": {"mode": "auto", "chunk_size": 1024, "chunk_overlap": 200},
+        "data_sink": None, "preset_retrieval_parameters": {},
+    }])
+
+
+def llamacloud_retrieve(handler, config, body):
+    top_k = int(body.get("dense_similarity_top_k") or 3)
+    nodes = [
+        {"node": {"id_": f"node-{i}", "text": handler.services.text(200), "metadata": {"url": f"https://pti.edu.ng/page-{i % 7}"}, "class_name": "TextNode"},
+         "score": round(1 - i * 0.03, 3), "class_name": "NodeWithScore"}
+        for i in range(top_k)
+    ]
+    handler.reply(200, {"pipeline_id": PIPELINE_ID, "retrieval_nodes": nodes, "image_nodes": [], "retrieval_latency": {}, "metadata": {}})
+
+
+def llamacloud_routes(method, path):
+    if path.endswith("/retrieve"):
+        return "pipelines.retrieve", llamacloud_retrieve
+    if "/pipelines" in path:
+        return "pipelines.list", llamacloud_pipelines
+    if "/projects" in path:
+        return "projects.list", llamacloud_projects
+    return "other", lambda handler, config, body: handler.reply(200, [])
+
+
+# --- Supabase (PostgREST chat_history table) ---
+
+def supabase_select(handler, config, body):
+    # Returning users get a short history; newest first, as load_history_page asks.
+    rows = [
+        {"id": i, "role": "user" if i % 2 else "assistant", "content": handler.services.text(30), "timestamp": NOW}
+        for i in range(8, 0, -1)
+    ]
+    handler.reply(200, rows)
+
+
+def supabase_insert(handler, config, body):
+    rows = body if isinstance(body, list) else [body]
+    with handler.services.lock:
+        handler.services.rows.extend(rows)
+    handler.reply(201, [])
+
+
+def supabase_routes(method, path):
+    if method == "GET":
+        return "select", supabase_select
+    return "insert", supabase_insert
+
+
+ROUTES = {
+    "gemini": gemini_routes,
+    "groq": groq_routes,
+    "ragie": ragie_routes,
+    "llamacloud": llamacloud_routes,
+    "supabase": supabase_routes,
+}
+
+
+def parse_service_specs(specs, defaults=None):
+    """["gemini:latency=0.8,error_rate=0.05", ...] -> {service: ServiceConfig}"""
+    configs = {}
+    for spec in specs or []:
+        service, _, settings = spec.partition(":")
+        if service not in SERVICES:
+            raise ValueError(f"Unknown service '{service}', expected one of {', '.join(SERVICES)}")
+        base = ServiceConfig(**(defaults or {})) if service != "supabase" else ServiceConfig(latency=0.05)
+        configs[service] = base.update(settings)
+    return configs
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--service", action="append", metavar="NAME:SETTINGS", help="e.g. gemini:latency=0.8,rate_limit=5")
+    args = parser.parse_args()
+
+    services = FakeServices(parse_service_specs(args.service)).start(port=args.port)
+    for name, value in services.environment().items():
+        print(f"{name}={value}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        services.stop()
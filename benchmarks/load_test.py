@@ -0,0 +1,267 @@
+"""
+Throughput and latency of the chat flow under concurrent users, with every
+external API replaced by a local stand-in (benchmarks/fake_services.py).
+
+    python -m benchmarks.load_test --backend groq --users 20
+    python -m benchmarks.load_test --backend llamaindex --users 50 --think-time 2 \\
+        --service gemini:latency=1.2,rate_limit=10 --service groq:error_rate=0.05
+
+Each simulated user is a thread, like a Streamlit session. It loads its chat
+history from (fake) Supabase, then plays a scripted conversation through the
+same steps as main.generate_response: intent router, answer cache, history
+compaction, the agent's response stream and the background history writer.
+Reported: p50/p95/p99 turn latency and time to first token, throughput, how
+turns were served, and the calls made to each upstream endpoint. --output
+writes the summary as JSON to compare runs.
+
+Client-side quotas (LLM_RATE_LIMITS) are lifted unless --client-quota is
+given, so the fake servers' own 429 behaviour is what gets exercised.
+"""
+import os
+import json
+import time
+import random
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from benchmarks.fake_services import FakeServices, ServiceConfig, parse_service_specs
+
+
+# Mixes small talk, questions, follow-ups and repeats, like real sessions.
+CONVERSATIONS = [
+    ["hi", "What are the admission requirements for ND?", "How much is the acceptance fee?", "thank you"],
+    ["Good morning", "Which departments are in the School of Engineering?", "Does PTI offer welding and fabrication?", "How long is the HND programme?", "bye"],
+    ["How do I check my admission status?", "What documents do I need for screening?", "okay thanks"],
+    ["What courses does PTI offer?", "Is there hostel accommodation for first year students?", "How do I pay my school fees?"],
+    ["hello, who are you?", "Where is PTI located?", "How can I contact the registry?", "thanks a lot"],
+    ["What is the cut off mark for petroleum engineering?", "When does the semester start?", "What about the fees for HND?", "great, bye"],
+]
+
+
+def percentiles(values):
+    if not values:
+        return {"p50": None, "p95": None, "p99": None}
+    return {f"p{q}": float(np.percentile(values, q)) for q in (50, 95, 99)}
+
+
+def configure(services, args):
+    """Point the app at the stand-ins; must run before the app's modules are imported."""
+    os.environ.update(services.environment())
+    os.environ["CHAT_BACKEND"] = args.backend
+    os.environ["RETRIEVAL_BACKEND"] = args.retrieval
+
+    from common import registry
+    if not args.client_quota:
+        for model in {*registry.LLM_RATE_LIMITS, registry.CAG_MODEL, registry.LLM_FALLBACK_MODEL}:
+            registry.LLM_RATE_LIMITS[model] = (1_000_000, 10**12)
+
+
+def chat_turn(prompt, history, history_key, use_answer_cache=True):
+    """One message through the steps of main.generate_response, timed."""
+    from common.registry import get_registry
+    from common.backends import create_agent, route
+
+    registry = get_registry()
+    start = time.perf_counter()
+    turn = {"served_by": "agent", "ttft": None, "timings": {}, "error": False}
+
+    # As in main.py: follow-ups bypass the answer cache, and load-test users are logged in.
+    use_answer_cache = use_answer_cache and len(history) <= 1
+    scope = f"user:{history_key}"
+
+    intent, response = route(prompt)
+    if response is not None:
+        turn["served_by"] = f"intent:{intent}"
+    elif use_answer_cache and (response := registry.answer_cache().lookup(prompt, scope=scope)) is not None:
+        turn["served_by"] = "answer_cache"
+    else:
+        compacted = registry.history_manager().compact(history_key, history)
+        agent = create_agent(prompt, compacted, stream=True)
+        chunks = []
+        for chunk in agent.rag_response_stream:
+            if not chunks:
+                turn["ttft"] = time.perf_counter() - start
+            chunks.append(chunk)
+        response = "".join(chunks)
+        turn["timings"] = dict(agent.timings)
+        turn["error"] = agent.failed
+        if use_answer_cache and not agent.failed:
+            registry.answer_cache().store(prompt, response, scope=scope)
+        if not agent.failed:
+            registry.history_manager().update_summary(history_key, [*history, {"role": "assistant", "content": response}])
+
+    turn["latency"] = time.perf_counter() - start
+    if turn["ttft"] is None:
+        turn["ttft"] = turn["latency"]
+    return turn, response
+
+
+def simulate_user(index, args, supabase, results, lock):
+    from common.registry import get_registry
+    from common.chat_store import load_history_page
+
+    rng = random.Random(args.seed + index)
+    user_id = f"load-user-{index}"
+    time.sleep(rng.uniform(0, args.ramp_up))
+
+    start = time.perf_counter()
+    messages, _ = load_history_page(supabase, user_id)
+    with lock:
+        results["history_load"].append(time.perf_counter() - start)
+
+    for prompt in rng.choice(CONVERSATIONS)[:args.turns]:
+        messages.append({"role": "user", "content": prompt})
+        try:
+            turn, response = chat_turn(prompt, messages, user_id, use_answer_cache=not args.no_answer_cache)
+        except Exception as e:
+            turn, response = {"served_by": "exception", "latency": None, "ttft": None, "error": True, "exception": repr(e)}, None
+
+        with lock:
+            results["turns"].append(turn)
+
+        if response is not None and not turn["error"]:
+            messages.append({"role": "assistant", "content": response})
+            timestamp = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+            get_registry().chat_writer(supabase).save([
+                {"user_id": user_id, "role": "user", "content": prompt, "timestamp": timestamp},
+                {"user_id": user_id, "role": "assistant", "content": response, "timestamp": timestamp},
+            ])
+
+        if args.think_time:
+            time.sleep(rng.expovariate(1 / args.think_time))
+
+
+def summarize(args, results, wall, services, warm_up):
+    from common.registry import get_registry
+
+    turns = results["turns"]
+    agent_turns = [turn for turn in turns if turn["served_by"] == "agent"]
+    served = {}
+    for turn in turns:
+        served[turn["served_by"]] = served.get(turn["served_by"], 0) + 1
+
+    stages = {}
+    for turn in agent_turns:
+        for stage, seconds in turn["timings"].items():
+            if isinstance(seconds, float):
+                stages.setdefault(stage, []).append(seconds)
+
+    registry = get_registry()
+    writer = registry.chat_writer(None) if "chat_writer" in registry.loaded() else None
+    if writer is not None:
+        writer.close()
+
+    summary = {
+        "backend": args.backend,
+        "retrieval": args.retrieval,
+        "users": args.users,
+        "turns": len(turns),
+        "wall_s": wall,
+        "warm_up_s": warm_up,
+        "throughput_turns_per_s": len(turns) / wall if wall else None,
+        "served_by": served,
+        "errors": sum(1 for turn in turns if turn["error"]),
+        "latency_s": percentiles([turn["latency"] for turn in turns if turn["latency"] is not None]),
+        "agent_latency_s": percentiles([turn["latency"] for turn in agent_turns]),
+        "ttft_s": percentiles([turn["ttft"] for turn in agent_turns]),
+        "stages_s": {stage: percentiles(values) for stage, values in stages.items()},
+        "history_load_s": percentiles(results["history_load"]),
+        "history_rows_written": writer.written if writer else 0,
+        "history_rows_journaled": writer.journaled if writer else 0,
+        "upstream_calls": [
+            {"service": service, "endpoint": endpoint, "status": status, "calls": count}
+            for (service, endpoint, status), count in sorted(services.call_counts().items())
+        ],
+        "exceptions": sorted({turn["exception"] for turn in turns if "exception" in turn})[:5],
+    }
+    # Every router used in the run, e.g. the Groq backend's and the history summariser's.
+    summary["routers"] = {
+        name: {key: metrics[key] for key in ("requests", "hedges", "hedge_wins", "failovers", "exhausted", "coalesced")}
+        for name, metrics in registry.stats().items() if name.startswith("llm_router")
+    }
+    return summary
+
+
+def print_summary(summary):
+    def row(name, values):
+        cells = "".join(f"{values[key]:>10.3f}" if values[key] is not None else f"{'-':>10}" for key in ("p50", "p95", "p99"))
+        print(f"  {name:<22}{cells}")
+
+    print(f"\n{summary['backend']} ({summary['retrieval']} retrieval), {summary['users']} users: "
+          f"{summary['turns']} turns in {summary['wall_s']:.1f}s = {summary['throughput_turns_per_s']:.2f} turns/s "
+          f"(warm-up {summary['warm_up_s']:.1f}s)")
+    print(f"  served by: {', '.join(f'{name} {count}' for name, count in sorted(summary['served_by'].items()))}; errors {summary['errors']}")
+    print(f"  {'seconds':<22}{'p50':>10}{'p95':>10}{'p99':>10}")
+    row("turn latency", summary["latency_s"])
+    row("agent turn latency", summary["agent_latency_s"])
+    row("time to first token", summary["ttft_s"])
+    for stage, values in sorted(summary["stages_s"].items()):
+        row(f"  stage {stage}", values)
+    row("history load", summary["history_load_s"])
+    print(f"  history rows written {summary['history_rows_written']}, journaled {summary['history_rows_journaled']}")
+    for name, router in summary["routers"].items():
+        print(f"  {name}: " + ", ".join(f"{key} {value}" for key, value in router.items()))
+
+    print("\n  upstream calls")
+    for call in summary["upstream_calls"]:
+        print(f"  {call['service']:<12}{call['endpoint']:<24}{call['status']:>5}{call['calls']:>8}")
+    for exception in summary["exceptions"]:
+        print(f"  exception: {exception}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", default="llamaindex", choices=["llamaindex", "groq", "lightrag", "cag"])
+    parser.add_argument("--retrieval", default="llamacloud", choices=["llamacloud", "local"], help="RETRIEVAL_BACKEND for the run")
+    parser.add_argument("--users", type=int, default=10, help="concurrent simulated users")
+    parser.add_argument("--turns", type=int, default=6, help="max turns per conversation")
+    parser.add_argument("--think-time", type=float, default=0.0, help="mean seconds between a user's turns")
+    parser.add_argument("--ramp-up", type=float, default=1.0, help="users start at random within this many seconds")
+    parser.add_argument("--latency", type=float, default=0.4, help="default median latency of the fake APIs")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="default fraction of 503s")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="default requests/s before 429s (0 = none)")
+    parser.add_argument("--service", action="append", metavar="NAME:SETTINGS",
+                        help="per-service override, e.g. gemini:latency=1.2,error_rate=0.05,rate_limit=10")
+    parser.add_argument("--client-quota", action="store_true", help="keep the client-side LLM_RATE_LIMITS")
+    parser.add_argument("--no-answer-cache", action="store_true", help="skip the semantic answer cache")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the summary as JSON to this file")
+    args = parser.parse_args()
+
+    defaults = {"latency": args.latency, "error_rate": args.error_rate, "rate_limit": args.rate_limit}
+    configs = {name: ServiceConfig(**defaults) for name in ("gemini", "groq", "ragie", "llamacloud")}
+    configs.update(parse_service_specs(args.service, defaults))
+    services = FakeServices(configs, seed=args.seed).start()
+    configure(services, args)
+
+    from supabase import create_client
+    from common.registry import get_registry
+    from common.backends import warm_up_names
+
+    supabase = create_client(os.environ["SUPABASE_URL"], os.environ["SUPABASE_KEY"])
+
+    start = time.perf_counter()
+    get_registry().warm_up(warm_up_names())
+    warm_up = time.perf_counter() - start
+
+    results = {"turns": [], "history_load": []}
+    lock = threading.Lock()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.users) as pool:
+        for future in [pool.submit(simulate_user, i, args, supabase, results, lock) for i in range(args.users)]:
+            future.result()
+    wall = time.perf_counter() - start
+
+    summary = summarize(args, results, wall, services, warm_up)
+    print_summary(summary)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+    services.stop()
+
+
+if __name__ == "__main__":
+    main()
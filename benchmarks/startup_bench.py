@@ -0,0 +1,86 @@
+"""
+Startup cost per chat backend.
+
+Each backend is measured in a fresh interpreter so module caches from one
+backend do not hide the cost of another:
+
+    python -m benchmarks.startup_bench
+    python -m benchmarks.startup_bench --backends llamaindex groq --first-request "What is PTI?"
+
+Reported per backend: time to import its agent module, time to warm up the
+registry resources it needs, and (with --first-request, which calls the real
+services) the time of the first answer.
+"""
+import sys
+import json
+import argparse
+import subprocess
+
+
+PROBE = r"""
+import sys, json, time
+backend, prompt = sys.argv[1], sys.argv[2]
+result = {"backend": backend}
+
+start = time.perf_counter()
+from common.backends import get_agent_class, warm_up_names
+agent_class = get_agent_class(backend)
+result["import_s"] = time.perf_counter() - start
+result["modules_loaded"] = len(sys.modules)
+
+if prompt:
+    from common.registry import get_registry
+    start = time.perf_counter()
+    get_registry().warm_up(warm_up_names(backend))
+    result["warm_up_s"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    agent = agent_class(prompt, [])
+    result["first_request_s"] = time.perf_counter() - start
+    result["stage_timings"] = agent.timings
+
+print(json.dumps(result))
+"""
+
+
+def run_backend(backend, prompt=""):
+    completed = subprocess.run(
+        [sys.executable, "-c", PROBE, backend, prompt],
+        capture_output=True,
+        text=True,
+    )
+    if completed.returncode != 0:
+        return {"backend": backend, "error": completed.stderr.strip().splitlines()[-1:]}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main():
+    from common.backends import BACKENDS
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=list(BACKENDS))
+    parser.add_argument("--first-request", default="", metavar="PROMPT",
+                        help="also warm up and answer PROMPT (uses the real APIs)")
+    args = parser.parse_args()
+
+    print(f"{'backend':<12}{'import':>10}{'modules':>10}{'warm-up':>10}{'first req':>11}")
+    for backend in args.backends:
+        result = run_backend(backend, args.first_request)
+        if "error" in result:
+            print(f"{backend:<12}  failed: {result['error']}")
+            continue
+        print(
+            f"{backend:<12}"
+            f"{result['import_s']:>9.2f}s"
+            f"{result['modules_loaded']:>10}"
+            f"{_seconds(result.get('warm_up_s')):>10}"
+            f"{_seconds(result.get('first_request_s')):>11}"
+        )
+
+
+def _seconds(value):
+    return "-" if value is None else f"{value:.2f}s"
+
+
+if __name__ == "__main__":
+    main()
@@ -1,36 +1,115 @@
-import os
-from firecrawl import FirecrawlApp
-from google import genai
-from google.genai import types
-import pathlib
-import httpx
 import json
+import time
+import asyncio
 from dotenv import load_dotenv
+from common.registry import get_registry, RETRIEVAL_BACKEND, RERANKER, RERANK_CANDIDATES, CAG_MODEL
+from common.history import estimate_tokens
+from common.event_loop import run
+from common.telemetry import get_telemetry
+from ingestion.stream_ingest import corpus_path
 
 # Load environment variables from .env file
 load_dotenv()
 
+# Cached together with the corpus, so queries only send the question.
+CAG_SYSTEM_INSTRUCTION = """
+You are a chatbot that provides information only about PTI (Petroluem Training Institute) School Nigeria.
+Answer from the PTI website pages provided. If a user asks something unrelated, politely refuse.
+"""
+
 
 class CagAgent:
 
-    def __init__(self, prompt):
+    def __init__(self, prompt=None, conversation_history=[], stream=False):
         self.prompt = prompt
+        self.timings = {}
+        self.cag_response = None
+        self.rag_response = None
+        self.rag_response_stream = None
+        # Set when the reply is an error message, so it is not cached or saved.
+        self.failed = False
 
-        google_api_key = os.getenv('GOOGLE_API_KEY')
-        firecrawl_api_key = os.getenv('FIRECRAWL_API_KEY')
-
-        print(google_api_key) 
+        self.client = get_registry().genai_client()
 
-        self.client = genai.Client(api_key=google_api_key)
+        # Without a prompt the agent is only set up; call `await agent.answer(...)`.
+        if prompt is None:
+            return
 
-        self.fire = FirecrawlApp(api_key=firecrawl_api_key)
-
-        all_markdowns = self.get_markdown_from_file()
+        try:
+            run(self.answer(prompt, conversation_history))
+        except Exception as e:
+            get_telemetry().log("agent_error", backend="cag", error=e)
+            self.failed = True
+            self.rag_response = "An unexpected error occurred. please try again later ☹️!"
 
-        formatted_prompt = self.create_prompt(prompt)
+        # Same interface as the other chat agents.
+        self.rag_response_stream = iter([self.rag_response]) if stream else None
 
-        # self.cag_response = self.cag_response_call(all_markdowns, formatted_prompt)
-        self.cag_response = self.cag_response_call('go to https://pti.edu.ng', formatted_prompt)
+    async def answer(self, prompt, conversation_history=[]):
+        self.prompt = prompt
+        start = time.perf_counter()
+
+        # The whole corpus lives in a Gemini context cache; only the question is sent.
+        context_cache = get_registry().cag_context_cache()
+        cache_name = await context_cache.name()
+        telemetry = get_telemetry()
+        if cache_name is not None:
+            try:
+                with telemetry.span("generate", backend="cag", context="cache"):
+                    self.cag_response = await self.acached_response_call(cache_name, prompt)
+                self.timings["context"] = "cache"
+            except Exception as e:
+                telemetry.log("cag_cache_fallback", backend="cag", error=e)
+                telemetry.count("retries_total", kind="cag_cache_fallback")
+                context_cache.invalidate()
+
+        # Without the cache, send only the pages relevant to the question.
+        if self.cag_response is None:
+            with telemetry.span("retrieve", backend="cag"):
+                context = await self.aretrieve_context(prompt)
+            with telemetry.span("generate", backend="cag", context="retrieval"):
+                self.cag_response = await self.acag_response_call(context, self.create_prompt(prompt))
+            self.timings["context"] = "retrieval"
+
+        self.timings["generate"] = time.perf_counter() - start
+        self.rag_response = self.cag_response
+        return self.rag_response
+
+    async def acached_response_call(self, cache_name, prompt):
+        from google.genai import types
+
+        await get_registry().rate_limiter().acquire(CAG_MODEL, estimate_tokens(prompt) + 500)
+        response = await self.client.aio.models.generate_content(
+            model=CAG_MODEL,
+            contents=[prompt],
+            config=types.GenerateContentConfig(cached_content=cache_name, max_output_tokens=500, temperature=0.1),
+        )
+        get_telemetry().count("llm_tokens_total", estimate_tokens(prompt), provider=f"gemini:{CAG_MODEL}", direction="in")
+        get_telemetry().count("llm_tokens_total", estimate_tokens(response.text or ""), provider=f"gemini:{CAG_MODEL}", direction="out")
+        return response.text
+
+    async def aretrieve_context(self, query, top_k=8):
+        if RETRIEVAL_BACKEND == "local":
+            from retrieval.hybrid_retriever import format_chunks
+            candidates = max(top_k, RERANK_CANDIDATES) if RERANKER == "local" else top_k
+            chunks = await asyncio.to_thread(get_registry().local_retriever().retrieve, query, candidates)
+            if RERANKER == "local":
+                chunks = await asyncio.to_thread(self.rerank, query, chunks, top_k, lambda chunk: chunk["text"])
+            return format_chunks(chunks)
+
+        nodes = await get_registry().llama_retriever().aretrieve(query)
+        if RERANKER == "local":
+            nodes = await asyncio.to_thread(self.rerank, query, nodes, top_k, lambda node: node.get_content())
+        return "\n\n".join(node.get_content() for node in nodes)
+
+    def rerank(self, query, candidates, top_k, text):
+        with get_telemetry().span("rerank", backend="cag"):
+            return [candidate for candidate, _ in get_registry().reranker().rerank(query, candidates, top_k, text=text)]
+
+    @property
+    def fire(self):
+        # Only the scraper needs Firecrawl.
+        return get_registry().firecrawl()
 
     def get_markdown_from_urls(self, urls: list[str]):
         url = "https://pti.edu.ng"
@@ -54,24 +133,27 @@ class CagAgent:
         with open(filename, "w", encoding="utf-8") as file:
             json.dump(markdowns, file, indent=4, ensure_ascii=False)
 
-    def get_markdown_from_file(self, filename="data/pti_markdown_results_all.json"):
-        with open(filename, "r", encoding="utf-8") as file:
+    def get_markdown_from_file(self, filename=None):
+        # The cleaned corpus (python -m ingestion.preprocess) when it exists: far fewer tokens per prompt.
+        with open(filename or corpus_path(), "r", encoding="utf-8") as file:
             data = json.load(file)
         
         markdowns = [item['markdown'] for item in data]
         return markdowns
 
     def cag_response_call(self, all_markdowns, prompt):
+        # Sync callers share the async path, so they count against the same quota.
+        return run(self.acag_response_call(all_markdowns, prompt))
+    
+    async def acag_response_call(self, all_markdowns, prompt):
         try:
-            print("Fetching response")
-            response = self.client.models.generate_content(
-                model="gemini-1.5-flash-8b",
-                contents=[json.dumps(all_markdowns), prompt])
-            
-            return(response.text)
+            context = all_markdowns if isinstance(all_markdowns, str) else json.dumps(all_markdowns)
+            router = get_registry().llm_router("gemini-1.5-flash-8b", max_output_tokens=None)
+            return await router.generate(f"{context}\n\n{prompt}")
 
         except Exception as e:
-            return(f'An exception occurred: {e.message}')
+            self.failed = True
+            return(f'An exception occurred: {getattr(e, "message", e)}')
     
     def create_prompt(self, user_input):
         prompt = f"""
@@ -0,0 +1,184 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import datetime
+
+from common.history import estimate_tokens
+from common.telemetry import get_telemetry
+from ingestion.stream_ingest import iter_pages, corpus_path
+
+
+CACHE_STATE_PATH = os.path.abspath('./data/cag_cache.json')
+
+
+def build_corpus_text(filename=None, max_tokens=900_000):
+    """
+    The corpus as one cacheable document: every page as `url:` + markdown,
+    from the cleaned corpus when it exists, cut off at `max_tokens`.
+    Returns (text, estimated tokens, pages included).
+    """
+    parts = []
+    used = 0
+    for url, markdown in iter_pages(filename):
+        page = f"url: {url}\n{markdown}"
+        tokens = estimate_tokens(page)
+        if used + tokens > max_tokens:
+            break
+        parts.append(page)
+        used += tokens
+    return "\n\n---\n\n".join(parts), used, len(parts)
+
+
+class CorpusContextCache:
+    """
+    Keeps the corpus registered as a Gemini cached content so each CAG query
+    only sends the question and references the cache by name.
+
+    The cache is created on first use (and whenever the corpus changes),
+    its TTL is extended when a query finds it close to expiry, and its name is
+    saved in `state_path` so a restart reuses the live cache instead of
+    uploading the corpus again. When creation fails the cache is reported
+    unavailable for `retry_after` seconds and callers fall back to retrieval.
+    `on_change()` is called when the corpus changes under a running app.
+    """
+
+    def __init__(self, client, model, system_instruction, ttl=3600, refresh_margin=600, retry_after=600, max_tokens=900_000, state_path=CACHE_STATE_PATH, on_change=None):
+        self.client = client
+        self.model = model
+        self.system_instruction = system_instruction
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        self.retry_after = retry_after
+        self.max_tokens = max_tokens
+        self.state_path = state_path
+        self.on_change = on_change
+
+        self._state = self._load_state()
+        self._corpus = None
+        self._lock = asyncio.Lock()
+        self._unavailable_until = 0.0
+
+        self.hits = 0
+        self.refreshes = 0
+        self.creations = 0
+        self.failures = 0
+
+    async def name(self):
+        """The cached content name to reference, or None when the cache is unavailable."""
+        if time.monotonic() < self._unavailable_until:
+            return None
+
+        # One coroutine creates or refreshes; the others wait and reuse its result.
+        async with self._lock:
+            try:
+                return await self._ensure()
+            except Exception as e:
+                get_telemetry().log("context_cache_unavailable", model=self.model, error=e)
+                self.failures += 1
+                self._unavailable_until = time.monotonic() + self.retry_after
+                return None
+
+    async def _ensure(self):
+        from google.genai import types
+
+        text, tokens, pages, digest = await self._corpus_text()
+        state = self._state
+
+        if state and state["digest"] == digest:
+            remaining = state["expires_at"] - time.time()
+            if remaining > self.refresh_margin:
+                self.hits += 1
+                return state["name"]
+            if remaining > 0:
+                try:
+                    cache = await self.client.aio.caches.update(
+                        name=state["name"],
+                        config=types.UpdateCachedContentConfig(ttl=f"{self.ttl}s"),
+                    )
+                    self.refreshes += 1
+                    self._save_state({**state, "expires_at": _expires_at(cache, self.ttl)})
+                    return state["name"]
+                except Exception as e:
+                    get_telemetry().log("context_cache_refresh_failed", name=state["name"], error=e)
+
+        if state:
+            # Corpus changed or cache expired: drop the old one (storage is billed per hour).
+            try:
+                await self.client.aio.caches.delete(name=state["name"])
+            except Exception:
+                pass
+
+        cache = await self.client.aio.caches.create(
+            model=self.model,
+            config=types.CreateCachedContentConfig(
+                display_name="pti-cag-corpus",
+                system_instruction=self.system_instruction,
+                contents=[text],
+                ttl=f"{self.ttl}s",
+            ),
+        )
+        self.creations += 1
+        usage = getattr(cache, "usage_metadata", None)
+        self._save_state({
+            "name": cache.name,
+            "model": self.model,
+            "digest": digest,
+            "pages": pages,
+            "tokens": getattr(usage, "total_token_count", None) or tokens,
+            "expires_at": _expires_at(cache, self.ttl),
+        })
+        get_telemetry().log("context_cache_created", name=cache.name, pages=pages, tokens=tokens)
+        return cache.name
+
+    def invalidate(self):
+        """Forget the cache (e.g. a query found it deleted); the next query creates a new one."""
+        self._state = None
+
+    async def _corpus_text(self):
+        # Rebuilt only when the corpus file changes, not on every query.
+        path = corpus_path()
+        version = (path, os.path.getmtime(path))
+        if self._corpus is None or self._corpus[0] != version:
+            text, tokens, pages = await asyncio.to_thread(build_corpus_text, path, self.max_tokens)
+            digest = hashlib.sha256(f"{self.model}\0{self.system_instruction}\0{text}".encode("utf-8")).hexdigest()
+            changed = self._corpus is not None and self._corpus[1][3] != digest
+            self._corpus = (version, (text, tokens, pages, digest))
+            if changed and self.on_change is not None:
+                self.on_change()
+        return self._corpus[1]
+
+    def stats(self):
+        state = self._state or {}
+        return {
+            "name": state.get("name"),
+            "tokens": state.get("tokens"),
+            "hits": self.hits,
+            "refreshes": self.refreshes,
+            "creations": self.creations,
+            "failures": self.failures,
+        }
+
+    def _load_state(self):
+        if not os.path.exists(self.state_path):
+            return None
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as file:
+                state = json.load(file)
+        except (OSError, json.JSONDecodeError):
+            return None
+        return state if state.get("model") == self.model else None
+
+    def _save_state(self, state):
+        self._state = state
+        with open(self.state_path + ".tmp", "w", encoding="utf-8") as file:
+            json.dump(state, file)
+        os.replace(self.state_path + ".tmp", self.state_path)
+
+
+def _expires_at(cache, ttl):
+    expire_time = getattr(cache, "expire_time", None)
+    if isinstance(expire_time, datetime.datetime):
+        return expire_time.timestamp()
+    return time.time() + ttl
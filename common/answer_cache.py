@@ -0,0 +1,149 @@
+import re
+import time
+import threading
+import numpy as np
+
+
+def normalize_query(text):
+    """Lower-case, strip punctuation and collapse whitespace so trivial variants share a key."""
+    text = re.sub(r"[^\w\s]", " ", str(text).lower())
+    return " ".join(text.split())
+
+
+class SemanticAnswerCache:
+    """
+    Answer cache keyed on query embeddings.
+
+    Prompts are embedded and compared (cosine similarity) against the prompts of
+    previous answers held in a fixed-size float32 matrix; the closest one above
+    `threshold` is a hit. Entries expire after `ttl` seconds and the least
+    recently used entry is evicted once `max_entries` is reached.
+
+    Every entry belongs to a `scope`: a lookup only matches entries stored
+    under the same scope, so answers built for one user (None is the shared,
+    public scope) are never served to another.
+    """
+
+    def __init__(self, embed, dim=384, threshold=0.92, ttl=24 * 3600, max_entries=512):
+        self._embed = embed
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        self._lock = threading.Lock()
+        self._vectors = np.zeros((max_entries, dim), dtype=np.float32)
+        self._valid = np.zeros(max_entries, dtype=bool)
+        self._created = np.zeros(max_entries, dtype=np.float64)
+        self._last_used = np.zeros(max_entries, dtype=np.float64)
+        self._scopes = np.full(max_entries, -1, dtype=np.int32)
+        self._scope_ids = {}
+        self._answers = [None] * max_entries
+        self._keys = [None] * max_entries
+        self._slots = {}
+        # lookup() followed by store() for the same prompt embeds only once.
+        self._last_embedded = (None, None)
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def embed(self, query):
+        key = normalize_query(query)
+        last_key, last_vector = self._last_embedded
+        if key == last_key:
+            return last_vector
+
+        vector = np.asarray(self._embed(key), dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vector)
+        vector = vector / norm if norm else vector
+        self._last_embedded = (key, vector)
+        return vector
+
+    def lookup(self, query, vector=None, scope=None):
+        """Return the cached answer for `query` or a near-duplicate of it in `scope`, else None."""
+        now = time.time()
+        key = (scope, normalize_query(query))
+
+        with self._lock:
+            self._expire(now)
+            slot = self._slots.get(key)
+            scope_id = self._scope_ids.get(scope)
+
+        # Exact (normalized) repeats skip the embedding entirely.
+        if slot is None and scope_id is not None and self._valid.any():
+            if vector is None:
+                vector = self.embed(query)
+            with self._lock:
+                scores = self._vectors @ vector
+                scores[~self._valid | (self._scopes != scope_id)] = -np.inf
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    slot = best
+
+        with self._lock:
+            if slot is None or not self._valid[slot]:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._last_used[slot] = now
+            return self._answers[slot]
+
+    def store(self, query, answer, vector=None, scope=None):
+        key = (scope, normalize_query(query))
+        if vector is None:
+            vector = self.embed(query)
+        now = time.time()
+
+        with self._lock:
+            slot = self._slots.get(key)
+            if slot is None:
+                slot = self._free_slot()
+            self._vectors[slot] = vector
+            self._scopes[slot] = self._scope_ids.setdefault(scope, len(self._scope_ids))
+            self._valid[slot] = True
+            self._created[slot] = now
+            self._last_used[slot] = now
+            self._answers[slot] = answer
+            self._keys[slot] = key
+            self._slots[key] = slot
+
+    def invalidate(self):
+        """Drop every entry, e.g. after the underlying index has been rebuilt."""
+        with self._lock:
+            self._valid[:] = False
+            self._scopes[:] = -1
+            self._scope_ids.clear()
+            self._answers = [None] * self.max_entries
+            self._keys = [None] * self.max_entries
+            self._slots.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": int(self._valid.sum()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+    def _free_slot(self):
+        free = np.flatnonzero(~self._valid)
+        if len(free):
+            return int(free[0])
+        slot = int(np.argmin(self._last_used))
+        self._release(slot)
+        self.evictions += 1
+        return slot
+
+    def _expire(self, now):
+        expired = np.flatnonzero(self._valid & (now - self._created > self.ttl))
+        for slot in expired:
+            self._release(int(slot))
+
+    def _release(self, slot):
+        self._valid[slot] = False
+        self._slots.pop(self._keys[slot], None)
+        self._answers[slot] = None
+        self._keys[slot] = None
@@ -0,0 +1,66 @@
+import os
+import importlib
+from dotenv import load_dotenv
+from common.registry import get_registry, RETRIEVAL_BACKEND, RERANKER, INTENT_ROUTER
+
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Which agent answers chat messages: llamaindex, groq, lightrag or cag.
+CHAT_BACKEND = os.getenv('CHAT_BACKEND', 'llamaindex')
+
+# backend -> (module, agent class). Modules are only imported when selected,
+# so a deployment never pays for the libraries of backends it does not use.
+BACKENDS = {
+    "llamaindex": ("llmaindex.llma_index_agent", "LmmaIndexAgent"),
+    "groq": ("groq_inference.groq_agent", "GroqAgent"),
+    "lightrag": ("rag.rag_agent_func", "LightRagAgent"),
+    "cag": ("cag.cag_agent", "CagAgent"),
+}
+
+# Registry resources each backend needs before its first message.
+_retriever = "local_retriever" if RETRIEVAL_BACKEND == "local" else "llama_retriever"
+_reranker = ("reranker",) if RERANKER == "local" else ()
+WARM_UP = {
+    "llamaindex": ("genai_client", _retriever, "embedding_service") + _reranker,
+    "groq": ("async_groq_client", "embedding_service") + (("local_retriever",) if RETRIEVAL_BACKEND == "local" else ()) + _reranker,
+    "lightrag": ("genai_client", "embedding_service", "lightrag"),
+    "cag": ("genai_client", "embedding_service"),
+}
+
+
+def get_agent_class(backend=None):
+    backend = backend or CHAT_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown chat backend '{backend}', expected one of {', '.join(BACKENDS)}")
+
+    module_name, class_name = BACKENDS[backend]
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def create_agent(prompt, conversation_history=[], stream=False, backend=None):
+    return get_agent_class(backend)(prompt, conversation_history, stream=stream)
+
+
+def route(prompt):
+    """(intent, answer) from the intent router; answer is None when the agents should handle it."""
+    if INTENT_ROUTER == "off":
+        return "info", None
+    return get_registry().intent_router().route(prompt)
+
+
+async def answer(prompt, conversation_history=[], backend=None, routed=True):
+    """Async entry point: answer `prompt` with the configured backend."""
+    if routed:
+        intent, reply = route(prompt)
+        if reply is not None:
+            return reply
+
+    agent = get_agent_class(backend)()
+    return await agent.answer(prompt, conversation_history)
+
+
+def warm_up_names(backend=None):
+    names = WARM_UP[backend or CHAT_BACKEND]
+    return names + ("intent_router",) if INTENT_ROUTER != "off" else names
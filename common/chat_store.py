@@ -0,0 +1,182 @@
+import os
+import json
+import time
+import queue
+import atexit
+import sqlite3
+import threading
+from dotenv import load_dotenv
+from common.telemetry import get_telemetry
+
+
+# Load environment variables from .env file
+load_dotenv()
+
+CHAT_HISTORY_TABLE = "chat_history"
+HISTORY_PAGE_SIZE = int(os.getenv('HISTORY_PAGE_SIZE', '40'))
+# Rows that could not be written to Supabase wait here until it is reachable again.
+JOURNAL_PATH = os.path.abspath('./data/chat_history_journal.sqlite3')
+
+
+def load_history_page(supabase, user_id, before=None, page_size=HISTORY_PAGE_SIZE):
+    """
+    Fetch one page of a user's chat history, newest page first.
+
+    Rows are read newest-first on (timestamp, id), which the
+    (user_id, timestamp, id) index in db.sql serves directly, and `before` is
+    the cursor returned for the previous page. A user message and its answer
+    share a timestamp, so the id breaks ties. Returns
+    (messages oldest-first as {"role", "content"}, cursor for the next older
+    page or None when there is nothing older).
+    """
+    query = (
+        supabase.table(CHAT_HISTORY_TABLE)
+        .select("id, role, content, timestamp")
+        .eq("user_id", user_id)
+    )
+    if before is not None:
+        timestamp, row_id = before
+        query = query.or_(f'timestamp.lt."{timestamp}",and(timestamp.eq."{timestamp}",id.lt.{row_id})')
+
+    # One extra row tells us whether an older page exists.
+    query = query.order("timestamp", desc=True).order("id", desc=True).limit(page_size + 1)
+    # Executed directly: execute_query(ttl=0) does not cache either, and this
+    # way it also works outside a Streamlit script (benchmarks/load_test.py).
+    rows = query.execute().data or []
+
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    cursor = (rows[-1]["timestamp"], rows[-1]["id"]) if has_more else None
+
+    messages = [{"role": row["role"], "content": row["content"]} for row in reversed(rows)]
+    return messages, cursor
+
+
+class ChatHistoryWriter:
+    """
+    Write-behind persistence for chat_history rows.
+
+    `save()` only enqueues, so the chat response never waits on Supabase. A
+    background thread inserts queued rows in batches (across all sessions),
+    retries failures with exponential backoff, and spills rows it still cannot
+    write to a local SQLite journal that is replayed once the database is
+    reachable again. Pending rows are flushed at interpreter exit.
+    """
+
+    def __init__(self, connection, journal_path=JOURNAL_PATH, batch_size=50, flush_interval=1.0, max_retries=3, backoff=0.5, replay_interval=30.0):
+        self._connection = connection
+        self.journal_path = journal_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.replay_interval = replay_interval
+        self._next_replay = 0.0
+
+        self.written = 0
+        self.journaled = 0
+        self.replayed = 0
+        self.failed_inserts = 0
+        # Rows waiting in the journal; counted when the writer thread opens it.
+        self.journal_pending = 0
+
+        self._queue = queue.Queue()
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="chat-history-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def save(self, rows):
+        self._queue.put(list(rows))
+
+    def stats(self):
+        return {
+            "queued_batches": self._queue.qsize(),
+            "written": self.written,
+            "journaled": self.journaled,
+            "replayed": self.replayed,
+            "journal_pending": self.journal_pending,
+            "failed_inserts": self.failed_inserts,
+        }
+
+    def close(self, timeout=10):
+        """Stop accepting work and flush whatever is queued."""
+        if not self._closed.is_set():
+            self._closed.set()
+            self._thread.join(timeout)
+
+    def _run(self):
+        # SQLite connections must stay on the thread that created them.
+        journal = sqlite3.connect(self.journal_path)
+        journal.execute("create table if not exists pending (id integer primary key autoincrement, row text not null)")
+        journal.commit()
+        self.journal_pending = journal.execute("select count(*) from pending").fetchone()[0]
+
+        while True:
+            rows = self._next_batch()
+            if rows:
+                if self._insert(rows):
+                    self._replay_journal(journal)
+                else:
+                    self._spill(journal, rows)
+            elif self._closed.is_set():
+                break
+            else:
+                self._replay_journal(journal)
+
+        journal.close()
+
+    def _next_batch(self):
+        rows = []
+        try:
+            rows.extend(self._queue.get(timeout=self.flush_interval))
+        except queue.Empty:
+            return rows
+        # Take whatever else is already waiting, up to the batch size.
+        while len(rows) < self.batch_size:
+            try:
+                rows.extend(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return rows
+
+    def _insert(self, rows):
+        telemetry = get_telemetry()
+        for attempt in range(self.max_retries):
+            try:
+                # Called directly rather than through execute_query: this runs
+                # outside any Streamlit script context and must not be cached.
+                with telemetry.span("history_save", rows=len(rows)):
+                    self._connection.table(CHAT_HISTORY_TABLE).insert(rows, count=None).execute()
+                self.written += len(rows)
+                telemetry.count("history_rows_total", len(rows), result="written")
+                return True
+            except Exception as e:
+                telemetry.log("history_insert_failed", attempt=attempt + 1, error=e)
+                telemetry.count("retries_total", kind="history_insert")
+                self.failed_inserts += 1
+                if attempt + 1 < self.max_retries and not self._closed.is_set():
+                    time.sleep(self.backoff * 2 ** attempt)
+        return False
+
+    def _spill(self, journal, rows):
+        journal.executemany("insert into pending (row) values (?)", [(json.dumps(row),) for row in rows])
+        journal.commit()
+        self.journaled += len(rows)
+        self.journal_pending += len(rows)
+        get_telemetry().count("history_rows_total", len(rows), result="journaled")
+
+    def _replay_journal(self, journal):
+        # After a failed replay, wait before hammering an unreachable database again.
+        if time.monotonic() < self._next_replay:
+            return
+        pending = journal.execute("select id, row from pending order by id limit ?", (self.batch_size,)).fetchall()
+        if not pending:
+            return
+        if self._insert([json.loads(row) for _, row in pending]):
+            journal.execute("delete from pending where id <= ?", (pending[-1][0],))
+            journal.commit()
+            self.replayed += len(pending)
+            self.journal_pending = max(self.journal_pending - len(pending), 0)
+        else:
+            self._next_replay = time.monotonic() + self.replay_interval
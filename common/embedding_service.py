@@ -0,0 +1,361 @@
+import os
+import json
+import time
+import queue
+import asyncio
+import hashlib
+import threading
+import contextlib
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locking
+    fcntl = None
+
+from common.telemetry import get_telemetry
+
+
+EMBEDDING_CACHE_DIR = os.path.abspath('./data/embedding_cache')
+
+
+def content_key(model_name, text):
+    return hashlib.blake2b(f"{model_name}\0{text}".encode("utf-8"), digest_size=16).hexdigest()
+
+
+def normalize(matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1)
+    return matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+
+def quantize_int8(matrix):
+    """Symmetric per-row int8 quantization. Returns (codes, scales); codes * scales ~= matrix."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    scales = np.maximum(np.abs(matrix).max(axis=1), 1e-12) / 127.0
+    codes = np.clip(np.rint(matrix / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def dequantize_int8(codes, scales):
+    return normalize(codes.astype(np.float32) * np.asarray(scales, dtype=np.float32)[:, None])
+
+
+class EmbeddingStore:
+    """
+    Persistent content hash -> embedding map.
+
+    Vectors are rows of a raw file that is memory-mapped and grown in place
+    (`vectors.bin`, plus `scales.bin` when stored as int8); `keys.txt` holds
+    the content hash of row i on line i. Rows are written before their keys,
+    so a crash mid-write loses at most the rows whose keys were not appended.
+    A store built with another model, dimension or dtype is discarded.
+
+    Several processes (the app and an index rebuild) can share a store:
+    writes hold an exclusive lock on `lock`, and before writing each process
+    reads the keys other processes appended, so rows are never written twice
+    to the same position.
+    """
+
+    def __init__(self, store_dir=EMBEDDING_CACHE_DIR, model_name="", dim=384, dtype="float32", initial_rows=1024):
+        if dtype not in ("float32", "int8"):
+            raise ValueError(f"Unsupported embedding store dtype: {dtype}")
+        self.store_dir = store_dir
+        self.dim = dim
+        self.dtype = dtype
+        self.meta = {"model": model_name, "dim": dim, "dtype": dtype}
+        self.rows = {}
+        self._capacity = 0
+        self._initial_rows = initial_rows
+        self._vectors = None
+        self._scales = None
+        # Lines (= rows) and bytes of keys.txt already read into `rows`.
+        self._lines = 0
+        self._keys_read = 0
+        self._thread_lock = threading.Lock()
+
+        os.makedirs(store_dir, exist_ok=True)
+        self._keys_path = os.path.join(store_dir, "keys.txt")
+        self._vectors_path = os.path.join(store_dir, "vectors.bin")
+        self._scales_path = os.path.join(store_dir, "scales.bin")
+        self._lock_path = os.path.join(store_dir, "lock")
+        meta_path = os.path.join(store_dir, "meta.json")
+
+        with self._locked():
+            meta = None
+            if os.path.exists(meta_path):
+                with open(meta_path, "r", encoding="utf-8") as file:
+                    meta = json.load(file)
+            if meta != self.meta:
+                if meta is not None:
+                    get_telemetry().log("embedding_cache_reset", store_dir=store_dir, built_for=meta, expected=self.meta)
+                for path in (self._keys_path, self._vectors_path, self._scales_path):
+                    if os.path.exists(path):
+                        os.remove(path)
+                with open(meta_path, "w", encoding="utf-8") as file:
+                    json.dump(self.meta, file)
+
+            self._read_keys()
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, key):
+        return key in self.rows
+
+    def get(self, keys):
+        """Vectors for `keys` (all must be present), as normalized float32."""
+        index = np.fromiter((self.rows[key] for key in keys), dtype=np.int64, count=len(keys))
+        if self.dtype == "int8":
+            return dequantize_int8(self._vectors[index], self._scales[index])
+        return np.array(self._vectors[index], dtype=np.float32)
+
+    def put(self, keys, matrix):
+        """Append new vectors; keys already stored (by any process) are skipped."""
+        if all(key in self.rows for key in keys):
+            return
+
+        with self._locked():
+            # Rows other processes appended since we last looked.
+            self._read_keys()
+            new = [i for i, key in enumerate(keys) if key not in self.rows]
+            if not new:
+                return
+            start = self._lines
+            self._map(start + len(new))
+
+            matrix = np.asarray(matrix, dtype=np.float32)[new]
+            if self.dtype == "int8":
+                codes, scales = quantize_int8(matrix)
+                self._vectors[start:start + len(new)] = codes
+                self._scales[start:start + len(new)] = scales
+                self._scales.flush()
+            else:
+                self._vectors[start:start + len(new)] = matrix
+            self._vectors.flush()
+
+            with open(self._keys_path, "a", encoding="utf-8") as file:
+                file.write("".join(keys[i] + "\n" for i in new))
+                self._keys_read = file.tell()
+            for offset, i in enumerate(new):
+                self.rows[keys[i]] = start + offset
+            self._lines += len(new)
+
+    @contextlib.contextmanager
+    def _locked(self):
+        with self._thread_lock, open(self._lock_path, "a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _read_keys(self):
+        # Called with the lock held.
+        if not os.path.exists(self._keys_path):
+            self._map(1)
+            return
+        with open(self._keys_path, "r+b") as file:
+            file.seek(self._keys_read)
+            data = file.read()
+            complete = data.rfind(b"\n") + 1
+            if complete < len(data):
+                # A torn last line is a row whose write never finished (the
+                # writer crashed); drop it so the next append starts clean.
+                file.truncate(self._keys_read + complete)
+            for line in data[:complete].decode("utf-8").splitlines():
+                # Line i describes row i; a repeated key keeps its first row.
+                self.rows.setdefault(line.strip(), self._lines)
+                self._lines += 1
+            self._keys_read += complete
+        self._map(max(self._lines, 1))
+
+    def _map(self, rows):
+        if rows <= self._capacity:
+            return
+        capacity = max(self._initial_rows, self._capacity)
+        while capacity < rows:
+            capacity *= 2
+
+        files = [(self._vectors_path, np.int8 if self.dtype == "int8" else np.float32, (capacity, self.dim))]
+        if self.dtype == "int8":
+            files.append((self._scales_path, np.float32, (capacity,)))
+
+        mapped = []
+        for path, dtype, shape in files:
+            size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+            with open(path, "ab") as file:
+                if file.tell() < size:
+                    file.truncate(size)
+            mapped.append(np.memmap(path, dtype=dtype, mode="r+", shape=shape))
+
+        self._vectors = mapped[0]
+        self._scales = mapped[1] if len(mapped) > 1 else None
+        self._capacity = capacity
+
+
+class EmbeddingService:
+    """
+    One place every caller embeds through.
+
+    Requests from concurrent callers (LightRAG's parallel inserts, chat
+    sessions embedding their query) are queued and served by one worker
+    thread: texts arriving within `max_wait` seconds are merged, duplicates
+    are embedded once, and the model runs on batches of `batch_size`.
+    Outputs are normalized float32 rows.
+
+    With `persist=True` (documents/chunks) vectors are kept in the
+    EmbeddingStore keyed by content hash, so re-ingesting unchanged text never
+    reaches the model. Queries use `persist=False` and only go through a small
+    in-memory LRU.
+    """
+
+    def __init__(self, encode, model_name, dim=384, batch_size=32, max_wait=0.005, store=None, memory_size=2048):
+        # encode(texts, batch_size) -> (n, dim) array
+        self.encode = encode
+        self.model_name = model_name
+        self.dim = dim
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.store = store
+        self.memory_size = memory_size
+
+        self._memory = OrderedDict()
+        self._queue = queue.Queue()
+        self._worker = None
+        self._start_lock = threading.Lock()
+        self._stats = {
+            "requests": 0,
+            "texts": 0,
+            "batches": 0,
+            "encoded": 0,
+            "store_hits": 0,
+            "memory_hits": 0,
+            "encode_s": 0.0,
+        }
+
+    def submit(self, texts, persist=True):
+        """Queue `texts`; the returned Future resolves to an (n, dim) float32 array."""
+        future = Future()
+        texts = list(texts)
+        if not texts:
+            future.set_result(np.zeros((0, self.dim), dtype=np.float32))
+            return future
+        self._ensure_worker()
+        self._queue.put((texts, persist, future))
+        return future
+
+    def embed(self, texts, persist=True):
+        return self.submit(texts, persist).result()
+
+    async def aembed(self, texts, persist=True):
+        return await asyncio.wrap_future(self.submit(texts, persist))
+
+    def embed_query(self, text):
+        return self.embed([text], persist=False)[0]
+
+    def embed_int8(self, texts, persist=True):
+        """(codes, scales) int8 quantization of embed(texts), for compact storage."""
+        return quantize_int8(self.embed(texts, persist))
+
+    def stats(self):
+        stats = dict(self._stats)
+        stats["stored"] = len(self.store) if self.store is not None else 0
+        stats["texts_per_s"] = stats["encoded"] / stats["encode_s"] if stats["encode_s"] else None
+        return stats
+
+    def _ensure_worker(self):
+        if self._worker is not None:
+            return
+        with self._start_lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="embedding-service", daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            requests = [self._queue.get()]
+            size = len(requests[0][0])
+            deadline = time.monotonic() + self.max_wait
+            # Give concurrent callers a moment to join the batch.
+            while size < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    request = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                requests.append(request)
+                size += len(request[0])
+
+            try:
+                self._serve(requests)
+            except Exception as e:
+                for _, _, future in requests:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _serve(self, requests):
+        self._stats["requests"] += len(requests)
+        self._stats["batches"] += 1
+
+        persistent = set()
+        for texts, persist, _ in requests:
+            self._stats["texts"] += len(texts)
+            if persist:
+                persistent.update(texts)
+
+        vectors = {}
+        stored = []
+        missing = []
+        for text in dict.fromkeys(text for texts, _, _ in requests for text in texts):
+            key = content_key(self.model_name, text)
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                vectors[text] = self._memory[key]
+                self._stats["memory_hits"] += 1
+            elif self.store is not None and key in self.store:
+                stored.append((text, key))
+            else:
+                missing.append((text, key))
+
+        if stored:
+            self._stats["store_hits"] += len(stored)
+            vectors.update(zip((text for text, _ in stored), self.store.get([key for _, key in stored])))
+
+        for start in range(0, len(missing), self.batch_size):
+            batch = missing[start:start + self.batch_size]
+            begin = time.perf_counter()
+            matrix = normalize(self.encode([text for text, _ in batch], self.batch_size))
+            self._stats["encode_s"] += time.perf_counter() - begin
+            self._stats["encoded"] += len(batch)
+
+            keys = [key for _, key in batch]
+            if self.store is not None:
+                keep = [i for i, (text, _) in enumerate(batch) if text in persistent]
+                if keep:
+                    self.store.put([keys[i] for i in keep], matrix[keep])
+                    if self.store.dtype == "int8":
+                        # Hand out what later cache hits will return, not the pre-quantization vector.
+                        matrix[keep] = self.store.get([keys[i] for i in keep])
+
+            for (text, key), vector in zip(batch, matrix):
+                vectors[text] = vector
+                if text not in persistent or self.store is None:
+                    self._remember(key, vector)
+
+        for texts, _, future in requests:
+            if not future.cancelled():
+                future.set_result(np.stack([vectors[text] for text in texts]))
+
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
@@ -0,0 +1,48 @@
+import asyncio
+import threading
+
+
+_loop = None
+_lock = threading.Lock()
+
+
+def get_loop():
+    """
+    The process-wide event loop, running forever on a daemon thread.
+
+    All agent I/O is scheduled here, so async clients and LightRAG storages are
+    created and used on one loop instead of a fresh (or nested) loop per call.
+    """
+    global _loop
+    if _loop is None:
+        with _lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="agent-event-loop", daemon=True).start()
+                _loop = loop
+    return _loop
+
+
+def run(coro, timeout=None):
+    """Run `coro` on the shared loop from synchronous code and return its result."""
+    loop = get_loop()
+    if _on_loop_thread(loop):
+        coro.close()
+        raise RuntimeError("run() called from the shared event loop; await the coroutine instead")
+    return asyncio.run_coroutine_threadsafe(coro, loop).result(timeout)
+
+
+def iterate(async_iterator):
+    """Consume an async iterator on the shared loop as a plain generator (e.g. for st.write_stream)."""
+    while True:
+        try:
+            yield run(async_iterator.__anext__())
+        except StopAsyncIteration:
+            return
+
+
+def _on_loop_thread(loop):
+    try:
+        return asyncio.get_running_loop() is loop
+    except RuntimeError:
+        return False
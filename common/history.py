@@ -0,0 +1,180 @@
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+
+from common.event_loop import get_loop
+from common.telemetry import get_telemetry
+
+
+SUMMARY_PROMPT = """
+Summarise the conversation below between a student and the Petroleum Training Institute (PTI) assistant.
+Keep names, programmes, dates, amounts and any open questions; drop greetings and filler.
+Write at most {max_words} words.
+
+---Summary So Far---
+{summary}
+
+---New Messages---
+{messages}
+"""
+
+
+def estimate_tokens(text):
+    # ~4 characters per token for English text; close enough for budgeting.
+    return len(str(text)) // 4 + 1
+
+
+def format_history(messages):
+    """Render messages as `role: content` lines for prompts (instead of the list repr)."""
+    return "\n".join(f"{message['role']}: {message['content']}" for message in messages)
+
+
+def _fingerprint(messages):
+    digest = hashlib.sha1()
+    for message in messages:
+        digest.update(f"{message['role']}\0{message['content']}\0".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class HistoryManager:
+    """
+    Bounds the conversation history sent with each request.
+
+    The last `keep_messages` messages are kept verbatim. Older messages are
+    folded into a running summary per conversation by `update_summary`, which
+    runs the (async) `summarize` call in the background once `summarize_every`
+    new messages have rolled out of the verbatim window. `compact` never waits
+    for it: messages not summarised yet are sent verbatim. The result is
+    trimmed, oldest first, to fit `token_budget`.
+
+    The summary is tied to the last messages it covers, not to the start of
+    the conversation, so loading earlier pages in front of it keeps it. At
+    most `summary_input_tokens` of new messages (the newest) are summarised
+    in one call.
+    """
+
+    def __init__(self, summarize=None, keep_messages=6, token_budget=1200, summarize_every=4, summary_words=150, max_conversations=5000, summary_input_tokens=3000):
+        self._summarize = summarize
+        self.keep_messages = keep_messages
+        self.token_budget = token_budget
+        self.summarize_every = summarize_every
+        self.summary_words = summary_words
+        self.max_conversations = max_conversations
+        self.summary_input_tokens = summary_input_tokens
+
+        self._lock = threading.Lock()
+        # key -> {"covered": messages summarised, "tail": fingerprint of the last of them,
+        # "tail_length": how many, "summary": text}, least recently updated first.
+        self._summaries = OrderedDict()
+        # Conversations with a summary update running.
+        self._updating = set()
+
+    def compact(self, key, messages):
+        """Return the message list to send for conversation `key`."""
+        older, recent = self._split(messages)
+        state, start = self._summary_state(key, older)
+
+        compacted = older[start:] + recent
+        summary = state["summary"]
+
+        # Enforce the budget: drop the oldest verbatim messages first, then shorten the summary.
+        # The newest message (normally the current question) is always kept.
+        used = sum(estimate_tokens(message["content"]) for message in compacted)
+        summary_tokens = estimate_tokens(summary) if summary else 0
+        while len(compacted) > 1 and used + summary_tokens > self.token_budget:
+            used -= estimate_tokens(compacted.pop(0)["content"])
+        if summary and used + summary_tokens > self.token_budget:
+            room = max(self.token_budget - used, 0) * 4
+            summary = summary[:room]
+
+        if summary:
+            compacted.insert(0, {"role": "system", "content": f"Summary of the earlier conversation: {summary}"})
+        return compacted
+
+    def update_summary(self, key, messages):
+        """
+        Fold the messages of `key` that left the verbatim window into its
+        summary, on the shared event loop; call it after the reply. Returns the
+        future, or None when there is too little to summarise yet or an update
+        for `key` is already running.
+        """
+        if self._summarize is None:
+            return None
+        older, _ = self._split(messages)
+        state, start = self._summary_state(key, older)
+        if len(older) - start < self.summarize_every:
+            return None
+
+        with self._lock:
+            if key in self._updating:
+                return None
+            self._updating.add(key)
+
+        return asyncio.run_coroutine_threadsafe(self._update_summary(key, state, older, start), get_loop())
+
+    def forget(self, key):
+        with self._lock:
+            self._summaries.pop(key, None)
+
+    def _split(self, messages):
+        messages = list(messages)
+        older = messages[:-self.keep_messages] if len(messages) > self.keep_messages else []
+        return older, messages[len(older):]
+
+    def _summary_state(self, key, older):
+        """(state, index in `older` where the messages not yet summarised start)."""
+        with self._lock:
+            state = self._summaries.get(key)
+
+        empty = {"covered": 0, "tail": None, "tail_length": 0, "summary": ""}
+        if state is None:
+            return empty, 0
+
+        # Earlier pages loaded in front shift the summarised messages back;
+        # find where they now end, nearest the old position first.
+        length = state["tail_length"]
+        for end in range(max(state["covered"], length), len(older) + 1):
+            if _fingerprint(older[end - length:end]) == state["tail"]:
+                return state, end
+        # The conversation was replaced (e.g. reloaded differently); start over.
+        return empty, 0
+
+    async def _update_summary(self, key, state, older, start):
+        try:
+            await self._fold(key, state, older, start)
+        finally:
+            with self._lock:
+                self._updating.discard(key)
+
+    async def _fold(self, key, state, older, start):
+        # Only the newest messages up to the input cap; anything before them is left out.
+        new = older[start:]
+        used = sum(estimate_tokens(message["content"]) for message in new)
+        while len(new) > 1 and used > self.summary_input_tokens:
+            used -= estimate_tokens(new.pop(0)["content"])
+
+        try:
+            summary = await self._summarize(
+                SUMMARY_PROMPT.format(
+                    max_words=self.summary_words,
+                    summary=state["summary"] or "(none)",
+                    messages=format_history(new),
+                )
+            )
+        except Exception as e:
+            get_telemetry().log("history_summary_failed", error=e)
+            return
+
+        tail_length = min(len(older), self.summarize_every)
+        state = {
+            "covered": len(older),
+            "tail": _fingerprint(older[len(older) - tail_length:]),
+            "tail_length": tail_length,
+            "summary": summary.strip(),
+        }
+        with self._lock:
+            self._summaries[key] = state
+            self._summaries.move_to_end(key)
+            while len(self._summaries) > self.max_conversations:
+                self._summaries.popitem(last=False)
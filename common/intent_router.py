@@ -0,0 +1,261 @@
+"""
+Cheap first stage for chat messages: greetings and small talk are answered
+from templates, FAQ-like questions from a precomputed answer set, and only
+information queries go on to retrieval and the LLM.
+
+Build the FAQ answer set from a file with one question per line (answers come
+from the configured chat backend, so review data/faq.json before deploying):
+
+    python -m common.intent_router --build-faq faq_questions.txt
+"""
+import os
+import re
+import json
+import random
+import threading
+
+import numpy as np
+
+from common.answer_cache import normalize_query
+
+
+FAQ_PATH = os.path.abspath('./data/faq.json')
+
+# Intents answered without retrieval; "faq" and "info" are the other two.
+TEMPLATES = {
+    "greeting": [
+        "Hello! 👋 I'm the PTI chatbot. Ask me anything about the Petroleum Training Institute: admissions, programmes, fees, departments or campus life.",
+        "Hi there! 👋 How can I help you with the Petroleum Training Institute today?",
+    ],
+    "how_are_you": [
+        "I'm doing well, thank you for asking! How can I help you with the Petroleum Training Institute today?",
+    ],
+    "identity": [
+        "I'm the PTI chatbot, an assistant for the Petroleum Training Institute (PTI) in Nigeria. I can help with admissions, programmes, fees, departments, contacts and other information about PTI.",
+    ],
+    "thanks": [
+        "You're welcome! Let me know if there's anything else you'd like to know about PTI.",
+        "Glad I could help! Feel free to ask if you have any other questions about PTI.",
+    ],
+    "goodbye": [
+        "Goodbye! Come back any time you have questions about the Petroleum Training Institute.",
+    ],
+}
+
+# Keyword rules, matched on normalize_query() text. A message is small talk
+# when nothing but these phrases and FILLER words is left. Words that are just
+# as often a reply to the conversation ("ok", "great", "later") are left out:
+# the router does not see the conversation, so those go to the agent.
+RULES = [
+    ("how_are_you", r"how (are|r) (you|u)( doing)?( today)?|how (s|is) it going|how do you do|hope (you re|your|you are) (well|fine|good)"),
+    ("identity", r"who (are|r) (you|u)|what (are|r) (you|u)|what can (you|u) do|what do (you|u) do|are (you|u) (a )?(bot|robot|human|ai|real)|your name|what is your name"),
+    ("greeting", r"h+i+|hel+o+|hey+|hiya|howdy|greetings|good (morning|afternoon|evening|day)|what s up|whats up|sup"),
+    ("thanks", r"thanks?( you)?( so much| very much| a lot)?|thank u|thx|ty|much appreciated|appreciate (it|that)|cheers"),
+    ("goodbye", r"bye+|goodbye|good bye|see (you|u)( later| soon)?|good night|take care"),
+]
+_RULES = [(intent, re.compile(rf"\b(?:{pattern})\b")) for intent, pattern in RULES]
+
+FILLER = frozenset("""
+a again am and bot chatbot dear for friend i ma madam me oh ok okay please pls pti sir
+that the there this to too very well yes yeah
+""".split())
+
+# Small talk that is asked as a question; a message with "?" can only be one of these.
+QUESTION_INTENTS = frozenset({"how_are_you", "identity"})
+
+# Labelled examples for the embedding classifier. "info" examples are
+# negatives: small talk must be closer to its own examples than to them.
+EXAMPLES = {
+    "greeting": [
+        "hello", "hi there", "good morning", "hey, good evening", "greetings to you",
+        "hello, nice to meet you", "good afternoon chatbot", "hi, anyone there?",
+    ],
+    "how_are_you": [
+        "how are you", "how are you doing today", "hope you are doing well", "how is your day going",
+        "are you fine", "how have you been",
+    ],
+    "identity": [
+        "who are you", "what are you", "what can you help me with", "are you a human or a robot",
+        "what is your name", "who made you", "what do you do",
+    ],
+    "thanks": [
+        "thank you", "thanks a lot", "thank you so much, that was helpful",
+        "that's very helpful", "I appreciate your help", "many thanks",
+    ],
+    "goodbye": [
+        "bye", "goodbye", "see you later", "that's all for now, bye", "good night", "talk to you later",
+    ],
+    "info": [
+        "what are the admission requirements", "how much is the school fee", "where is PTI located",
+        "what courses does PTI offer", "who is the rector of PTI", "when does the semester start",
+        "how do I apply for HND", "what is the cut off mark", "how can I contact the registry",
+        "is there hostel accommodation", "what departments are in the engineering school",
+        "hello, what programmes are available", "hi, how do I check my admission status",
+        "thanks, and what about the fees for ND",
+    ],
+}
+
+
+class IntentRouter:
+    """
+    Routes a chat message to "info" (full RAG), "faq" (precomputed answer) or
+    one of the template intents.
+
+    Keyword rules run first and cost nothing; they are skipped for messages
+    with a "?", which are questions for the agent unless the classifier finds
+    them asking how the bot is or who it is. Otherwise the message is
+    embedded once; it is small talk when its nearest labelled example (see
+    EXAMPLES) is a small-talk one scoring at least `intent_threshold`, and an
+    FAQ hit when an FAQ question scores at least `faq_threshold`. Anything
+    else is an information query. The query embedding is the same one the
+    answer cache uses, so the embedding service serves it from memory there.
+    """
+
+    def __init__(self, embed, faq_path=FAQ_PATH, intent_threshold=0.75, faq_threshold=0.88, max_smalltalk_words=12):
+        # embed(texts) -> (n, dim) normalized array
+        self._embed = embed
+        self.intent_threshold = intent_threshold
+        self.faq_threshold = faq_threshold
+        self.max_smalltalk_words = max_smalltalk_words
+
+        labels, texts = zip(*[(label, text) for label, examples in EXAMPLES.items() for text in examples])
+        self._labels = list(labels)
+        self._examples = np.asarray(embed(list(texts)), dtype=np.float32)
+
+        self._faq_answers = []
+        self._faq_rows = []
+        self._faq_vectors = np.zeros((0, self._examples.shape[1]), dtype=np.float32)
+        self.load_faq(faq_path)
+
+        self._lock = threading.Lock()
+        self._counts = {}
+
+    def load_faq(self, path=FAQ_PATH):
+        """(Re)load the precomputed answers; each entry's question and variants all map to its answer."""
+        if not os.path.exists(path):
+            return 0
+        with open(path, "r", encoding="utf-8") as f:
+            entries = json.load(f)
+
+        questions, rows = [], []
+        for row, entry in enumerate(entries):
+            for question in [entry["question"], *entry.get("variants", [])]:
+                questions.append(normalize_query(question))
+                rows.append(row)
+        self._faq_vectors = np.asarray(self._embed(questions), dtype=np.float32) if questions else self._faq_vectors
+        self._faq_rows = rows
+        self._faq_answers = [entry["answer"] for entry in entries]
+        return len(entries)
+
+    def route(self, message):
+        """Return (intent, answer); answer is None for "info", which goes through the agents."""
+        intent, answer = self._route(message)
+        with self._lock:
+            self._counts[intent] = self._counts.get(intent, 0) + 1
+        return intent, answer
+
+    def _route(self, message):
+        text = normalize_query(message)
+        if not text:
+            return "greeting", random.choice(TEMPLATES["greeting"])
+
+        question = "?" in str(message)
+        intent = None if question else self.match_rules(text)
+        if intent is not None:
+            return intent, random.choice(TEMPLATES[intent])
+
+        vector = np.asarray(self._embed([text]), dtype=np.float32)[0]
+
+        # Long messages are never small talk, however friendly they start.
+        if len(text.split()) <= self.max_smalltalk_words:
+            scores = self._examples @ vector
+            best = int(np.argmax(scores))
+            label = self._labels[best]
+            allowed = label in QUESTION_INTENTS if question else label != "info"
+            if allowed and scores[best] >= self.intent_threshold:
+                return label, random.choice(TEMPLATES[label])
+
+        if len(self._faq_rows):
+            scores = self._faq_vectors @ vector
+            best = int(np.argmax(scores))
+            if scores[best] >= self.faq_threshold:
+                return "faq", self._faq_answers[self._faq_rows[best]]
+
+        return "info", None
+
+    def match_rules(self, text):
+        # Strip every small-talk phrase; if only filler words remain, the
+        # most specific intent matched wins (RULES is in priority order).
+        found = []
+        for intent, pattern in _RULES:
+            text, count = pattern.subn(" ", text)
+            if count:
+                found.append(intent)
+        if found and all(word in FILLER for word in text.split()):
+            return found[0]
+        return None
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self._counts)
+        total = sum(counts.values())
+        counts["total"] = total
+        counts["skipped_rag"] = 1 - counts.get("info", 0) / total if total else 0.0
+        return counts
+
+
+def build_faq(questions, path=FAQ_PATH, backend=None):
+    """
+    Answer each question with the chat backend and write the FAQ answer set.
+
+    Questions the agent failed on (its reply is an error message) are left
+    out. Returns (written, skipped questions); nothing is written when every
+    question failed, so a backend outage cannot replace a good answer set.
+    """
+    from common.backends import get_agent_class
+    from common.event_loop import run
+
+    async def ask(question):
+        agent = get_agent_class(backend)()
+        try:
+            reply = await agent.answer(question, [])
+        except Exception:
+            return None
+        return None if agent.failed or not reply else reply
+
+    entries = []
+    skipped = []
+    for question in questions:
+        print(f"Answering: {question}")
+        reply = run(ask(question))
+        if reply is None:
+            skipped.append(question)
+        else:
+            entries.append({"question": question, "answer": reply})
+
+    if entries:
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(entries, f, ensure_ascii=False, indent=2)
+        os.replace(path + ".tmp", path)
+    return len(entries), skipped
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--build-faq", metavar="QUESTIONS", required=True, help="text file with one FAQ question per line")
+    parser.add_argument("--backend", help="chat backend used to answer them (default: CHAT_BACKEND)")
+    parser.add_argument("--output", default=FAQ_PATH)
+    args = parser.parse_args()
+
+    with open(args.build_faq, "r", encoding="utf-8") as f:
+        questions = [line.strip() for line in f if line.strip()]
+    count, skipped = build_faq(questions, args.output, args.backend)
+    if count:
+        print(f"Wrote {count} answers to {args.output}")
+    if skipped:
+        print(f"Skipped {len(skipped)} questions the agent failed to answer:")
+        for question in skipped:
+            print(f"  {question}")
+        parser.exit(1)
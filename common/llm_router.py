@@ -0,0 +1,373 @@
+import time
+import asyncio
+import threading
+from collections import deque
+
+import numpy as np
+
+from common.history import estimate_tokens
+from common.rate_limiter import SingleFlight
+from common.telemetry import get_telemetry
+
+
+# Status codes worth retrying on another provider.
+RETRIABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+def is_retriable(error):
+    """429s, 5xx and timeouts fail over to the next provider; anything else is a real error."""
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    status = getattr(error, "code", None) or getattr(error, "status_code", None)
+    if isinstance(status, int):
+        return status in RETRIABLE_STATUS
+    # Client libraries without a status attribute usually put it in the message.
+    text = str(error)
+    return "RESOURCE_EXHAUSTED" in text or "429" in text or "timed out" in text.lower()
+
+
+class Provider:
+    """
+    A named text generation backend: `generate(prompt, system)` returns text,
+    `stream(prompt, system)` yields chunks. `system` is an optional system
+    instruction, sent ahead of the prompt.
+    """
+
+    def __init__(self, name, generate, stream=None):
+        self.name = name
+        self.generate = generate
+        self._stream = stream
+
+    async def stream(self, prompt, system=None):
+        if self._stream is None:
+            yield await self.generate(prompt, system)
+            return
+        async for chunk in self._stream(prompt, system):
+            yield chunk
+
+
+async def _acquire(limiter, model, prompt, max_output_tokens, system=None):
+    if limiter is not None:
+        await limiter.acquire(model, estimate_tokens(prompt) + (estimate_tokens(system) if system else 0) + (max_output_tokens or 0))
+
+
+def gemini_provider(client, model="gemini-1.5-flash", max_output_tokens=500, temperature=0.1, limiter=None):
+    from google.genai import types
+
+    configs = {}
+
+    def config_for(system):
+        # One config per distinct system instruction (in practice one per agent).
+        if system not in configs:
+            configs[system] = types.GenerateContentConfig(max_output_tokens=max_output_tokens, temperature=temperature, system_instruction=system)
+        return configs[system]
+
+    async def generate(prompt, system=None):
+        await _acquire(limiter, model, prompt, max_output_tokens, system)
+        response = await client.aio.models.generate_content(model=model, contents=[prompt], config=config_for(system))
+        return response.text
+
+    async def stream(prompt, system=None):
+        await _acquire(limiter, model, prompt, max_output_tokens, system)
+        response = await client.aio.models.generate_content_stream(model=model, contents=[prompt], config=config_for(system))
+        async for chunk in response:
+            if chunk.text:
+                yield chunk.text
+
+    return Provider(f"gemini:{model}", generate, stream)
+
+
+def _messages(prompt, system):
+    messages = [{"role": "system", "content": system}] if system else []
+    return messages + [{"role": "user", "content": prompt}]
+
+
+def groq_provider(client, model="groq/compound", max_completion_tokens=1024, temperature=0.2, limiter=None):
+    async def generate(prompt, system=None):
+        await _acquire(limiter, model, prompt, max_completion_tokens, system)
+        completion = await client.chat.completions.create(
+            messages=_messages(prompt, system),
+            model=model,
+            temperature=temperature,
+            max_completion_tokens=max_completion_tokens,
+        )
+        return completion.choices[0].message.content
+
+    async def stream(prompt, system=None):
+        await _acquire(limiter, model, prompt, max_completion_tokens, system)
+        response = await client.chat.completions.create(
+            messages=_messages(prompt, system),
+            model=model,
+            temperature=temperature,
+            max_completion_tokens=max_completion_tokens,
+            stream=True,
+        )
+        async for chunk in response:
+            content = chunk.choices[0].delta.content if chunk.choices else None
+            if content:
+                yield content
+
+    return Provider(f"groq:{model}", generate, stream)
+
+
+class ProviderStats:
+    """Rolling latency and outcome window for one provider."""
+
+    def __init__(self, window=200):
+        self.latencies = deque(maxlen=window)
+        self.first_token = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+        self.requests = 0
+        self.errors = 0
+
+    def percentile(self, q, first_token=False):
+        samples = self.first_token if first_token else self.latencies
+        return float(np.percentile(samples, q)) if samples else None
+
+    @property
+    def error_rate(self):
+        return self.outcomes.count(False) / len(self.outcomes) if self.outcomes else 0.0
+
+
+class LLMRouter:
+    """
+    Routes generation across providers by observed health.
+
+    Providers are ranked by rolling p95 latency weighted by error rate (the
+    configured order breaks ties). A request goes to the best provider; if it
+    has not answered (or, when streaming, produced its first chunk) within the
+    hedge delay, a duplicate goes to the next provider and the first success
+    wins. Retriable failures (429, 5xx, timeouts) fail over immediately.
+    Every decision is counted and kept in a short log for `metrics()`.
+    """
+
+    def __init__(self, providers, hedge_after=4.0, min_hedge_after=0.5, min_samples=20, decision_log=100):
+        self.providers = {provider.name: provider for provider in providers}
+        self._order = [provider.name for provider in providers]
+        self.hedge_after = hedge_after
+        self.min_hedge_after = min_hedge_after
+        self.min_samples = min_samples
+
+        self._lock = threading.Lock()
+        self.stats = {name: ProviderStats() for name in self._order}
+        self.counters = {"requests": 0, "hedges": 0, "hedge_wins": 0, "failovers": 0, "exhausted": 0}
+        self.decisions = deque(maxlen=decision_log)
+        self._single_flight = SingleFlight()
+
+    def ranked(self):
+        def score(name):
+            stats = self.stats[name]
+            p95 = stats.percentile(95) or 0.0
+            return p95 * (1 + 4 * stats.error_rate) + 100 * (stats.error_rate > 0.5)
+
+        with self._lock:
+            return sorted(self._order, key=lambda name: (score(name), self._order.index(name)))
+
+    def hedge_delay(self, name, first_token=False):
+        """Wait this long for `name` before sending a hedged duplicate."""
+        with self._lock:
+            stats = self.stats[name]
+            samples = stats.first_token if first_token else stats.latencies
+            if len(samples) < self.min_samples:
+                return self.hedge_after
+            return max(min(stats.percentile(95, first_token), self.hedge_after), self.min_hedge_after)
+
+    async def generate(self, prompt, system=None):
+        """Return the text of the first provider to succeed; identical concurrent prompts share one call."""
+        return await self._single_flight.do((system, prompt), lambda: self._generate(prompt, system))
+
+    async def _generate(self, prompt, system=None):
+        ranked = self.ranked()
+        decision = {"primary": ranked[0], "hedged": False, "failovers": 0, "winner": None}
+
+        candidates = iter(ranked)
+        racing = {}
+
+        def launch():
+            name = next(candidates, None)
+            if name is None:
+                return False
+            task = asyncio.ensure_future(self.providers[name].generate(prompt, system))
+            racing[task] = (name, time.perf_counter())
+            return True
+
+        launch()
+        last_error = None
+        try:
+            while racing:
+                timeout = None if decision["hedged"] else self.hedge_delay(ranked[0])
+                done, _ = await asyncio.wait(racing, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    decision["hedged"] = True
+                    if launch():
+                        self._count("hedges")
+                    continue
+
+                for task in done:
+                    name, start = racing.pop(task)
+                    try:
+                        text = task.result()
+                    except Exception as e:
+                        last_error = e
+                        self._record(name, time.perf_counter() - start, ok=False)
+                        get_telemetry().count("llm_errors_total", provider=name, retriable=is_retriable(e))
+                        if not is_retriable(e) and not racing:
+                            raise
+                        if not racing and launch():
+                            decision["failovers"] += 1
+                            self._count("failovers")
+                        continue
+
+                    self._record(name, time.perf_counter() - start, ok=True)
+                    self._count_tokens(name, prompt, system, text)
+                    decision["winner"] = name
+                    if name != ranked[0] and decision["hedged"]:
+                        self._count("hedge_wins")
+                    return text
+        finally:
+            for task, (name, start) in racing.items():
+                task.cancel()
+                self._record_abandoned(name, time.perf_counter() - start)
+            self._decide(decision)
+
+        self._count("exhausted")
+        raise last_error or RuntimeError("No LLM provider available")
+
+    async def stream(self, prompt, system=None):
+        """Yield chunks from the first provider to produce one; hedging and failover apply until then."""
+        ranked = self.ranked()
+        decision = {"primary": ranked[0], "hedged": False, "failovers": 0, "winner": None}
+
+        candidates = iter(ranked)
+        racing = {}
+
+        def launch():
+            name = next(candidates, None)
+            if name is None:
+                return False
+            iterator = self.providers[name].stream(prompt, system)
+            task = asyncio.ensure_future(iterator.__anext__())
+            racing[task] = (name, iterator, time.perf_counter())
+            return True
+
+        launch()
+        winner = None
+        last_error = None
+        try:
+            while racing and winner is None:
+                timeout = None if decision["hedged"] else self.hedge_delay(ranked[0], first_token=True)
+                done, _ = await asyncio.wait(racing, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    decision["hedged"] = True
+                    if launch():
+                        self._count("hedges")
+                    continue
+
+                for task in done:
+                    name, iterator, start = racing.pop(task)
+                    try:
+                        chunk = task.result()
+                    except StopAsyncIteration:
+                        chunk = ""
+                    except Exception as e:
+                        last_error = e
+                        self._record(name, time.perf_counter() - start, ok=False)
+                        get_telemetry().count("llm_errors_total", provider=name, retriable=is_retriable(e))
+                        if not is_retriable(e) and not racing:
+                            raise
+                        if not racing and launch():
+                            decision["failovers"] += 1
+                            self._count("failovers")
+                        continue
+
+                    winner = (name, iterator, start, chunk)
+                    break
+        finally:
+            for task, (name, _, start) in racing.items():
+                task.cancel()
+                self._record_abandoned(name, time.perf_counter() - start, first_token=True)
+            if winner is None:
+                self._decide(decision)
+
+        if winner is None:
+            self._count("exhausted")
+            raise last_error or RuntimeError("No LLM provider available")
+
+        name, iterator, start, chunk = winner
+        first_token = time.perf_counter() - start
+        decision["winner"] = name
+        if name != ranked[0] and decision["hedged"]:
+            self._count("hedge_wins")
+        self._decide(decision)
+
+        ok = False
+        chunks = [chunk]
+        try:
+            if chunk:
+                yield chunk
+            async for chunk in iterator:
+                chunks.append(chunk)
+                yield chunk
+            ok = True
+        finally:
+            self._record(name, time.perf_counter() - start, ok=ok, first_token=first_token)
+            self._count_tokens(name, prompt, system, "".join(chunks))
+
+    def metrics(self):
+        with self._lock:
+            providers = {
+                name: {
+                    "requests": stats.requests,
+                    "errors": stats.errors,
+                    "error_rate": stats.error_rate,
+                    "p50_s": stats.percentile(50),
+                    "p95_s": stats.percentile(95),
+                    "first_token_p95_s": stats.percentile(95, first_token=True),
+                }
+                for name, stats in self.stats.items()
+            }
+            return {
+                "providers": providers,
+                **self.counters,
+                "coalesced": self._single_flight.coalesced,
+                "recent_decisions": list(self.decisions),
+            }
+
+    def _record(self, name, latency, ok, first_token=None):
+        with self._lock:
+            stats = self.stats[name]
+            stats.requests += 1
+            stats.outcomes.append(ok)
+            if ok:
+                stats.latencies.append(latency)
+                if first_token is not None:
+                    stats.first_token.append(first_token)
+            else:
+                stats.errors += 1
+
+    def _record_abandoned(self, name, elapsed, first_token=False):
+        # A call cancelled after losing a hedge took at least this long; counting
+        # that keeps a consistently slow provider from staying first in line.
+        with self._lock:
+            stats = self.stats[name]
+            stats.latencies.append(elapsed)
+            if first_token:
+                stats.first_token.append(elapsed)
+
+    def _count(self, counter):
+        with self._lock:
+            self.counters[counter] += 1
+        # Hedges and failovers are the router's retries.
+        get_telemetry().count("llm_router_events_total", event=counter)
+
+    def _count_tokens(self, name, prompt, system, text):
+        telemetry = get_telemetry()
+        telemetry.count("llm_tokens_total", estimate_tokens(prompt) + (estimate_tokens(system) if system else 0), provider=name, direction="in")
+        telemetry.count("llm_tokens_total", estimate_tokens(text or ""), provider=name, direction="out")
+
+    def _decide(self, decision):
+        with self._lock:
+            self.counters["requests"] += 1
+            self.decisions.append(decision)
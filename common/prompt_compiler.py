@@ -0,0 +1,95 @@
+import re
+import textwrap
+
+from common.history import estimate_tokens
+
+
+def _line_key(line):
+    # Lines that differ only in markdown emphasis, numbering or spacing are the same instruction.
+    line = re.sub(r"^\s*(?:[*\-]|\d+\.)\s*", "", line)
+    return " ".join(re.sub(r"[*_`]", "", line).lower().split())
+
+
+class PromptCompiler:
+    """
+    Builds prompts as a fixed system instruction plus a per-message user turn.
+
+    The instruction blocks are compiled once into `system_prompt`, with
+    repeated instruction lines dropped. It is byte-identical for every
+    message, so it stays the first part of each request and the provider's
+    prefix caching applies. The user turn holds only what changes
+    (context chunks, history, question). Instruction lines repeated there are
+    dropped as well.
+
+    `compile` keeps the whole request within `token_budget`: context chunks
+    are dropped from the lowest ranked up, the last one kept is cut to fit,
+    and only then is the oldest history dropped. The question is always sent.
+    """
+
+    def __init__(self, instructions, token_budget=4000, min_chunk_tokens=50):
+        # instructions: [(section name, text)], in prompt order
+        self.token_budget = token_budget
+        self.min_chunk_tokens = min_chunk_tokens
+
+        self._seen = set()
+        self.sections = [(name, self._dedupe(text)) for name, text in instructions]
+        self.system_prompt = "\n\n".join(text for _, text in self.sections if text)
+        self.system_tokens = {name: estimate_tokens(text) for name, text in self.sections}
+
+    def compile(self, question, chunks=(), history="", notes=""):
+        """
+        Return (user turn, tokens per section). `chunks` are context texts,
+        best first; `notes` are extra per-message instructions.
+        """
+        notes = self._dedupe(notes, remember=False)
+        history_lines = [line for line in str(history).splitlines() if line.strip()]
+        chunks = [str(chunk).strip() for chunk in chunks if str(chunk).strip()]
+
+        # Fixed cost: system prompt, question, notes and section headers.
+        available = self.token_budget - sum(self.system_tokens.values()) - estimate_tokens(question) - estimate_tokens(notes) - 30
+
+        history_tokens = sum(estimate_tokens(line) for line in history_lines)
+        kept, used = [], 0
+        for chunk in chunks:
+            tokens = estimate_tokens(chunk)
+            room = available - history_tokens - used
+            if tokens > room:
+                # Cut the chunk that does not fit, unless too little of it would be left.
+                if room >= self.min_chunk_tokens:
+                    kept.append(chunk[:room * 4].rstrip() + " ...")
+                    used += room
+                break
+            kept.append(chunk)
+            used += tokens
+
+        while history_lines and history_tokens + used > available:
+            history_tokens -= estimate_tokens(history_lines.pop(0))
+
+        sections = [
+            ("context", "**Provided Context:**\n" + "\n\n".join(kept) if kept else ""),
+            ("history", "**Conversation History:**\n" + "\n".join(history_lines) if history_lines else ""),
+            ("notes", notes),
+            ("question", f"**The Question to Answer:** {question}"),
+        ]
+        prompt = "\n\n***\n\n".join(text for _, text in sections if text)
+
+        tokens = {f"system.{name}": count for name, count in self.system_tokens.items()}
+        tokens.update({name: estimate_tokens(text) if text else 0 for name, text in sections})
+        tokens["chunks_dropped"] = len(chunks) - len(kept)
+        tokens["total"] = sum(self.system_tokens.values()) + estimate_tokens(prompt)
+        return prompt, tokens
+
+    def _dedupe(self, text, remember=True):
+        lines = []
+        seen = self._seen if remember else set(self._seen)
+        for line in textwrap.dedent(str(text)).strip().splitlines():
+            line = line.rstrip()
+            key = _line_key(line)
+            if key and key in seen:
+                continue
+            if key:
+                seen.add(key)
+            # Collapse the blank lines left where duplicates were removed.
+            if line or (lines and lines[-1]):
+                lines.append(line)
+        return "\n".join(lines).strip()
@@ -0,0 +1,172 @@
+import re
+import time
+import heapq
+import asyncio
+import itertools
+import contextlib
+import contextvars
+
+
+# Priority lanes: lower runs first.
+INTERACTIVE = 0
+INGESTION = 1
+
+# Lane of the current task. Tasks inherit it from whoever created them, so
+# wrapping ingestion in `lane(INGESTION)` also covers LightRAG's own tasks.
+_lane = contextvars.ContextVar("llm_lane", default=INTERACTIVE)
+
+# Pinned model versions (gemini-1.5-flash-8b-001) share their base model's quota.
+_MODEL_VERSION = re.compile(r"-\d{3}$")
+
+
+@contextlib.contextmanager
+def lane(priority):
+    token = _lane.set(priority)
+    try:
+        yield
+    finally:
+        _lane.reset(token)
+
+
+def current_lane():
+    return _lane.get()
+
+
+class TokenBucket:
+    """Continuously refilling bucket holding up to `per_minute` units."""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount):
+        """Seconds until `amount` is available (0 when it is available now)."""
+        self._refill()
+        missing = min(amount, self.capacity) - self.level
+        return max(missing / self.rate, 0.0)
+
+    def take(self, amount):
+        self._refill()
+        self.level -= min(amount, self.capacity)
+
+
+class ModelQuota:
+    """
+    Requests/min and tokens/min buckets for one model, with a priority queue.
+
+    Waiters are served strictly by (lane, arrival): background work never
+    takes capacity an interactive request is waiting for. Must be used from
+    a single event loop (the shared one in common.event_loop).
+    """
+
+    def __init__(self, model, rpm, tpm):
+        self.model = model
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self._waiters = []
+        self._order = itertools.count()
+        self._timer = None
+
+        self.granted = 0
+        self.delayed = 0
+        self.waited_s = 0.0
+
+    async def acquire(self, tokens, priority=None):
+        priority = current_lane() if priority is None else priority
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._order), tokens, future))
+        start = time.monotonic()
+
+        self._drain()
+        if not future.done():
+            self.delayed += 1
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Give up our place; if we were granted just now the capacity is spent anyway.
+            self._waiters = [waiter for waiter in self._waiters if waiter[3] is not future]
+            heapq.heapify(self._waiters)
+            self._drain()
+            raise
+        self.waited_s += time.monotonic() - start
+
+    def _wake(self):
+        self._timer = None
+        self._drain()
+
+    def _drain(self):
+        while self._waiters:
+            _, _, tokens, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+
+            wait = max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+            if wait > 0:
+                if self._timer is None:
+                    self._timer = asyncio.get_running_loop().call_later(wait, self._wake)
+                return
+
+            heapq.heappop(self._waiters)
+            self.requests.take(1)
+            self.tokens.take(tokens)
+            self.granted += 1
+            future.set_result(None)
+
+    def stats(self):
+        return {
+            "granted": self.granted,
+            "delayed": self.delayed,
+            "waited_s": self.waited_s,
+            "queued": sum(not waiter[3].done() for waiter in self._waiters),
+        }
+
+
+class RateLimiter:
+    """Shared client-side quota for every model the agents call."""
+
+    def __init__(self, limits, default=(60, 1_000_000)):
+        self.limits = dict(limits)
+        self.default = default
+        self._quotas = {}
+
+    def quota(self, model):
+        if model not in self.limits:
+            model = _MODEL_VERSION.sub("", model)
+        if model not in self._quotas:
+            rpm, tpm = self.limits.get(model, self.default)
+            self._quotas[model] = ModelQuota(model, rpm, tpm)
+        return self._quotas[model]
+
+    async def acquire(self, model, tokens, priority=None):
+        """Wait until `model` has room for one request of about `tokens` tokens."""
+        await self.quota(model).acquire(tokens, priority)
+
+    def stats(self):
+        return {model: quota.stats() for model, quota in self._quotas.items()}
+
+
+class SingleFlight:
+    """Concurrent calls with the same key share one in-flight call and its result."""
+
+    def __init__(self):
+        self._inflight = {}
+        self.coalesced = 0
+
+    async def do(self, key, factory):
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._inflight.pop(key) if self._inflight.get(key) is done else None)
+        else:
+            self.coalesced += 1
+        # One caller giving up must not cancel the call for the others.
+        return await asyncio.shield(task)
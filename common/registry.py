@@ -0,0 +1,423 @@
+import os
+import json
+import threading
+from dotenv import load_dotenv
+
+
+# Load environment variables from .env file
+load_dotenv()
+
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+GEMINI_LLM_MODEL = "gemini-2.0-flash"
+LLAMA_INDEX_NAME = "pti_data"
+LLAMA_INDEX_PROJECT = "Default"
+
+# Semantic answer cache settings
+ANSWER_CACHE_THRESHOLD = float(os.getenv('ANSWER_CACHE_THRESHOLD', '0.92'))
+ANSWER_CACHE_TTL = int(os.getenv('ANSWER_CACHE_TTL', str(24 * 3600)))
+ANSWER_CACHE_SIZE = int(os.getenv('ANSWER_CACHE_SIZE', '512'))
+
+# "llamacloud" (remote) or "local" (in-process hybrid retriever over data/local_index)
+RETRIEVAL_BACKEND = os.getenv('RETRIEVAL_BACKEND', 'llamacloud')
+
+# Conversation history sent per request
+HISTORY_KEEP_MESSAGES = int(os.getenv('HISTORY_KEEP_MESSAGES', '6'))
+HISTORY_TOKEN_BUDGET = int(os.getenv('HISTORY_TOKEN_BUDGET', '1200'))
+
+# Generation router: seconds to wait for the first provider before hedging,
+# and the Groq model used as the second provider (when GROQ_API_KEY is set).
+LLM_HEDGE_AFTER = float(os.getenv('LLM_HEDGE_AFTER', '4.0'))
+LLM_FALLBACK_MODEL = os.getenv('LLM_FALLBACK_MODEL', 'groq/compound')
+# The Groq backend's own router: Groq first, this Gemini model as its fallback
+# (when GOOGLE_API_KEY is set).
+GROQ_MODEL = os.getenv('GROQ_MODEL', 'groq/compound')
+GROQ_FALLBACK_MODEL = os.getenv('GROQ_FALLBACK_MODEL', 'gemini-1.5-flash')
+
+# Client-side quota per model as (requests/min, tokens/min). The defaults are
+# the free-tier limits we have been hitting 429s on; override with
+# LLM_RATE_LIMITS='{"gemini-1.5-pro": [150, 2000000]}' on a paid key.
+LLM_RATE_LIMITS = {
+    "gemini-1.5-flash": (15, 1_000_000),
+    "gemini-1.5-flash-8b": (15, 1_000_000),
+    "gemini-1.5-pro": (2, 32_000),
+    "groq/compound": (30, 70_000),
+}
+LLM_RATE_LIMITS.update({model: tuple(limit) for model, limit in json.loads(os.getenv('LLM_RATE_LIMITS', '{}')).items()})
+
+# CAG answers from the whole corpus held in a Gemini context cache. Caching
+# needs an explicitly versioned model.
+CAG_MODEL = os.getenv('CAG_MODEL', 'gemini-1.5-flash-8b-001')
+CAG_CACHE_TTL = int(os.getenv('CAG_CACHE_TTL', '3600'))
+
+# Embedding service: model batch size (see benchmarks/embedding_bench.py) and
+# how the persistent embedding cache stores vectors ("float32" or "int8").
+EMBEDDING_BATCH_SIZE = int(os.getenv('EMBEDDING_BATCH_SIZE', '32'))
+EMBEDDING_CACHE_DTYPE = os.getenv('EMBEDDING_CACHE_DTYPE', 'float32')
+
+# Reranking: "local" retrieves RERANK_CANDIDATES chunks and keeps the best
+# RERANK_TOP_N with a CPU cross-encoder (retrieval/reranker.py); "remote"
+# leaves it to LlamaCloud's reranker and Ragie's top result as before.
+RERANKER = os.getenv('RERANKER', 'local')
+RERANK_MODEL = os.getenv('RERANK_MODEL', 'cross-encoder/ms-marco-MiniLM-L-6-v2')
+RERANK_CANDIDATES = int(os.getenv('RERANK_CANDIDATES', '20'))
+RERANK_TOP_N = int(os.getenv('RERANK_TOP_N', '3'))
+RERANK_BATCH_SIZE = int(os.getenv('RERANK_BATCH_SIZE', '8'))
+
+# Total tokens per generation request (system prompt, context, history and
+# question); context chunks are trimmed first (common/prompt_compiler.py).
+PROMPT_TOKEN_BUDGET = int(os.getenv('PROMPT_TOKEN_BUDGET', '4000'))
+
+# Intent router in front of the agents (common/intent_router.py): small talk
+# and FAQ-like questions are answered without retrieval. "off" disables it.
+INTENT_ROUTER = os.getenv('INTENT_ROUTER', 'on')
+INTENT_THRESHOLD = float(os.getenv('INTENT_THRESHOLD', '0.75'))
+FAQ_THRESHOLD = float(os.getenv('FAQ_THRESHOLD', '0.88'))
+
+# Alternative API endpoints, e.g. the local stand-ins used by
+# benchmarks/load_test.py. Groq reads GROQ_BASE_URL itself.
+GEMINI_BASE_URL = os.getenv('GEMINI_BASE_URL')
+LLAMA_CLOUD_BASE_URL = os.getenv('LLAMA_CLOUD_BASE_URL')
+
+# Metrics: Prometheus text on http://<host>:METRICS_PORT/metrics when set, and
+# the Streamlit admin page (pages/admin.py) for the comma-separated ADMIN_EMAILS.
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+ADMIN_EMAILS = {email.strip().lower() for email in os.getenv('ADMIN_EMAILS', '').split(',') if email.strip()}
+
+# Resources warmed up at startup when no explicit list is given
+# (see common.backends.WARM_UP for the per-backend lists).
+DEFAULT_WARM_UP = ("genai_client", "embedding_service")
+
+
+class ResourceRegistry:
+    """
+    Process-wide owner of the expensive clients and models used by the agents.
+
+    Every resource is built lazily on first use and then shared by all sessions,
+    instead of being rebuilt on every embedding call or chat message.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._resources = {}
+
+    def _get_or_create(self, key, factory):
+        resource = self._resources.get(key)
+        if resource is not None:
+            return resource
+
+        with self._lock:
+            # Another thread may have built it while we waited for the lock.
+            resource = self._resources.get(key)
+            if resource is None:
+                resource = factory()
+                self._resources[key] = resource
+            return resource
+
+    def embedding_model(self):
+        def build():
+            import torch
+            from sentence_transformers import SentenceTransformer
+
+            # Keeps Streamlit's file watcher from walking torch.classes.
+            torch.classes.__path__ = []
+
+            return SentenceTransformer(EMBEDDING_MODEL_NAME)
+
+        return self._get_or_create("embedding_model", build)
+
+    def embedding_service(self):
+        # All embedding goes through here: batched across callers, and chunk
+        # embeddings are cached on disk by content hash.
+        def build():
+            from common.embedding_service import EmbeddingService, EmbeddingStore, EMBEDDING_CACHE_DIR
+            model = self.embedding_model()
+            dim = model.get_sentence_embedding_dimension()
+            return EmbeddingService(
+                encode=lambda texts, batch_size: model.encode(texts, batch_size=batch_size, convert_to_numpy=True, normalize_embeddings=True),
+                model_name=EMBEDDING_MODEL_NAME,
+                dim=dim,
+                batch_size=EMBEDDING_BATCH_SIZE,
+                store=EmbeddingStore(EMBEDDING_CACHE_DIR, EMBEDDING_MODEL_NAME, dim, dtype=EMBEDDING_CACHE_DTYPE),
+            )
+
+        return self._get_or_create("embedding_service", build)
+
+    def genai_client(self):
+        def build():
+            from google import genai
+            from google.genai import types
+            http_options = types.HttpOptions(base_url=GEMINI_BASE_URL) if GEMINI_BASE_URL else None
+            return genai.Client(api_key=os.getenv('GOOGLE_API_KEY'), http_options=http_options)
+
+        return self._get_or_create("genai_client", build)
+
+    def gemini_llm(self, system_instruction=None, model=GEMINI_LLM_MODEL, max_tokens=512):
+        # GoogleGenAI fetches model metadata over the network when constructed,
+        # so one instance is kept per (model, system instruction).
+        def build():
+            from google.genai import types
+            from llama_index.llms.google_genai import GoogleGenAI
+            endpoint = {"http_options": types.HttpOptions(base_url=GEMINI_BASE_URL)} if GEMINI_BASE_URL else {}
+            return GoogleGenAI(
+                **endpoint,
+                model=model,
+                api_key=os.getenv('GOOGLE_API_KEY'),
+                max_tokens=max_tokens,
+                generation_config=types.GenerateContentConfig(
+                    system_instruction=system_instruction,
+                )
+            )
+
+        return self._get_or_create(("gemini_llm", model, system_instruction, max_tokens), build)
+
+    def llama_index(self):
+        # Resolving the project and pipeline is a remote round-trip.
+        def build():
+            from llama_cloud_services import LlamaCloudIndex
+            endpoint = {"base_url": LLAMA_CLOUD_BASE_URL} if LLAMA_CLOUD_BASE_URL else {}
+            return LlamaCloudIndex(
+                **endpoint,
+                name=LLAMA_INDEX_NAME,
+                project_name=LLAMA_INDEX_PROJECT,
+                organization_id=os.getenv('LLMA_INDEX_ORG_ID'),
+                api_key=os.getenv('LLMA_INDEX_API_KEY'),
+            )
+
+        return self._get_or_create("llama_index", build)
+
+    def llama_retriever(self):
+        # Building a retriever resolves the project/pipeline again, so the
+        # configured retriever is shared rather than rebuilt per message.
+        def build():
+            if RERANKER == "local":
+                # A wide, unreranked candidate list; the local reranker picks the top n.
+                return self.llama_index().as_retriever(
+                    dense_similarity_top_k=RERANK_CANDIDATES,
+                    sparse_similarity_top_k=RERANK_CANDIDATES,
+                    alpha=0.5,
+                    enable_reranking=False,
+                    top_k=RERANK_CANDIDATES,
+                )
+            return self.llama_index().as_retriever(
+                dense_similarity_top_k=3,
+                sparse_similarity_top_k=3,
+                alpha=0.5,
+                enable_reranking=True,
+                rerank_top_n=3,
+                top_n=3,
+                top_k=3,
+            )
+
+        return self._get_or_create("llama_retriever", build)
+
+    def local_retriever(self):
+        def build():
+            from retrieval.hybrid_retriever import LocalHybridRetriever
+            return LocalHybridRetriever(
+                embed_query=self.embedding_service().embed_query,
+                alpha=0.5,
+                top_k=3,
+            )
+
+        retriever = self._get_or_create("local_retriever", build)
+
+        # A re-index (python -m retrieval.hybrid_retriever) swaps in a new store
+        # version; load it, and drop the answers cached from the old one.
+        from ingestion.chunk_store import current_version_dir
+        if retriever.store.version_dir != current_version_dir(retriever.store.store_dir):
+            self.reload("local_retriever")
+            self.answer_cache().invalidate()
+            retriever = self._get_or_create("local_retriever", build)
+        return retriever
+
+    def reranker(self):
+        def build():
+            import torch
+            from sentence_transformers import CrossEncoder
+            from retrieval.reranker import CrossEncoderReranker
+
+            # Keeps Streamlit's file watcher from walking torch.classes.
+            torch.classes.__path__ = []
+
+            model = CrossEncoder(RERANK_MODEL, max_length=512, device="cpu")
+            return CrossEncoderReranker(
+                score_pairs=lambda pairs: model.predict(pairs, batch_size=RERANK_BATCH_SIZE, convert_to_numpy=True, show_progress_bar=False),
+                model_name=RERANK_MODEL,
+                batch_size=RERANK_BATCH_SIZE,
+            )
+
+        return self._get_or_create("reranker", build)
+
+    def lightrag(self):
+        def build():
+            from rag.rag_agent_func import rag
+            return rag()
+
+        return self._get_or_create("lightrag", build)
+
+    def groq_client(self):
+        def build():
+            from groq import Groq
+            groq_api_key = os.getenv('GROQ_API_KEY')
+            return Groq(api_key=groq_api_key) if groq_api_key else Groq()
+
+        return self._get_or_create("groq_client", build)
+
+    def async_groq_client(self):
+        def build():
+            from groq import AsyncGroq
+            groq_api_key = os.getenv('GROQ_API_KEY')
+            return AsyncGroq(api_key=groq_api_key) if groq_api_key else AsyncGroq()
+
+        return self._get_or_create("async_groq_client", build)
+
+    def async_http_client(self):
+        # Pooled connections for plain HTTP APIs (e.g. Ragie); used on the shared event loop.
+        def build():
+            import httpx
+            return httpx.AsyncClient(timeout=30)
+
+        return self._get_or_create("async_http_client", build)
+
+    def llm_router(self, model="gemini-1.5-flash", max_output_tokens=500, primary="gemini"):
+        # One router per primary provider and model, so each keeps its own
+        # latency and error history. Gemini primaries fail over to Groq; the
+        # Groq backend's router (primary="groq") fails over to Gemini. Both
+        # providers get the same output limit.
+        def build():
+            from common.llm_router import LLMRouter, gemini_provider, groq_provider
+            limiter = self.rate_limiter()
+            if primary == "groq":
+                providers = [groq_provider(self.async_groq_client(), model, max_completion_tokens=max_output_tokens, limiter=limiter)]
+                if os.getenv('GOOGLE_API_KEY'):
+                    providers.append(gemini_provider(self.genai_client(), GROQ_FALLBACK_MODEL, max_output_tokens=max_output_tokens, limiter=limiter))
+                return LLMRouter(providers, hedge_after=LLM_HEDGE_AFTER)
+
+            providers = [gemini_provider(self.genai_client(), model, max_output_tokens=max_output_tokens, limiter=limiter)]
+            if os.getenv('GROQ_API_KEY'):
+                providers.append(groq_provider(self.async_groq_client(), LLM_FALLBACK_MODEL, max_completion_tokens=max_output_tokens, limiter=limiter))
+            return LLMRouter(providers, hedge_after=LLM_HEDGE_AFTER)
+
+        return self._get_or_create(("llm_router", primary, model, max_output_tokens), build)
+
+    def rate_limiter(self):
+        # Shared by every agent and ingestion, so the quota is counted once per process.
+        def build():
+            from common.rate_limiter import RateLimiter
+            return RateLimiter(LLM_RATE_LIMITS)
+
+        return self._get_or_create("rate_limiter", build)
+
+    def cag_context_cache(self):
+        def build():
+            from cag.cag_agent import CAG_SYSTEM_INSTRUCTION
+            from cag.context_cache import CorpusContextCache
+            return CorpusContextCache(
+                self.genai_client(), CAG_MODEL, CAG_SYSTEM_INSTRUCTION, ttl=CAG_CACHE_TTL,
+                # Answers cached from the old corpus may be stale.
+                on_change=lambda: self.answer_cache().invalidate(),
+            )
+
+        return self._get_or_create("cag_context_cache", build)
+
+    def firecrawl(self):
+        def build():
+            from firecrawl import FirecrawlApp
+            return FirecrawlApp(api_key=os.getenv('FIRECRAWL_API_KEY'))
+
+        return self._get_or_create("firecrawl", build)
+
+    def answer_cache(self):
+        def build():
+            from common.answer_cache import SemanticAnswerCache
+            return SemanticAnswerCache(
+                embed=lambda text: self.embedding_service().embed_query(text),
+                threshold=ANSWER_CACHE_THRESHOLD,
+                ttl=ANSWER_CACHE_TTL,
+                max_entries=ANSWER_CACHE_SIZE,
+            )
+
+        return self._get_or_create("answer_cache", build)
+
+    def intent_router(self):
+        def build():
+            from common.intent_router import IntentRouter
+            service = self.embedding_service()
+            return IntentRouter(
+                embed=lambda texts: service.embed(texts, persist=False),
+                intent_threshold=INTENT_THRESHOLD,
+                faq_threshold=FAQ_THRESHOLD,
+            )
+
+        return self._get_or_create("intent_router", build)
+
+    def history_manager(self):
+        def build():
+            from common.history import HistoryManager
+            from common.rate_limiter import lane, INGESTION
+
+            async def summarize(prompt):
+                # Same quota and failover as chat generation; runs in the
+                # background, so it queues behind chat requests.
+                with lane(INGESTION):
+                    return await self.llm_router("gemini-1.5-flash", max_output_tokens=300).generate(prompt)
+
+            return HistoryManager(
+                summarize=summarize,
+                keep_messages=HISTORY_KEEP_MESSAGES,
+                token_budget=HISTORY_TOKEN_BUDGET,
+            )
+
+        return self._get_or_create("history_manager", build)
+
+    def chat_writer(self, connection):
+        # One writer (and background thread) per process, shared by all sessions.
+        def build():
+            from common.chat_store import ChatHistoryWriter
+            return ChatHistoryWriter(connection)
+
+        return self._get_or_create("chat_writer", build)
+
+    def warm_up(self, names=DEFAULT_WARM_UP):
+        """Build the named resources now so the first chat message does not pay for them."""
+        for name in names:
+            getattr(self, name)()
+        return self
+
+    def reload(self, *names):
+        """Drop cached resources (all of them when no names are given) so they are rebuilt on next use."""
+        with self._lock:
+            if not names:
+                self._resources.clear()
+                return
+
+            for key in list(self._resources):
+                base = key[0] if isinstance(key, tuple) else key
+                if base in names:
+                    del self._resources[key]
+
+    def stats(self):
+        """stats() / metrics() of every loaded resource that has one, for the metrics export and admin page."""
+        with self._lock:
+            resources = list(self._resources.items())
+
+        stats = {}
+        for key, resource in resources:
+            for attr in ("stats", "metrics"):
+                collect = getattr(resource, attr, None)
+                if callable(collect):
+                    name = "_".join(str(part) for part in key) if isinstance(key, tuple) else key
+                    stats[name] = collect()
+                    break
+        return stats
+
+    def loaded(self):
+        with self._lock:
+            return [key[0] if isinstance(key, tuple) else key for key in self._resources]
+
+
+_registry = ResourceRegistry()
+
+
+def get_registry():
+    return _registry
@@ -0,0 +1,234 @@
+import re
+import time
+import uuid
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+
+# Seconds; from a cache hit up to a slow generation.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Histogram:
+    """Cumulative-bucket histogram (Prometheus style) plus a window of recent samples for percentiles."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS, window=1000):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, value):
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+        self.recent.append(value)
+
+    def percentile(self, q):
+        return float(np.percentile(self.recent, q)) if self.recent else None
+
+
+class Telemetry:
+    """
+    In-process spans, counters and log events for the chat pipeline.
+
+    `span(name)` times a block. Its duration goes into the `name` latency
+    histogram, and the finished span, with its trace and parent ids, into a
+    ring of recent spans. Spans nest across awaits and asyncio.to_thread,
+    which copy the context. `count` increments labelled counters (tokens,
+    cache hits, retries), and `log` records an event and prints it.
+
+    `prometheus()` renders everything in the Prometheus text format (served by
+    `serve_metrics`), and `snapshot()` is what the admin page shows.
+    """
+
+    def __init__(self, recent_spans=500, recent_events=200):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self.spans = deque(maxlen=recent_spans)
+        self.events = deque(maxlen=recent_events)
+
+    @contextmanager
+    def span(self, name, **attrs):
+        parent = _current_span.get()
+        span = {
+            "name": name,
+            "trace": parent["trace"] if parent else uuid.uuid4().hex[:16],
+            "id": uuid.uuid4().hex[:8],
+            "parent": parent["id"] if parent else None,
+            "start": time.time(),
+            **attrs,
+        }
+        token = _current_span.set(span)
+        start = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            span["error"] = type(e).__name__
+            self.count("errors_total", stage=name)
+            raise
+        finally:
+            _current_span.reset(token)
+            span["duration"] = time.perf_counter() - start
+            labels = {key: value for key, value in attrs.items() if key == "backend"}
+            self.observe(name, span["duration"], **labels)
+            with self._lock:
+                self.spans.append(span)
+
+    def observe(self, stage, seconds, **labels):
+        key = (stage, _labels(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def count(self, name, value=1, **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def log(self, event, **fields):
+        parent = _current_span.get()
+        record = {"time": time.time(), "event": event, "trace": parent["trace"] if parent else None, **fields}
+        with self._lock:
+            self.events.append(record)
+        print(f"[{event}] " + " ".join(f"{key}={value}" for key, value in fields.items()))
+
+    def snapshot(self):
+        with self._lock:
+            histograms = [
+                {
+                    "stage": stage,
+                    "labels": dict(labels),
+                    "buckets": list(zip([*histogram.buckets, float("inf")], histogram.counts)),
+                    "count": histogram.count,
+                    "sum": histogram.sum,
+                    "p50": histogram.percentile(50),
+                    "p95": histogram.percentile(95),
+                    "p99": histogram.percentile(99),
+                }
+                for (stage, labels), histogram in sorted(self._histograms.items())
+            ]
+            counters = [{"name": name, "labels": dict(labels), "value": value} for (name, labels), value in sorted(self._counters.items())]
+            return {"histograms": histograms, "counters": counters, "spans": list(self.spans), "events": list(self.events)}
+
+    def prometheus(self, gauges=None):
+        """
+        Prometheus text exposition: stage latency histograms, counters, and
+        `gauges` ({component: {stat: number}}, e.g. ResourceRegistry.stats()).
+        """
+        lines = ["# TYPE pti_stage_seconds histogram"]
+        with self._lock:
+            for (stage, labels), histogram in sorted(self._histograms.items()):
+                base = {"stage": stage, **dict(labels)}
+                cumulative = 0
+                for bound, count in zip([*histogram.buckets, "+Inf"], histogram.counts):
+                    cumulative += count
+                    lines.append(f"pti_stage_seconds_bucket{_render({**base, 'le': bound})} {cumulative}")
+                lines.append(f"pti_stage_seconds_sum{_render(base)} {histogram.sum:.6f}")
+                lines.append(f"pti_stage_seconds_count{_render(base)} {histogram.count}")
+
+            names = sorted({name for name, _ in self._counters})
+            for name in names:
+                lines.append(f"# TYPE pti_{name} counter")
+                for (counter, labels), value in sorted(self._counters.items()):
+                    if counter == name:
+                        lines.append(f"pti_{name}{_render(dict(labels))} {value}")
+
+        for component, stats in sorted((gauges or {}).items()):
+            for stat, value in sorted(_flatten(stats).items()):
+                metric = f"pti_{_metric_name(component)}_{_metric_name(stat)}"
+                lines.append(f"# TYPE {metric} gauge")
+                lines.append(f"{metric} {float(value)}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self.spans.clear()
+            self.events.clear()
+
+
+def _labels(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _render(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"') for value in labels.values())
+    return "{" + ",".join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + "}"
+
+
+def _metric_name(text):
+    return re.sub(r"[^a-zA-Z0-9_]", "_", str(text)).strip("_").lower()
+
+
+def _flatten(stats, prefix=""):
+    # Nested stats dicts become a_b keys; only numbers are exported.
+    flat = {}
+    for key, value in stats.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{name}_"))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool) and value == value:
+            flat[name] = value
+    return flat
+
+
+_servers = {}
+_servers_lock = threading.Lock()
+
+
+def serve_metrics(port, collect=None, host="0.0.0.0"):
+    """
+    Serve GET /metrics in the Prometheus text format on a daemon thread;
+    `collect()` returns extra gauges. Once per port: calling it again (e.g. a
+    cleared st.cache_resource) returns the running server with the new `collect`.
+    """
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = get_telemetry().prometheus(self.server.collect() if self.server.collect else None).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    with _servers_lock:
+        server = _servers.get((host, port))
+        if server is not None:
+            server.collect = collect
+            return server
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        server.collect = collect
+        _servers[(host, port)] = server
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
+
+
+_telemetry = Telemetry()
+
+
+def get_telemetry():
+    return _telemetry
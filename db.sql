@@ -7,4 +7,7 @@ create table chat_history (
 );
 
 -- Optional: Index for faster queries by user
-create index idx_chat_history_user_id on chat_history(user_id);
\ No newline at end of file
+create index idx_chat_history_user_id on chat_history(user_id);
+
+-- Serves paginated history loading (latest page first, keyset on timestamp, id)
+create index idx_chat_history_user_id_timestamp on chat_history(user_id, timestamp desc, id desc);
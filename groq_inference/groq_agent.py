@@ -1,52 +1,103 @@
 import os
+import json
+import time
+import asyncio
 from dotenv import load_dotenv
 import requests
-from groq import Groq
+from common.registry import get_registry, RETRIEVAL_BACKEND, RERANKER, RERANK_CANDIDATES, RERANK_TOP_N, GROQ_MODEL
+from retrieval.hybrid_retriever import format_chunks
+from common.history import format_history
+from common.event_loop import run, iterate
+from common.telemetry import get_telemetry
 
 
 # Load environment variables from .env file
 load_dotenv()
 
+RAGIE_RETRIEVALS_URL = os.getenv("RAGIE_BASE_URL", "https://api.ragie.ai").rstrip("/") + "/retrievals"
+
 class GroqAgent:
 
-    def __init__(self, prompt, conversation_history=[]):
+    def __init__(self, prompt=None, conversation_history=[], stream=False):
         self.prompt = prompt
+        self.rag_response = None
+        self.rag_response_stream = None
+        # Set when the reply is an error message, so it is not cached or saved.
+        self.failed = False
+
+        # Seconds spent in each pipeline stage for this message.
+        self.timings = {}
 
         # Call Groq chat completions with browser_search tool (see user-provided example)
-        groq_api_key = os.getenv('GROQ_API_KEY')
         ragie_api_key = os.getenv('RAGIE_API_KEY')
 
-        self.groq_client = Groq(api_key=groq_api_key) if groq_api_key else Groq()
+        registry = get_registry()
+        # Groq first, hedged and failed over to Gemini on 429/5xx (common/llm_router.py).
+        self.router = registry.llm_router(GROQ_MODEL, max_output_tokens=1024, primary="groq")
         self.ragie_api_key = ragie_api_key if ragie_api_key else None
 
+        # Without a prompt the agent is only set up; call `await agent.answer(...)`.
+        if prompt is None:
+            return
 
+        # The pipeline itself is async and runs on the shared event loop.
         try:
-            ragie_response = self.retrieve_context(prompt)
+            if stream:
+                # rag_response is set once the caller has consumed the stream.
+                better_prompt = run(self.prepare(prompt, conversation_history))
+                self.rag_response_stream = iterate(self.stream_response(better_prompt))
+            else:
+                run(self.answer(prompt, conversation_history))
+
+        except Exception as e:
+            get_telemetry().log("agent_error", backend="groq", error=e)
+            self.failed = True
+            self.rag_response = "An unexpected error occurred. please try again later ☹️!"
 
-            # Prepare messages for Groq chat completion
-            messages = [
-                {"role": "system", "content": "You are PTI assistant specializing in PTI Computer Science Department. Use PTI official site and other reliable web sources when available. If uncertain, say so and offer to look it up."},
-                {"role": "assistant", "content": ragie_response},
-                *conversation_history,
-                {"role": "user", "content": prompt}
-            ]
+        if stream and self.rag_response_stream is None:
+            self.rag_response_stream = iter([self.rag_response])
 
-            better_prompt = self.create_prompt_with_context(prompt, ragie_response, conversation_history)
 
-            answer = self.answer_query(better_prompt)
-            self.rag_response = answer
+    async def answer(self, prompt, conversation_history=[]):
+        better_prompt = await self.prepare(prompt, conversation_history)
+        start = time.perf_counter()
+        with get_telemetry().span("generate", backend="groq"):
+            self.rag_response = await self.aanswer_query(better_prompt)
+        self.timings["generate"] = time.perf_counter() - start
+        return self.rag_response
 
-        except Exception as e:
-            print(f"An unexpected error occurred: {e}")
-            self .rag_response = "An unexpected error occurred. please try again later ☹️!"
+
+    async def answer_stream(self, prompt, conversation_history=[]):
+        better_prompt = await self.prepare(prompt, conversation_history)
+        async for chunk in self.stream_response(better_prompt):
+            yield chunk
+
+
+    async def prepare(self, prompt, conversation_history=[]):
+        self.prompt = prompt
+        telemetry = get_telemetry()
+
+        start = time.perf_counter()
+        with telemetry.span("retrieve", backend="groq"):
+            ragie_response = await self.aretrieve_context(prompt)
+        self.timings["retrieve"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        with telemetry.span("prompt", backend="groq"):
+            messages = self.create_prompt_with_context(prompt, ragie_response, conversation_history)
+        self.timings["prompt"] = time.perf_counter() - start
+        return messages
         
 
 
     def retrieve_context(self, query):
+        if RETRIEVAL_BACKEND == "local":
+            return format_chunks(self.local_chunks(query))
+
         try:
-            url = "https://api.ragie.ai/retrievals"
+            url = RAGIE_RETRIEVALS_URL
 
-            payload = { "query": query, "top_k": 1 }
+            payload = { "query": query, "top_k": self.ragie_top_k() }
             headers = {
                 "accept": "application/json",
                 "content-type": "application/json",
@@ -55,36 +106,105 @@ class GroqAgent:
 
             response = requests.post(url, json=payload, headers=headers)
 
-            print(response.text)
-
-            return response.text
+            return self.rerank_ragie(query, response.text)
         
         except Exception:
             pass
+
+
+    async def aretrieve_context(self, query):
+        if RETRIEVAL_BACKEND == "local":
+            # CPU-bound (query embedding + scoring); keep it off the event loop.
+            chunks = await asyncio.to_thread(self.local_chunks, query)
+            return format_chunks(chunks)
+
+        try:
+            payload = { "query": query, "top_k": self.ragie_top_k() }
+            headers = {
+                "accept": "application/json",
+                "content-type": "application/json",
+                'Authorization': f'Bearer {self.ragie_api_key}'
+            }
+
+            response = await get_registry().async_http_client().post(RAGIE_RETRIEVALS_URL, json=payload, headers=headers)
+
+            return await asyncio.to_thread(self.rerank_ragie, query, response.text)
+
+        except Exception as e:
+            get_telemetry().log("retrieval_error", backend="groq", error=e)
+            return ""
+
+
+    def local_chunks(self, query):
+        if RERANKER != "local":
+            return get_registry().local_retriever().retrieve(query)
+
+        chunks = get_registry().local_retriever().retrieve(query, RERANK_CANDIDATES)
+        with get_telemetry().span("rerank", backend="groq"):
+            return [chunk for chunk, _ in get_registry().reranker().rerank(query, chunks, RERANK_TOP_N)]
+
+
+    def ragie_top_k(self):
+        # Ragie's single best chunk, or a wider list for the local reranker.
+        return RERANK_CANDIDATES if RERANKER == "local" else 1
+
+
+    def rerank_ragie(self, query, response_text):
+        if RERANKER != "local":
+            return response_text
+
+        chunks = json.loads(response_text).get("scored_chunks", [])
+        with get_telemetry().span("rerank", backend="groq"):
+            ranked = get_registry().reranker().rerank(query, chunks, RERANK_TOP_N, key=lambda chunk: chunk.get("id") or chunk["text"])
+        return json.dumps({"scored_chunks": [{**chunk, "score": score} for chunk, score in ranked]})
  
     
     def answer_query(self, query):
+        # Sync callers share the async path, so they count against the same quota.
+        return run(self.aanswer_query(query))
+
+
+    async def aanswer_query(self, query):
         try:
-            chat_completion = self.groq_client.chat.completions.create(
-                messages=query,
-                # model="openai/gpt-oss-20b",
-                model="groq/compound",
-                temperature=0.2,
-                max_completion_tokens=1024,
-                # tool_choice="required",
-                # tools=[
-                #     {
-                #         "type": "browser_search"
-                #     }
-                # ]
-            )
-            assistant_reply = chat_completion.choices[0].message.content
-            return assistant_reply
+            # The router acquires the quota and counts tokens for whichever provider answers.
+            system, prompt = self.split_messages(query)
+            return await self.router.generate(prompt, system=system)
         except Exception as e:
-            assistant_reply = "Sorry — I couldn't complete that request. Error: {}".format(str(e))
-            return assistant_reply
+            self.failed = True
+            return "Sorry — I couldn't complete that request. Error: {}".format(str(e))
     
 
+    async def aanswer_query_stream(self, query):
+        try:
+            system, prompt = self.split_messages(query)
+            async for chunk in self.router.stream(prompt, system=system):
+                yield chunk
+        except Exception as e:
+            self.failed = True
+            yield "Sorry — I couldn't complete that request. Error: {}".format(str(e))
+
+
+    async def stream_response(self, query):
+        start = time.perf_counter()
+        chunks = []
+        async for chunk in self.aanswer_query_stream(query):
+            if not chunks:
+                self.timings["first_token"] = time.perf_counter() - start
+                get_telemetry().observe("first_token", self.timings["first_token"], backend="groq")
+            chunks.append(chunk)
+            yield chunk
+        self.timings["generate"] = time.perf_counter() - start
+        get_telemetry().observe("generate", self.timings["generate"], backend="groq")
+        self.rag_response = "".join(chunks)
+
+
+    def split_messages(self, messages):
+        # Router providers take (prompt, system): the system message, then the rest as one user turn.
+        system = "\n\n".join(message["content"] for message in messages if message["role"] == "system")
+        prompt = "\n\n".join(message["content"] for message in messages if message["role"] != "system")
+        return system or None, prompt
+
+
     def create_prompt_with_context(self, user_input, query, history):
         prompt = """
             Act as a highly reliable and meticulous research assistant and a helpful guide for the Petroleum Training Institute (PTI). Your primary goal is to provide data that is verifiably accurate and sourced from official channels, and your provided context documents, whenever possible.
@@ -133,7 +253,7 @@ class GroqAgent:
             },
             {
                 "role": "assistant",
-                "content": "**Conversation History:** " + str(history)
+                "content": "**Conversation History:** " + format_history(history)
             },
             {
                 "role": "user", 
@@ -0,0 +1,198 @@
+import os
+import json
+import time
+import shutil
+import numpy as np
+
+from ingestion.chunker import chunk_page
+from ingestion.stream_ingest import iter_pages
+
+
+CHUNK_STORE_DIR = os.path.abspath('./data/local_index')
+
+EMBEDDINGS_FILE = "embeddings.npy"
+# Chunk metadata is columnar Parquet when pyarrow is available (it ships with
+# streamlit); otherwise, and for stores built before this format, JSON lines.
+METADATA_FILE = "chunks.parquet"
+FALLBACK_METADATA_FILE = "chunks.jsonl"
+COLUMNS = ("id", "url", "heading", "text", "tokens")
+# Names the version directory holding the current embeddings and metadata.
+CURRENT_FILE = "CURRENT"
+
+
+def current_version_dir(store_dir=CHUNK_STORE_DIR):
+    """Directory of the current store version; `store_dir` itself for stores written before versioning."""
+    try:
+        with open(os.path.join(store_dir, CURRENT_FILE), "r", encoding="utf-8") as file:
+            return os.path.join(store_dir, file.read().strip())
+    except FileNotFoundError:
+        return store_dir
+
+
+def write_chunk_store(chunks, embeddings, store_dir=CHUNK_STORE_DIR):
+    """
+    Persist chunks and their embeddings: a normalized float32 .npy matrix
+    (row i is chunk i) plus the metadata columns. Both go into a new version
+    directory, and one rename of the CURRENT pointer switches readers to it,
+    so a running app never maps a half-written store or mixes two versions.
+    """
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+    previous = current_version_dir(store_dir)
+    version = f"v{time.time_ns()}"
+    version_dir = os.path.join(store_dir, version)
+    os.makedirs(version_dir)
+
+    with open(os.path.join(version_dir, EMBEDDINGS_FILE), "wb") as file:
+        np.save(file, matrix)
+
+    columns = {column: [chunk.get(column, "") for chunk in chunks] for column in COLUMNS}
+    columns["id"] = list(range(len(chunks)))
+
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        pq = None
+
+    if pq is not None:
+        table = pa.table({
+            "id": pa.array(columns["id"], type=pa.int32()),
+            "url": pa.array(columns["url"], type=pa.string()).dictionary_encode(),
+            "heading": pa.array(columns["heading"], type=pa.string()),
+            "text": pa.array(columns["text"], type=pa.string()),
+            "tokens": pa.array(columns["tokens"], type=pa.int32()),
+        })
+        pq.write_table(table, os.path.join(version_dir, METADATA_FILE), compression="zstd")
+    else:
+        with open(os.path.join(version_dir, FALLBACK_METADATA_FILE), "w", encoding="utf-8") as file:
+            for row in zip(*(columns[column] for column in COLUMNS)):
+                file.write(json.dumps(dict(zip(COLUMNS, row)), ensure_ascii=False) + "\n")
+
+    pointer = os.path.join(store_dir, CURRENT_FILE)
+    with open(pointer + ".tmp", "w", encoding="utf-8") as file:
+        file.write(version)
+    os.replace(pointer + ".tmp", pointer)
+
+    # The previous version stays for readers that opened it just before the
+    # swap; older ones (and a pre-versioning layout) are removed.
+    keep = {version, os.path.basename(previous)}
+    for name in os.listdir(store_dir):
+        path = os.path.join(store_dir, name)
+        if name.startswith("v") and name not in keep and os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        elif name in (EMBEDDINGS_FILE, METADATA_FILE, FALLBACK_METADATA_FILE) and previous != store_dir:
+            os.remove(path)
+
+
+def build_chunk_store(embed, filename=None, store_dir=CHUNK_STORE_DIR, batch_size=64, **chunk_options):
+    """
+    Chunk the corpus along its markdown structure (see ingestion.chunker),
+    embed every chunk and write the store. Returns the number of chunks.
+
+    `embed` takes a list of texts and returns an (n, dim) array.
+    """
+    chunks = [chunk for url, markdown in iter_pages(filename) for chunk in chunk_page(url, markdown, **chunk_options)]
+
+    embeddings = []
+    for start in range(0, len(chunks), batch_size):
+        batch = [chunk["text"] for chunk in chunks[start:start + batch_size]]
+        embeddings.append(np.asarray(embed(batch), dtype=np.float32))
+
+    write_chunk_store(chunks, np.vstack(embeddings), store_dir)
+    return len(chunks)
+
+
+def corpus_diff(store, filename=None, **chunk_options):
+    """
+    Compare the store with the corpus as it is now (the cleaned one when it
+    exists): pages whose chunks differ are "changed". Diffing the chunks
+    rather than applying the crawl diff also catches pages that preprocessing
+    changed without a re-crawl (boilerplate and near-duplicate choices).
+    Returns ({"added", "changed", "removed"}, {url: chunks} for added and changed pages).
+    """
+    stored = {}
+    for url, text in zip(store.columns["url"], store.columns["text"]):
+        stored.setdefault(url, []).append(text)
+
+    diff = {"added": [], "changed": [], "removed": []}
+    fresh = {}
+    seen = set()
+    for url, markdown in iter_pages(filename):
+        if url in seen:
+            continue
+        seen.add(url)
+        chunks = chunk_page(url, markdown, **chunk_options)
+        if url not in stored:
+            diff["added"].append(url)
+        elif [chunk["text"] for chunk in chunks] != stored[url]:
+            diff["changed"].append(url)
+        else:
+            continue
+        fresh[url] = chunks
+
+    diff["removed"] = [url for url in stored if url not in seen]
+    return diff, fresh
+
+
+def update_chunk_store(embed, filename=None, store_dir=CHUNK_STORE_DIR, batch_size=64, **chunk_options):
+    """
+    Bring an existing store up to date with the corpus (see corpus_diff):
+    chunks of removed and changed pages are dropped, and only added and
+    changed pages are embedded again. Returns (chunks kept, chunks embedded, diff).
+    """
+    store = ChunkStore(store_dir)
+    diff, pages = corpus_diff(store, filename, **chunk_options)
+    affected = set(diff["changed"]) | set(diff["removed"])
+    keep = [i for i, url in enumerate(store.columns["url"]) if url not in affected]
+    fresh = [chunk for chunks in pages.values() for chunk in chunks]
+
+    embeddings = [np.asarray(store.embeddings[keep], dtype=np.float32)]
+    for start in range(0, len(fresh), batch_size):
+        batch = [chunk["text"] for chunk in fresh[start:start + batch_size]]
+        embeddings.append(np.asarray(embed(batch), dtype=np.float32))
+
+    if not fresh and not affected:
+        return len(keep), 0, diff
+
+    chunks = [store[i] for i in keep] + fresh
+    write_chunk_store(chunks, np.vstack(embeddings), store_dir)
+    return len(keep), len(fresh), diff
+
+
+class ChunkStore:
+    """
+    Read side of the chunk store. Embeddings are memory-mapped, so every
+    process (and backend) loading the same store shares one copy in the page
+    cache; metadata is loaded column by column.
+    """
+
+    def __init__(self, store_dir=CHUNK_STORE_DIR):
+        self.store_dir = store_dir
+        # Both files come from the same version directory, read once here.
+        self.version_dir = version_dir = current_version_dir(store_dir)
+        self.embeddings = np.load(os.path.join(version_dir, EMBEDDINGS_FILE), mmap_mode="r")
+
+        parquet = os.path.join(version_dir, METADATA_FILE)
+        if os.path.exists(parquet):
+            import pyarrow.parquet as pq
+            table = pq.read_table(parquet, memory_map=True)
+            self.columns = {column: table.column(column).to_pylist() for column in table.column_names}
+        else:
+            with open(os.path.join(version_dir, FALLBACK_METADATA_FILE), "r", encoding="utf-8") as file:
+                rows = [json.loads(line) for line in file]
+            self.columns = {column: [row.get(column, "") for row in rows] for column in COLUMNS}
+
+        if len(self.columns["text"]) != len(self.embeddings):
+            raise ValueError(f"Chunk store {store_dir} is inconsistent: {len(self.columns['text'])} chunks, {len(self.embeddings)} embeddings")
+
+    def __len__(self):
+        return len(self.columns["text"])
+
+    def __getitem__(self, i):
+        return {column: values[i] for column, values in self.columns.items()}
+
+    @property
+    def texts(self):
+        return self.columns["text"]
@@ -0,0 +1,185 @@
+import re
+
+from common.history import estimate_tokens
+
+
+# LightRAG splits inserted documents on this, so it indexes our chunks as-is.
+CHUNK_SEPARATOR = "\n\n<|chunk|>\n\n"
+
+_HEADING = re.compile(r"^\s{0,3}(#{1,6})\s+(.*?)\s*#*\s*$")
+_FENCE = re.compile(r"^\s*(```|~~~)")
+_TABLE_ROW = re.compile(r"^\s*\|")
+_TABLE_RULE = re.compile(r"^\s*\|?\s*:?-{2,}")
+_LIST_ITEM = re.compile(r"^\s*(?:[-*+]|\d+[.)])\s+")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def parse_blocks(markdown):
+    """
+    Split markdown into (kind, text, heading path) blocks.
+
+    Kinds are "paragraph", "list", "table" and "code". Headings are not
+    blocks themselves; they update the heading path of the blocks after them.
+    """
+    headings = []
+    lines = []
+    kind = None
+    fence = None
+
+    def flush():
+        nonlocal lines, kind
+        if lines:
+            yield kind, "\n".join(lines).strip("\n"), tuple(text for _, text in headings)
+        lines, kind = [], None
+
+    for line in markdown.splitlines():
+        if fence is not None:
+            lines.append(line)
+            if line.strip().startswith(fence):
+                fence = None
+                yield from flush()
+            continue
+
+        match = _FENCE.match(line)
+        if match:
+            yield from flush()
+            fence, kind, lines = match.group(1), "code", [line]
+            continue
+
+        if not line.strip():
+            yield from flush()
+            continue
+
+        match = _HEADING.match(line)
+        if match:
+            yield from flush()
+            level = len(match.group(1))
+            headings = [(lvl, text) for lvl, text in headings if lvl < level]
+            if match.group(2):
+                headings.append((level, match.group(2)))
+            continue
+
+        line_kind = "table" if _TABLE_ROW.match(line) else "list" if _LIST_ITEM.match(line) else "paragraph"
+        # A table or list ends where other content starts; list items keep their continuation lines.
+        if kind is not None and kind != line_kind and not (kind == "list" and line_kind == "paragraph" and line[:1].isspace()):
+            yield from flush()
+        if kind is None:
+            kind = line_kind
+        lines.append(line)
+
+    yield from flush()
+
+
+def split_block(kind, text, max_tokens):
+    """Break one oversized block at the most natural boundary available."""
+    if estimate_tokens(text) <= max_tokens:
+        return [text]
+
+    lines = text.split("\n")
+    if kind == "table":
+        # Every piece of a table repeats its header row(s).
+        header = lines[:2] if len(lines) > 1 and _TABLE_RULE.match(lines[1]) else lines[:1]
+        pieces = _pack(lines[len(header):], max_tokens, prefix="\n".join(header))
+    elif kind == "list":
+        items = []
+        for line in lines:
+            if _LIST_ITEM.match(line) or not items:
+                items.append(line)
+            else:
+                items[-1] += "\n" + line
+        pieces = _pack(items, max_tokens)
+    elif len(lines) > 1:
+        pieces = _pack(lines, max_tokens)
+    else:
+        pieces = _pack(_SENTENCE_END.split(text), max_tokens, joiner=" ")
+
+    result = []
+    for piece in pieces:
+        if estimate_tokens(piece) <= max_tokens:
+            result.append(piece)
+        elif "\n" in piece or _SENTENCE_END.search(piece):
+            result.extend(split_block("paragraph", piece.replace("\n", " ") if kind != "code" else piece, max_tokens))
+        else:
+            # No boundary left; fall back to word windows.
+            result.extend(_pack(piece.split(" "), max_tokens, joiner=" "))
+    return result
+
+
+def _pack(parts, max_tokens, prefix="", joiner="\n"):
+    pieces = []
+    current = []
+    size = estimate_tokens(prefix) if prefix else 0
+    for part in parts:
+        part_size = estimate_tokens(part)
+        if current and size + part_size > max_tokens:
+            pieces.append(joiner.join(([prefix] if prefix else []) + current))
+            current, size = [], estimate_tokens(prefix) if prefix else 0
+        current.append(part)
+        size += part_size
+    if current:
+        pieces.append(joiner.join(([prefix] if prefix else []) + current))
+    return pieces
+
+
+def chunk_page(url, markdown, target_tokens=300, overlap_tokens=40, min_tokens=60):
+    """
+    Chunk one page along its markdown structure.
+
+    Blocks are packed into chunks of about `target_tokens` without crossing a
+    heading, except that a section smaller than `min_tokens` is merged into the
+    next one rather than left as a fragment. Consecutive chunks of the same
+    section share up to `overlap_tokens` of trailing blocks. Oversized blocks
+    are split on table rows (repeating the header), list items, lines,
+    sentences and finally words.
+
+    Returns dicts with "url", "heading" (the heading path joined by " > "),
+    "text" (heading path line + body) and "tokens".
+    """
+    chunks = []
+    current = []
+    heading = None
+
+    def emit():
+        if not current:
+            return
+        body = "\n\n".join(current)
+        text = f"{heading}\n\n{body}" if heading else body
+        chunks.append({"url": url, "heading": heading or "", "text": text, "tokens": estimate_tokens(text)})
+
+    def size():
+        return sum(estimate_tokens(piece) for piece in current)
+
+    section = None
+    for kind, text, path in parse_blocks(markdown):
+        path = " > ".join(path) or None
+
+        if path != section:
+            section = path
+            if current and size() >= min_tokens:
+                emit()
+                current = []
+            elif current and path:
+                # Too small to stand alone: keep the sub-heading inline and carry on.
+                current.append(path.split(" > ")[-1])
+            if not current:
+                heading = section
+
+        for piece in split_block(kind, text, target_tokens):
+            if current and size() + estimate_tokens(piece) > target_tokens:
+                emit()
+                overlap = []
+                for previous in reversed(current):
+                    if sum(estimate_tokens(p) for p in overlap) + estimate_tokens(previous) > overlap_tokens:
+                        break
+                    overlap.insert(0, previous)
+                current = overlap
+                heading = section
+            current.append(piece)
+
+    emit()
+    return chunks
+
+
+def chunk_document(url, markdown, **options):
+    """The page as one LightRAG document whose chunks are ours, separated by CHUNK_SEPARATOR."""
+    return CHUNK_SEPARATOR.join(f"url: {url}\n{chunk['text']}" for chunk in chunk_page(url, markdown, **options))
@@ -0,0 +1,268 @@
+"""
+Incremental re-crawl of the PTI site.
+
+    python -m ingestion.crawler
+    python -m ingestion.crawler --urls-file urls.txt --scraper raw \
+        --corpus /tmp/corpus.json --manifest /tmp/crawl_manifest.jsonl --diff /tmp/crawl_diff.json
+
+Instead of batch-scraping every link on every run, each URL is fetched with
+a conditional GET (If-None-Match / If-Modified-Since from the last crawl).
+Only pages that are new, or whose visible content actually changed, are
+scraped to markdown (one Firecrawl call each). The corpus JSON is updated in
+place and the run's diff ({"added", "changed", "removed"}) is written next to
+it as a report. The indexes diff against the preprocessed corpus themselves
+(python -m retrieval.hybrid_retriever --update).
+
+A run that would remove more than half of the corpus is refused, since that
+is far more likely a wrong URL list than a site that lost half its pages.
+"""
+import os
+import re
+import json
+import asyncio
+import hashlib
+import argparse
+import datetime
+
+from common.event_loop import run
+from ingestion.stream_ingest import DATA_DIR, iter_pages
+
+
+SITE_URL = "https://pti.edu.ng"
+CRAWL_MANIFEST_PATH = os.path.abspath('./data/crawl_manifest.jsonl')
+CRAWL_DIFF_PATH = os.path.abspath('./data/crawl_diff.json')
+
+_SCRIPT = re.compile(r"<(script|style|noscript)\b.*?</\1\s*>", re.I | re.S)
+_TAG = re.compile(r"<[^>]+>")
+
+
+def fingerprint(body, content_type=""):
+    """
+    Hash of what a reader would see. For HTML, scripts and tags are dropped
+    first, because pages embed per-request nonces (captcha iframes, CSRF
+    tokens) that would otherwise make every page look changed.
+    """
+    if "html" in content_type:
+        text = _TAG.sub(" ", _SCRIPT.sub(" ", body.decode("utf-8", errors="replace")))
+        body = " ".join(text.split()).encode("utf-8")
+    return hashlib.sha256(body).hexdigest()
+
+
+class CrawlManifest:
+    """
+    Append-only JSONL record of every URL's last crawl: {"url", "etag",
+    "last_modified", "hash", "status", "crawled_at"}. The last line for a URL
+    wins (same layout as the ingestion manifest).
+    """
+
+    def __init__(self, path=CRAWL_MANIFEST_PATH):
+        self.path = path
+        self.entries = {}
+
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    self.entries[entry["url"]] = entry
+
+    def active(self):
+        return {url for url, entry in self.entries.items() if entry["status"] != "removed"}
+
+    def record(self, entries):
+        now = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as file:
+            for entry in entries:
+                entry = {**entry, "crawled_at": now}
+                self.entries[entry["url"]] = entry
+                file.write(json.dumps(entry) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+
+
+def firecrawl_discover(base_url=SITE_URL):
+    from common.registry import get_registry
+    return get_registry().firecrawl().map_url(base_url).get('links')[1:]
+
+
+async def firecrawl_scrape(url, response):
+    from common.registry import get_registry
+    # The Firecrawl SDK is synchronous; keep it off the event loop.
+    result = await asyncio.to_thread(get_registry().firecrawl().scrape_url, url, {'formats': ['markdown']})
+    return result['markdown']
+
+
+async def raw_scrape(url, response):
+    """Use the fetched body as the page text (local stand-ins, plain text and markdown pages)."""
+    return response.text
+
+
+async def acrawl(
+    urls,
+    scrape=firecrawl_scrape,
+    corpus_path=DATA_DIR,
+    manifest_path=CRAWL_MANIFEST_PATH,
+    diff_path=CRAWL_DIFF_PATH,
+    concurrency=8,
+    client=None,
+    max_removed_fraction=0.5,
+    allow_mass_removal=False,
+):
+    """
+    Re-crawl `urls` (the site's full current listing) and update the corpus.
+    Returns the diff.
+
+    Pages already in the corpus but unknown to the manifest (the first run
+    after a full scrape) are adopted: their validators and hash are recorded
+    without scraping them again. Fetch errors keep the previous version; only
+    404/410 responses and URLs that disappeared from `urls` count as removed.
+
+    Raises RuntimeError, and writes nothing, when more than
+    `max_removed_fraction` of the corpus would be removed, unless
+    `allow_mass_removal` is set.
+    """
+    import httpx
+
+    manifest = CrawlManifest(manifest_path)
+    corpus = dict(iter_pages(corpus_path)) if os.path.exists(corpus_path) else {}
+    corpus_size = len(corpus)
+    urls = list(dict.fromkeys(urls))
+
+    diff = {"added": [], "changed": [], "removed": [], "unchanged": 0, "errors": []}
+    entries = []
+    semaphore = asyncio.Semaphore(concurrency)
+    own_client = client is None
+    client = client or httpx.AsyncClient(timeout=30, follow_redirects=True)
+
+    async def visit(url):
+        previous = manifest.entries.get(url) or {}
+        headers = {}
+        # Validators are only worth sending when we still hold the page they describe.
+        if url not in corpus:
+            previous = {}
+        if previous.get("etag"):
+            headers["If-None-Match"] = previous["etag"]
+        if previous.get("last_modified"):
+            headers["If-Modified-Since"] = previous["last_modified"]
+
+        async with semaphore:
+            try:
+                response = await client.get(url, headers=headers)
+            except httpx.HTTPError as e:
+                diff["errors"].append({"url": url, "error": str(e)})
+                return
+
+            if response.status_code == 304:
+                diff["unchanged"] += 1
+                entries.append({**previous, "url": url, "status": "unchanged"})
+                return
+            if response.status_code in (404, 410):
+                if url in corpus:
+                    del corpus[url]
+                    diff["removed"].append(url)
+                entries.append({"url": url, "status": "removed"})
+                return
+            if response.status_code >= 400:
+                diff["errors"].append({"url": url, "error": f"HTTP {response.status_code}"})
+                return
+
+            digest = fingerprint(response.content, response.headers.get("content-type", ""))
+            entry = {
+                "url": url,
+                "etag": response.headers.get("etag"),
+                "last_modified": response.headers.get("last-modified"),
+                "hash": digest,
+            }
+
+            if url in corpus and (previous.get("hash") == digest or not previous):
+                diff["unchanged"] += 1
+                entries.append({**entry, "status": "unchanged"})
+                return
+
+            try:
+                markdown = await scrape(url, response)
+            except Exception as e:
+                diff["errors"].append({"url": url, "error": f"scrape failed: {e}"})
+                return
+
+        diff["changed" if url in corpus else "added"].append(url)
+        corpus[url] = markdown
+        entries.append({**entry, "status": "fetched"})
+
+    try:
+        await asyncio.gather(*(visit(url) for url in urls))
+    finally:
+        if own_client:
+            await client.aclose()
+
+    # Pages the site no longer links to.
+    listed = set(urls)
+    for url in sorted((manifest.active() | set(corpus)) - listed):
+        if url in corpus:
+            del corpus[url]
+            diff["removed"].append(url)
+        entries.append({"url": url, "status": "removed"})
+
+    if not allow_mass_removal and len(diff["removed"]) > max_removed_fraction * corpus_size:
+        raise RuntimeError(
+            f"The crawl would remove {len(diff['removed'])} of {corpus_size} pages from {corpus_path}; "
+            "nothing was written. Check the URL list, or pass --allow-mass-removal if this is intended."
+        )
+
+    _write_json(corpus_path, [{"url": url, "markdown": markdown} for url, markdown in corpus.items()])
+    manifest.record(entries)
+    diff["crawled_at"] = datetime.datetime.now(datetime.timezone.utc).isoformat()
+    _write_json(diff_path, diff)
+    return diff
+
+
+def crawl(urls, **options):
+    return run(acrawl(urls, **options))
+
+
+def load_diff(diff_path=CRAWL_DIFF_PATH):
+    with open(diff_path, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def _write_json(path, data):
+    # Readers (ingestion, the app) may have the file open; swap it in whole.
+    with open(path + ".tmp", "w", encoding="utf-8") as file:
+        json.dump(data, file, indent=4, ensure_ascii=False)
+    os.replace(path + ".tmp", path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Incrementally re-crawl the site and update the corpus.")
+    parser.add_argument("--base-url", default=SITE_URL)
+    parser.add_argument("--urls-file", help="One URL per line instead of discovering them with Firecrawl map")
+    parser.add_argument("--scraper", choices=["firecrawl", "raw"], default="firecrawl")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--corpus", default=DATA_DIR)
+    parser.add_argument("--manifest", default=CRAWL_MANIFEST_PATH)
+    parser.add_argument("--diff", default=CRAWL_DIFF_PATH)
+    parser.add_argument("--allow-mass-removal", action="store_true", help="Apply the crawl even if it removes most of the corpus")
+    args = parser.parse_args()
+
+    if args.urls_file:
+        with open(args.urls_file, "r", encoding="utf-8") as file:
+            urls = [line.strip() for line in file if line.strip()]
+    else:
+        urls = firecrawl_discover(args.base_url)
+
+    try:
+        diff = crawl(
+            urls,
+            scrape=firecrawl_scrape if args.scraper == "firecrawl" else raw_scrape,
+            corpus_path=args.corpus,
+            manifest_path=args.manifest,
+            diff_path=args.diff,
+            concurrency=args.concurrency,
+            allow_mass_removal=args.allow_mass_removal,
+        )
+    except RuntimeError as e:
+        parser.exit(1, f"{e}\n")
+    print(json.dumps({key: len(value) if isinstance(value, list) else value for key, value in diff.items()}, indent=2))
@@ -0,0 +1,207 @@
+"""
+Clean the scraped corpus before it is embedded, indexed or sent as context.
+
+    python -m ingestion.preprocess
+    python -m ingestion.preprocess --input data/pti_markdown_results_all.json --output data/pti_markdown_cleaned.json
+
+Three passes over the Firecrawl output:
+
+1. URL variants (trailing slash, fragment, www., http) collapse to one page.
+2. Blocks (blank-line separated) that repeat on many pages, such as the
+   navigation, "Back To Top", the login widget and footers, are kept on the
+   first page they appear on and removed everywhere else. Image-only blocks
+   are dropped.
+3. Near-duplicate pages are found with MinHash + LSH over word shingles of
+   the cleaned text, and only the longest page of each group is kept.
+
+The result has the same [{"url", "markdown"}] shape as the input.
+"""
+import re
+import json
+import hashlib
+import argparse
+from collections import Counter
+from urllib.parse import urlsplit, urlunsplit
+
+import numpy as np
+
+from common.history import estimate_tokens
+from ingestion.stream_ingest import DATA_DIR, CLEAN_DATA_DIR, iter_pages
+
+
+_LINK_TARGET = re.compile(r"\]\([^)]*\)")
+_IMAGE = re.compile(r"!\[[^\]]*\]\([^)]*\)")
+_WORD = re.compile(r"\w+")
+_MERSENNE = (1 << 61) - 1
+
+
+def canonical_url(url):
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower().removeprefix("www.")
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit(("https", host, path, parts.query, ""))
+
+
+def split_blocks(markdown):
+    return [block.strip() for block in re.split(r"\n\s*\n", markdown) if block.strip()]
+
+
+def visible_text(markdown):
+    """Text a reader would see: images dropped, link text kept without its target."""
+    return _LINK_TARGET.sub("]", _IMAGE.sub("", markdown)).strip()
+
+
+def block_key(block):
+    # Link targets differ per page ("Back To Top" links to the page itself,
+    # captcha iframes carry a nonce), so only the visible text is compared.
+    text = _LINK_TARGET.sub("]()", block)
+    return hashlib.sha1(" ".join(text.lower().split()).encode("utf-8")).hexdigest()
+
+
+def shingles(text, size=5):
+    words = _WORD.findall(text.lower())
+    if len(words) < size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+class MinHasher:
+    """MinHash signatures with `num_perm` universal hash functions (a*x + b mod 2^61-1)."""
+
+    def __init__(self, num_perm=128, seed=7):
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, 1 << 31, num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, 1 << 31, num_perm, dtype=np.uint64)
+        self.num_perm = num_perm
+
+    def signature(self, features):
+        if not features:
+            return np.full(self.num_perm, _MERSENNE, dtype=np.uint64)
+        # 32-bit feature hashes keep a*x below 2^63, so nothing overflows.
+        hashes = np.fromiter(
+            (int.from_bytes(hashlib.blake2b(f.encode("utf-8"), digest_size=4).digest(), "little") for f in features),
+            dtype=np.uint64,
+        )
+        return ((np.outer(hashes, self.a) + self.b) % _MERSENNE).min(axis=0)
+
+
+def near_duplicate_groups(signatures, bands=32, threshold=0.85):
+    """Union pages whose estimated Jaccard similarity is at least `threshold`; returns a root per page."""
+    parent = list(range(len(signatures)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    if not signatures:
+        return parent
+
+    rows = len(signatures[0]) // bands
+    for band in range(bands):
+        buckets = {}
+        for i, signature in enumerate(signatures):
+            buckets.setdefault(signature[band * rows:(band + 1) * rows].tobytes(), []).append(i)
+
+        for members in buckets.values():
+            for other in members[1:]:
+                first = members[0]
+                if find(first) == find(other):
+                    continue
+                if np.mean(signatures[first] == signatures[other]) >= threshold:
+                    parent[find(other)] = find(first)
+
+    return [find(i) for i in range(len(signatures))]
+
+
+def preprocess(pages, min_page_share=0.05, min_pages=3, dedup_threshold=0.85, min_chars=20):
+    """
+    Clean `pages` (an iterable of (url, markdown)). Returns (cleaned pages, stats).
+
+    A block is boilerplate when it appears on at least `min_pages` pages and
+    at least `min_page_share` of all pages. Blocks with no visible text
+    (image-only blocks from PDF extraction) are dropped, and so are pages left
+    with fewer than `min_chars` visible characters.
+    """
+    stats = Counter()
+
+    # 1. One page per canonical URL; the longest copy wins.
+    by_url = {}
+    for url, markdown in pages:
+        stats["pages_in"] += 1
+        stats["bytes_in"] += len(markdown.encode("utf-8"))
+        stats["tokens_in"] += estimate_tokens(markdown)
+
+        key = canonical_url(url)
+        if key in by_url:
+            stats["url_duplicates"] += 1
+            if len(markdown) <= len(by_url[key][1]):
+                continue
+        by_url[key] = (url, markdown)
+    pages = list(by_url.values())
+
+    # 2. Boilerplate blocks, counted once per page.
+    blocks = [split_blocks(markdown) for _, markdown in pages]
+    keys = [[block_key(block) for block in page] for page in blocks]
+    frequency = Counter(key for page in keys for key in set(page))
+    cutoff = max(min_pages, min_page_share * len(pages))
+    boilerplate = {key for key, count in frequency.items() if count >= cutoff}
+    stats["boilerplate_blocks"] = len(boilerplate)
+
+    seen = set()
+    cleaned = []
+    for (url, _), page_blocks, page_keys in zip(pages, blocks, keys):
+        kept = []
+        for block, key in zip(page_blocks, page_keys):
+            if not visible_text(block):
+                stats["image_blocks_removed"] += 1
+                continue
+            if key in boilerplate:
+                # The first copy is kept so footer details (addresses, phone numbers) survive once.
+                if key in seen:
+                    stats["boilerplate_removed"] += 1
+                    continue
+                seen.add(key)
+            kept.append(block)
+        markdown = "\n\n".join(kept)
+        if len(visible_text(markdown)) < min_chars:
+            stats["empty_dropped"] += 1
+            continue
+        cleaned.append((url, markdown))
+
+    # 3. Near-duplicate pages.
+    hasher = MinHasher()
+    roots = near_duplicate_groups([hasher.signature(shingles(markdown)) for _, markdown in cleaned], threshold=dedup_threshold)
+    best = {}
+    for i, root in enumerate(roots):
+        if root not in best or len(cleaned[i][1]) > len(cleaned[best[root]][1]):
+            best[root] = i
+    stats["near_duplicates"] = len(cleaned) - len(best)
+    cleaned = [cleaned[i] for i in sorted(best.values())]
+
+    stats["pages_out"] = len(cleaned)
+    stats["bytes_out"] = sum(len(markdown.encode("utf-8")) for _, markdown in cleaned)
+    stats["tokens_out"] = sum(estimate_tokens(markdown) for _, markdown in cleaned)
+    stats["bytes_saved"] = stats["bytes_in"] - stats["bytes_out"]
+    stats["tokens_saved"] = stats["tokens_in"] - stats["tokens_out"]
+    return [{"url": url, "markdown": markdown} for url, markdown in cleaned], dict(stats)
+
+
+def preprocess_file(filename=DATA_DIR, output=CLEAN_DATA_DIR, **options):
+    pages, stats = preprocess(iter_pages(filename), **options)
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(pages, file, ensure_ascii=False)
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Strip boilerplate and near-duplicate pages from the scraped corpus.")
+    parser.add_argument("--input", default=DATA_DIR)
+    parser.add_argument("--output", default=CLEAN_DATA_DIR)
+    parser.add_argument("--threshold", type=float, default=0.85, help="MinHash similarity at which pages count as duplicates")
+    args = parser.parse_args()
+
+    stats = preprocess_file(args.input, args.output, dedup_threshold=args.threshold)
+    print(json.dumps(stats, indent=2))
+    print(f"Saved {stats['bytes_saved'] / max(stats['bytes_in'], 1):.1%} of bytes, ~{stats['tokens_saved']} tokens -> {args.output}")
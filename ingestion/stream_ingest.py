@@ -0,0 +1,248 @@
+import os
+import re
+import json
+import asyncio
+import hashlib
+import datetime
+from common.event_loop import run
+from common.rate_limiter import lane, INGESTION
+from ingestion.chunker import chunk_document, CHUNK_SEPARATOR
+
+
+DATA_DIR = os.path.abspath('./data/pti_markdown_results_all.json')
+MANIFEST_PATH = os.path.abspath('./data/lrag/ingest_manifest.jsonl')
+# Written by `python -m ingestion.preprocess`.
+CLEAN_DATA_DIR = os.path.abspath('./data/pti_markdown_cleaned.json')
+
+
+_NUMBER_TAIL = re.compile(r"[0-9.eE+\-]*")
+
+
+def iter_json_array(filename, buffer_size=1 << 16):
+    """
+    Yield the items of a top-level JSON array one at a time.
+
+    The file is read in `buffer_size` pieces, so only the item being decoded
+    has to be held in memory rather than the whole corpus.
+    """
+    decoder = json.JSONDecoder()
+
+    with open(filename, "r", encoding="utf-8") as file:
+        buffer = ""
+        eof = False
+        started = False
+
+        while True:
+            stripped = buffer.lstrip().lstrip(",").lstrip()
+            if not stripped and not eof:
+                buffer = file.read(buffer_size)
+                eof = not buffer
+                continue
+            buffer = stripped
+
+            if not started:
+                if not buffer:
+                    return
+                if buffer[0] != "[":
+                    raise ValueError(f"{filename} does not contain a JSON array")
+                buffer = buffer[1:]
+                started = True
+                continue
+
+            if not buffer or buffer[0] == "]":
+                return
+
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                more = file.read(buffer_size)
+                eof = not more
+                buffer += more
+                continue
+
+            # A number is only complete once something other than a digit,
+            # sign, point or exponent follows it; "1" or "1." may be "1.5".
+            if not eof and type(item) in (int, float) and _NUMBER_TAIL.fullmatch(buffer[end:]):
+                more = file.read(buffer_size)
+                eof = not more
+                buffer += more
+                continue
+
+            yield item
+            buffer = buffer[end:]
+
+
+def corpus_path():
+    """
+    The cleaned corpus when it has been built from the current scrape,
+    otherwise the raw scrape (e.g. after a crawl, until preprocess is rerun).
+    """
+    if not os.path.exists(CLEAN_DATA_DIR):
+        return DATA_DIR
+    if os.path.exists(DATA_DIR) and os.path.getmtime(CLEAN_DATA_DIR) < os.path.getmtime(DATA_DIR):
+        return DATA_DIR
+    return CLEAN_DATA_DIR
+
+
+def iter_pages(filename=None):
+    for item in iter_json_array(filename or corpus_path()):
+        yield item['url'], item['markdown']
+
+
+def page_document(url, markdown):
+    # Chunked along the page's markdown structure; LightRAG splits on CHUNK_SEPARATOR.
+    return chunk_document(url, markdown)
+
+
+def doc_id_for_url(url):
+    # Stable per-URL id so a changed page replaces its previous version.
+    return "doc-" + hashlib.md5(url.encode("utf-8")).hexdigest()
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class IngestionManifest:
+    """
+    Append-only JSONL record of the last ingestion outcome for every document.
+
+    Each line is {"doc_id", "url", "hash", "status", "updated_at"}; the last
+    line for a doc_id wins, so progress is saved after every batch without
+    rewriting the file.
+    """
+
+    def __init__(self, path=MANIFEST_PATH):
+        self.path = path
+        self.entries = {}
+
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as file:
+                for line in file:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A torn last line from an interrupted run.
+                        continue
+                    self.entries[entry["doc_id"]] = entry
+
+    def is_current(self, doc_id, digest):
+        entry = self.entries.get(doc_id)
+        return entry is not None and entry["hash"] == digest and entry["status"] == "processed"
+
+    def record(self, entries):
+        now = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as file:
+            for entry in entries:
+                entry = {**entry, "updated_at": now}
+                self.entries[entry["doc_id"]] = entry
+                file.write(json.dumps(entry) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+
+
+async def aingest_corpus(rag, filename=None, batch_size=8, manifest_path=MANIFEST_PATH):
+    """
+    Insert the scraped corpus into LightRAG as one document per URL.
+
+    Pages whose content hash is unchanged since their last successful insert
+    are skipped, changed pages replace their previous version, and progress is
+    checkpointed after every batch so a failed run (e.g. on a 429) resumes where
+    it stopped. Documents whose URL is no longer in the corpus are deleted.
+    Returns counts of inserted, skipped, failed and removed documents.
+
+    LLM calls made while ingesting run in the ingestion lane, behind chat.
+    """
+    with lane(INGESTION):
+        return await _aingest_corpus(rag, filename, batch_size, manifest_path)
+
+
+async def _aingest_corpus(rag, filename, batch_size, manifest_path):
+    from lightrag.base import DocStatus
+
+    manifest = IngestionManifest(manifest_path)
+    stats = {"inserted": 0, "skipped": 0, "failed": 0, "removed": 0}
+
+    # LightRAG retries every failed document on each insert; drop failed
+    # documents this pipeline does not own (e.g. the old whole-corpus blob).
+    failed = await rag.doc_status.get_docs_by_status(DocStatus.FAILED)
+    for doc_id in failed:
+        if doc_id not in manifest.entries:
+            await rag.adelete_by_doc_id(doc_id)
+    batch = []
+    seen = set()
+
+    async def flush():
+        if not batch:
+            return
+
+        for doc in batch:
+            if doc["doc_id"] in manifest.entries:
+                # A previous version of this page (or a failed attempt) exists.
+                await rag.adelete_by_doc_id(doc["doc_id"])
+
+        await rag.ainsert(
+            [doc["text"] for doc in batch],
+            ids=[doc["doc_id"] for doc in batch],
+            file_paths=[doc["url"] for doc in batch],
+            split_by_character=CHUNK_SEPARATOR,
+        )
+
+        # LightRAG records per-document failures in doc_status instead of raising.
+        # get_by_ids leaves missing documents out, so look each one up by id.
+        ids = [doc["doc_id"] for doc in batch]
+        statuses = dict(zip(ids, await asyncio.gather(*(rag.doc_status.get_by_id(doc_id) for doc_id in ids))))
+        entries = []
+        for doc in batch:
+            state = _status_value(statuses.get(doc["doc_id"]))
+            entries.append({"doc_id": doc["doc_id"], "url": doc["url"], "hash": doc["hash"], "status": state})
+            stats["inserted" if state == "processed" else "failed"] += 1
+        manifest.record(entries)
+        batch.clear()
+
+    for url, markdown in iter_pages(filename):
+        text = page_document(url, markdown)
+        doc_id = doc_id_for_url(url)
+        digest = content_hash(text)
+
+        # The crawl can list the same URL twice; the first copy wins.
+        if doc_id in seen:
+            continue
+        seen.add(doc_id)
+
+        if manifest.is_current(doc_id, digest):
+            stats["skipped"] += 1
+            continue
+
+        batch.append({"doc_id": doc_id, "url": url, "text": text, "hash": digest})
+        if len(batch) >= batch_size:
+            await flush()
+
+    await flush()
+
+    # Pages that left the corpus (e.g. removed by a re-crawl) are deleted from the graph too.
+    gone = [doc_id for doc_id, entry in manifest.entries.items() if doc_id not in seen and entry["status"] != "removed"]
+    for doc_id in gone:
+        await rag.adelete_by_doc_id(doc_id)
+    manifest.record([{**manifest.entries[doc_id], "status": "removed"} for doc_id in gone])
+    stats["removed"] = len(gone)
+
+    return stats
+
+
+def ingest_corpus(rag, filename=None, batch_size=8, manifest_path=MANIFEST_PATH):
+    # LightRAG's storages live on the shared loop they were initialized on.
+    return run(aingest_corpus(rag, filename, batch_size, manifest_path))
+
+
+def _status_value(status):
+    if not status:
+        return "failed"
+    value = status.get("status") if isinstance(status, dict) else getattr(status, "status", None)
+    return str(getattr(value, "value", value))
@@ -1,106 +1,269 @@
-import os
-from firecrawl import FirecrawlApp
-from google import genai
-from google.genai import types
-import pathlib
-import httpx
-import json
+import time
+import asyncio
 from dotenv import load_dotenv
-from llama_cloud_services import LlamaCloudIndex
-from llama_index.llms.google_genai import GoogleGenAI
+from llama_index.core import get_response_synthesizer
+from llama_index.core.schema import NodeWithScore, TextNode
 import llama_cloud.core.api_error
+from common.registry import get_registry, RETRIEVAL_BACKEND, RERANKER, RERANK_CANDIDATES, RERANK_TOP_N, PROMPT_TOKEN_BUDGET
+from common.history import format_history
+from common.prompt_compiler import PromptCompiler
+from common.event_loop import run, iterate
+from common.telemetry import get_telemetry
 
 
 
 # Load environment variables from .env file
 load_dotenv()
 
-class LmmaIndexAgent:
+# Instructions shared by every message, compiled once (see common/prompt_compiler.py).
+INSTRUCTIONS = [
+    ("role", """
+        **Role and Context:** Act as a highly reliable and meticulous research assistant and a helpful guide for the Petroleum Training Institute (PTI) in Nigeria. Your primary goal is to provide data that is verifiably accurate and sourced from official channels, and your provided context documents, whenever possible.
+    """),
+    ("conditional", """
+        **Core Instruction (Conditional Logic):**
+        1.  **First, analyze the user's query.**
+            * **If the query is a simple greeting** ("hi," "hello"), a polite social comment ("thank you," "how are you?"), or a non-informational conversational opener, respond in a natural, friendly, and brief manner. Do not follow the data retrieval or redirection instructions below.
+            * **If the query is a request for information or data**, proceed with the following steps.
+    """),
+    ("retrieval", """
+        **Instructions for Information Retrieval and Redirection:**
+        1.  **Prioritize sources based on the query type.**
+            * **For questions about real-time or dynamic information** (e.g., weather, current news, event schedules), **immediately perform an external web search.** Do not rely solely on the provided context unless it explicitly contains real-time updates.
+            * **For questions about static or document-based information** (e.g., admission requirements, course details), first analyze the `Provided Context`. If the answer is present and verifiable within this text, use only this information to form your response. Do not perform an external search.
+            * **If the answer is NOT in the `Provided Context`**, initiate a multi-step, multi-query external web search. Prioritize official sources like the pti.edu.ng domain.
+        2.  **If an answer is found**, use it to formulate your response. **Do not mention your internal search process**, such as "I've checked online" or "The provided context says."
+        3.  **If, after a thorough review of all available sources, the definitive answer cannot be found**, suggest the most appropriate office or department at the Petroleum Training Institute for the user to contact.
+        4.  If asked about a question that requires real-time information that you do not have information on and cannot do a web search on, kindly and clearly state where help or information on the said query or topic can be gotten.
+        5.  NEVER speak of having a source (e.g. never say 'This question cannot be answered from the given source.'). Keep that private. Act and Be Confident of your answers.
+    """),
+    ("output_format", """
+        **Desired Output Format:**
+        * **Final Answer (direct and seamless):** Start with a clear, concise final answer in markdown. If the answer was found via a web search, do NOT mention the search process. If sourced from a document, do NOT state the source (e.g., "According to the student handbook...").
+        * **Helpful Redirection:** If the answer is not found, clearly provide the name of the most appropriate office or department to contact and explain why they are the best point of contact. **Do not mention that the information was not found in your sources.** Conclude with a professional and helpful closing.
+    """),
+]
 
-    def __init__(self, prompt, conversation_history=[]):
-        self.prompt = prompt
+PROMPT = PromptCompiler(INSTRUCTIONS, token_budget=PROMPT_TOKEN_BUDGET)
 
-        google_api_key = os.getenv('GOOGLE_API_KEY')
 
-        llma_index_api_key = os.getenv('LLMA_INDEX_API_KEY')
+class LmmaIndexAgent:
 
-        organization_id = os.getenv('LLMA_INDEX_ORG_ID')
+    def __init__(self, prompt=None, conversation_history=[], include_answer=False, stream=False):
+        self.prompt = prompt
 
-        self.client = genai.Client(api_key=google_api_key)
+        # Seconds spent in each pipeline stage for this message.
+        self.timings = {}
+        # Estimated tokens per prompt section for the last message.
+        self.prompt_tokens = {}
 
-        self.llm = GoogleGenAI(
-            model="gemini-2.0-flash",
-            api_key=google_api_key,
-            max_tokens=512,
-            generation_config=types.GenerateContentConfig(
-                system_instruction=self.create_system_prompt(conversation_history),
-            )
-        )
+        registry = get_registry()
 
-        self.llma_index = LlamaCloudIndex(
-            name="pti_data",
-            project_name="Default",
-            organization_id=organization_id,
-            api_key=llma_index_api_key,
-        )
+        self.client = registry.genai_client()
 
-        try:
-            query = self.answer_query(prompt)
-            
-            self.llma_index_answer = query
+        # The system instruction is kept free of per-user history so the same
+        # LLM instance can be shared across sessions; history goes in the prompt.
+        self.llm = registry.gemini_llm(system_instruction=self.create_system_prompt())
 
-            self.llma_index_context = self.retrieve_context(prompt)
+        self.llma_index = registry.llama_index()
 
-            formatted_prompt = self.create_prompt_with_context(prompt, self.llma_index_context, conversation_history)
+        self.llma_index_answer = None
+        self.llma_index_context = None
+        self.rag_response = None
+        self.rag_response_stream = None
+        self._answer_task = None
+        # Set when the reply is an error message, so it is not cached or saved.
+        self.failed = False
 
-            self.rag_response = self.rag_response_call(formatted_prompt)
+        # Without a prompt the agent is only set up; call `await agent.answer(...)`.
+        if prompt is None:
+            return
+
+        # The pipeline itself is async and runs on the shared event loop.
+        try:
+            if stream:
+                # Retrieval happens now; generation as the caller consumes the stream.
+                formatted_prompt = run(self.prepare(prompt, conversation_history, include_answer))
+                self.rag_response_stream = iterate(self.stream_response(formatted_prompt))
+            else:
+                run(self.answer(prompt, conversation_history, include_answer))
 
         except llama_cloud.core.api_error.ApiError as e:
-            print(f"LLama Cloud API Error: {e}")
+            get_telemetry().log("llamacloud_error", backend="llamaindex", error=e)
+            self.failed = True
             self.rag_response = "Sorry, there was an error. please try again later ☹️!"
             self.llma_index_answer = "Sorry, there was an error. please try again later ☹️!"
             self.llma_index_context = "Sorry, there was an error. please try again later ☹️!"
         except Exception as e:
-            print(f"An unexpected error occurred: {e}")
+            get_telemetry().log("agent_error", backend="llamaindex", error=e)
+            self.failed = True
             self.rag_response = "An unexpected error occurred. please try again later ☹️!"
             self.llma_index_answer = "An unexpected error occurred. please try again later ☹️!"
             self.llma_index_context = "An unexpected error occurred. please try again later ☹️!"
-        
+
+        if stream and self.rag_response_stream is None:
+            self.rag_response_stream = iter([self.rag_response])
+
+
+    async def answer(self, prompt, conversation_history=[], include_answer=False):
+        """Retrieve once, then generate the reply (and optionally the LlamaIndex answer) concurrently."""
+        formatted_prompt = await self.prepare(prompt, conversation_history, include_answer=False)
+
+        stages = [self.atimed("generate", self.arag_response_call(formatted_prompt))]
+        if include_answer:
+            stages.append(self.atimed("answer", self.aanswer_from_nodes(prompt, self.llma_index_context)))
+
+        results = await asyncio.gather(*stages)
+        self.rag_response = results[0]
+        if include_answer:
+            self.llma_index_answer = results[1]
+        return self.rag_response
+
+
+    async def prepare(self, prompt, conversation_history=[], include_answer=False):
+        """Retrieve context and build the generation prompt."""
+        self.prompt = prompt
+
+        # Retrieve once; both the final generation and the optional
+        # LlamaIndex answer reuse these nodes.
+        self.llma_index_context = await self.atimed("retrieve", self.aretrieve_context(prompt))
+
+        formatted_prompt = self.timed("prompt", self.create_prompt_with_context, prompt, self.llma_index_context, conversation_history)
+
+        # The secondary answer is informational only, so it runs alongside the main generation.
+        if include_answer:
+            self._answer_task = asyncio.ensure_future(
+                self.atimed("answer", self.aanswer_from_nodes(prompt, self.llma_index_context))
+            )
+
+        return formatted_prompt
+
+
+    def timed(self, stage, func, *args):
+        start = time.perf_counter()
+        try:
+            with get_telemetry().span(stage, backend="llamaindex"):
+                return func(*args)
+        finally:
+            self.timings[stage] = time.perf_counter() - start
+
+
+    async def atimed(self, stage, coro):
+        start = time.perf_counter()
+        try:
+            with get_telemetry().span(stage, backend="llamaindex"):
+                return await coro
+        finally:
+            self.timings[stage] = time.perf_counter() - start
 
 
     def retrieve_context(self, query):
-        retriever = self.llma_index.as_retriever(
-            dense_similarity_top_k=3,
-            sparse_similarity_top_k=3,
-            alpha=0.5,
-            enable_reranking=True, 
-            rerank_top_n=3,
-            top_n=3,
-            top_k=3,
-        )
-        nodes = retriever.retrieve(query)
+        if RETRIEVAL_BACKEND == "local":
+            nodes = self.local_nodes(query)
+        else:
+            nodes = get_registry().llama_retriever().retrieve(query)
+
+        if RERANKER == "local":
+            nodes = self.timed("rerank", self.rerank_nodes, query, nodes)
+        return nodes
+
+
+    async def aretrieve_context(self, query):
+        if RETRIEVAL_BACKEND == "local":
+            # CPU-bound (query embedding + scoring); keep it off the event loop.
+            nodes = await asyncio.to_thread(self.local_nodes, query)
+        else:
+            nodes = await get_registry().llama_retriever().aretrieve(query)
+
+        if RERANKER == "local":
+            # "retrieve" includes this; "rerank" is the cross-encoder's share.
+            nodes = await self.atimed("rerank", asyncio.to_thread(self.rerank_nodes, query, nodes))
         return nodes
+
+
+    def local_nodes(self, query):
+        top_k = RERANK_CANDIDATES if RERANKER == "local" else None
+        chunks = get_registry().local_retriever().retrieve(query, top_k)
+        return [
+            NodeWithScore(node=TextNode(text=chunk["text"], metadata={"url": chunk["url"]}), score=chunk["score"])
+            for chunk in chunks
+        ]
+
+
+    def rerank_nodes(self, query, nodes):
+        ranked = get_registry().reranker().rerank(query, nodes, RERANK_TOP_N, text=lambda node: node.get_content())
+        return [NodeWithScore(node=node.node, score=score) for node, score in ranked]
     
     
     def answer_query(self, query):
         query_engine = self.llma_index.as_query_engine(llm=self.llm)
         response = query_engine.query(query)
         return response
+
+
+    def answer_from_nodes(self, query, nodes):
+        # Same answer as answer_query, but synthesized from nodes we already retrieved.
+        synthesizer = get_response_synthesizer(llm=self.llm)
+        response = synthesizer.synthesize(query, nodes=nodes)
+        return response
+
+
+    async def aanswer_from_nodes(self, query, nodes):
+        synthesizer = get_response_synthesizer(llm=self.llm)
+        response = await synthesizer.asynthesize(query, nodes=nodes)
+        return response
     
 
     def rag_response_call(self, prompt):
+        # Sync callers share the async path, so they count against the same quota.
+        return run(self.arag_response_call(prompt))
+
+
+    async def arag_response_call(self, prompt):
         try:
-            print("Fetching response")
-            response = self.client.models.generate_content(
-                model="gemini-1.5-flash",
-                contents=[prompt],
-                config=types.GenerateContentConfig(max_output_tokens=500, temperature=0.1)
-            )
-            
-            return(response.text)
+            # The router picks the healthiest provider, hedges slow calls and fails over on 429/5xx.
+            return await get_registry().llm_router("gemini-1.5-flash").generate(prompt, system=PROMPT.system_prompt)
+
+        except Exception as e:
+            self.failed = True
+            return(f'An exception occurred: {getattr(e, "message", e)}')
+
+
+    async def arag_response_call_stream(self, prompt):
+        try:
+            async for chunk in get_registry().llm_router("gemini-1.5-flash").stream(prompt, system=PROMPT.system_prompt):
+                yield chunk
 
         except Exception as e:
-            return(f'An exception occurred: {e.message}')
+            self.failed = True
+            yield f'An exception occurred: {getattr(e, "message", e)}'
+
+
+    async def stream_response(self, prompt):
+        start = time.perf_counter()
+        chunks = []
+
+        # Observed directly rather than as a span: each step of a stream may run in a different task.
+        async for chunk in self.arag_response_call_stream(prompt):
+            if not chunks:
+                self.timings["first_token"] = time.perf_counter() - start
+                get_telemetry().observe("first_token", self.timings["first_token"], backend="llamaindex")
+            chunks.append(chunk)
+            yield chunk
+
+        self.timings["generate"] = time.perf_counter() - start
+        get_telemetry().observe("generate", self.timings["generate"], backend="llamaindex")
+        self.rag_response = "".join(chunks)
+
+        if self._answer_task is not None:
+            self.llma_index_answer = await self._answer_task
+
+
+    async def answer_stream(self, prompt, conversation_history=[], include_answer=False):
+        """Async-iterator variant of `answer`: yields the reply as it is generated."""
+        formatted_prompt = await self.prepare(prompt, conversation_history, include_answer)
+        async for chunk in self.stream_response(formatted_prompt):
+            yield chunk
         
     
     def create_prompt(self, user_input, query, history):
@@ -126,120 +289,24 @@ class LmmaIndexAgent:
         return prompt
     
         
-    def create_system_prompt(self, history):
-        prompt = f"""
-        System: You are an AI chatbot and assistant for the Petroleum Training Institute (PTI) in Nigeria. 
-
-        Act as a highly reliable and meticulous research assistant and a helpful guide for the Petroleum Training Institute (PTI)
-
-        Never output 'This question cannot be answered from the given source' or anything like such that shows you have a source. instead, when you dont have enough information on a query or question, clearly provide the name of the most appropriate office or department to contact and explain why they are the best point of contact.
-
-        If asked about a question that requires real-time information that you do not have information on and cannot do a web search on, kindly and clearly state where help or information on the said query or topic can be gotten.
-
-        ---Desired Output Format:---
-        Final Answer (direct and seamless):** Start with a clear, concise final answer. If the answer was found via a web search, do NOT mention the search process. If sourced from a document, do NOT state the source (e.g., "According to the student handbook...").
-        Helpful Redirection:** If the answer is not found, clearly provide the name of the most appropriate office or department to contact and explain why they are the best point of contact. **Do not mention that the information was not found in your sources.** Conclude with a professional and helpful closing.
-        
-         ---Conversation History---
-        {history}
-        """
-        return prompt
+    def create_system_prompt(self):
+        # Static for every message: the system instruction, and the cacheable prefix of each request.
+        return PROMPT.system_prompt
     
     
     def create_prompt_with_context(self, user_input, query, history):
-        prompt = f"""
-        **Role and Context:** Act as a highly reliable and meticulous research assistant and a helpful guide for the Petroleum Training Institute (PTI). Your primary goal is to provide data that is verifiably accurate and sourced from official channels, and your provided context documents, whenever possible.
-          
-        ***
-
-        **Core Instruction (Conditional Logic):**
-        1.  **First, analyze the user's query.**
-            * **If the query is a simple greeting** ("hi," "hello"), a polite social comment ("thank you," "how are you?"), or a non-informational conversational opener, respond in a natural, friendly, and brief manner. Do not follow the data retrieval or redirection instructions below.
-            * **If the query is a request for information or data**, proceed with the following steps.
-
-        ***
-
-        **Provided Context:**
-        {query}
-
-        ***
-
-        **Instructions for Information Retrieval and Redirection:**
-        1.  **Prioritize sources based on the query type.**
-            * **For questions about real-time or dynamic information** (e.g., weather, current news, event schedules), **immediately perform an external web search.** Do not rely solely on the provided context unless it explicitly contains real-time updates.
-            * **For questions about static or document-based information** (e.g., admission requirements, course details), first analyze the `Provided Context`. If the answer is present and verifiable within this text, use only this information to form your response. Do not perform an external search.
-            * **If the answer is NOT in the `Provided Context`**, initiate a multi-step, multi-query external web search. Prioritize official sources like the pti.edu.ng domain.
-
-        2.  **If an answer is found**, use it to formulate your response. **Do not mention your internal search process**, such as "I've checked online" or "The provided context says."
-
-        3.  **If, after a thorough review of all available sources, the definitive answer cannot be found**, provide a constructive and helpful redirection.
-
-        4.  Suggest the most appropriate office or department at the Petroleum Training Institute for the user to contact.
-
-        5. Never say 'This question cannot be answered from the given source.' or anything as such that relates to you having a source. instead, when you dont have enough information on a query or question, clearly provide the name of the most appropriate office or department to contact and explain why they are the best point of contact.
-
-        6. If asked about a question that requires real-time information that you do not have information on and cannot do a web search on, kindly and clearly state where help or information on the said query or topic can be gotten.
-
-        7. NEVER speak of having a source. Keep that private. Act and Be Confident of your answers. 
-
-        ***
-
-        **Desired Output Format:**
-        * **Final Answer (direct and seamless):** Start with a clear, concise final answer. If the answer was found via a web search, do NOT mention the search process. If sourced from a document, do NOT state the source (e.g., "According to the student handbook...").
-        * **Helpful Redirection:** If the answer is not found, clearly provide the name of the most appropriate office or department to contact and explain why they are the best point of contact. **Do not mention that the information was not found in your sources.** Conclude with a professional and helpful closing.
-
-        ***
-
-        **Conversation History:**
-        {history}
+        """User turn for one message: context chunks, history and the question, within PROMPT_TOKEN_BUDGET."""
+        chunks = [self.format_node(node) for node in query] if isinstance(query, list) else [query]
+        prompt, self.prompt_tokens = PROMPT.compile(user_input, chunks, format_history(history))
+        return prompt
 
-        ***
 
-        **The Question to Answer:** {user_input}
-        """
-        return prompt
+    def format_node(self, node):
+        url = node.metadata.get("url") if hasattr(node, "metadata") else None
+        text = node.get_content() if hasattr(node, "get_content") else str(node)
+        return f"url: {url} \n content: {text}" if url else text
     
     
     def create_system_prompt_with_context(self, history):
-        prompt = f"""
-        **Role and Context:** Act as a highly reliable and meticulous research assistant and a helpful guide for the Petroleum Training Institute (PTI). Your primary goal is to provide data that is verifiably accurate and sourced from official channels, and your provided context documents, whenever possible.
-
-        ***
-
-        **Core Instruction (Conditional Logic):**
-        1.  **First, analyze the user's query.**
-            * **If the query is a simple greeting** ("hi," "hello"), a polite social comment ("thank you," "how are you?"), or a non-informational conversational opener, respond in a natural, friendly, and brief manner. Do not follow the data retrieval or redirection instructions below.
-            * **If the query is a request for information or data**, proceed with the following steps.
-
-        ***
-
-        **Instructions for Information Retrieval and Redirection:**
-        1.  **Prioritize sources based on the query type.**
-            * **For questions about real-time or dynamic information** (e.g., weather, current news, event schedules), **immediately perform an external web search.** Do not rely solely on the provided context unless it explicitly contains real-time updates.
-            * **For questions about static or document-based information** (e.g., admission requirements, course details), first analyze the `Provided Context`. If the answer is present and verifiable within this text, use only this information to form your response. Do not perform an external search.
-            * **If the answer is NOT in the `Provided Context`**, initiate a multi-step, multi-query external web search. Prioritize official sources like the pti.edu.ng domain.
-
-        2.  **If an answer is found**, use it to formulate your response. **Do not mention your internal search process**, such as "I've checked online" or "The provided context says."
-
-        3.  **If, after a thorough review of all available sources, the definitive answer cannot be found**, provide a constructive and helpful redirection.
-
-        4.  Suggest the most appropriate office or department at the Petroleum Training Institute for the user to contact.
-
-        5. Never say 'This question cannot be answered from the given source.' or anything as such that relates to you having a source. instead, when you dont have enough information on a query or question, clearly provide the name of the most appropriate office or department to contact and explain why they are the best point of contact.
-
-        6. If asked about a question that requires real-time information that you do not have information on and cannot do a web search on, kindly and clearly state where help or information on the said query or topic can be gotten.
-
-        7. NEVER speak of having a source. Keep that private. Act and Be Confident of your answers. 
-
-        ***
-
-        **Desired Output Format:**
-        * **Final Answer (direct and seamless):** Start with a clear, concise final answer. If the answer was found via a web search, do NOT mention the search process. If sourced from a document, do NOT state the source (e.g., "According to the student handbook...").
-        * **Helpful Redirection:** If the answer is not found, clearly provide the name of the most appropriate office or department to contact and explain why they are the best point of contact. **Do not mention that the information was not found in your sources.** Conclude with a professional and helpful closing.
-
-        ***
-        
-         ---Conversation History---
-        {history}
-        """
-        return prompt
\ No newline at end of file
+        # History goes after the static prefix so the prefix is still shared.
+        return PROMPT.system_prompt + "\n\n***\n\n**Conversation History:**\n" + str(history)
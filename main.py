@@ -1,16 +1,27 @@
-import os
-import asyncio
+import time
 import streamlit as st
-from cag.cag_agent import CagAgent
-from rag.rag_agent_func import rag, rag_insert_data_to_db, rag_retrieve
-from llmaindex.llma_index_agent import LmmaIndexAgent
-# from groq_inference.groq_agent import GroqAgent
+from common.registry import get_registry, METRICS_PORT
+from common.telemetry import get_telemetry, serve_metrics
+# Agent modules are imported lazily by backend (CHAT_BACKEND env var)
+from common.backends import create_agent, warm_up_names, route
 
 # For Google Auth and Supabase
-from st_supabase_connection import SupabaseConnection, execute_query
+from st_supabase_connection import SupabaseConnection
  # Remove incorrect import; use st.connection instead
-import pandas as pd
+from common.chat_store import load_history_page
 import datetime
+import uuid
+
+
+@st.cache_resource(show_spinner="Loading models...")
+def load_registry():
+    # Runs once per server process; clear with load_registry.clear() plus registry.reload() to rebuild.
+    registry = get_registry().warm_up(warm_up_names())
+    if METRICS_PORT:
+        # Prometheus scrapes http://<host>:METRICS_PORT/metrics; a no-op when
+        # the server is already running (after load_registry.clear()).
+        serve_metrics(METRICS_PORT, collect=registry.stats)
+    return registry
 
 
 def login_screen():
@@ -23,6 +34,67 @@ def login_screen():
 def set_mode(mode):
     st.session_state.mode = mode
 
+def generate_response(prompt, history, history_key, cache_scope=None):
+    """
+    Render the assistant's answer inside the current chat message; returns (text, failed).
+    `cache_scope` keeps answer cache entries per user (None: the shared public cache).
+    """
+    telemetry = get_telemetry()
+    start = time.perf_counter()
+
+    # Greetings, small talk and FAQ hits never reach retrieval or the LLM.
+    with telemetry.span("route"):
+        intent, reply = route(prompt)
+    if reply is not None:
+        telemetry.count("requests_total", served_by=f"intent:{intent}")
+        telemetry.observe("turn", time.perf_counter() - start, served_by="intent")
+        st.markdown(reply)
+        return reply, False
+
+    # Near-duplicates of recently answered questions are served from the semantic cache.
+    # The cache key is the prompt alone, so follow-ups (any earlier turn in
+    # `history`, which ends with this prompt) neither read nor fill it.
+    answer_cache = get_registry().answer_cache()
+    use_cache = len(history) <= 1
+    cached = None
+    if use_cache:
+        with telemetry.span("answer_cache"):
+            cached = answer_cache.lookup(prompt, scope=cache_scope)
+    telemetry.count("answer_cache_total", result="bypass" if not use_cache else "hit" if cached is not None else "miss")
+    if cached is not None:
+        telemetry.count("requests_total", served_by="answer_cache")
+        telemetry.observe("turn", time.perf_counter() - start, served_by="answer_cache")
+        st.markdown(cached)
+        return cached, False
+
+    with st.spinner("In progress...", show_time=True):
+        # Recent turns verbatim, older ones summarised, within a token budget.
+        with telemetry.span("history_compact"):
+            compacted = get_registry().history_manager().compact(history_key, history)
+        agent = create_agent(prompt, compacted, stream=True)
+
+    # Tokens are rendered as they arrive; write_stream returns the full text.
+    response = st.write_stream(agent.rag_response_stream)
+    telemetry.count("requests_total", served_by="agent")
+    telemetry.observe("turn", time.perf_counter() - start, served_by="agent")
+    telemetry.log("turn", intent=intent, chars=len(str(response)), **{
+        stage: round(seconds, 3) for stage, seconds in agent.timings.items() if isinstance(seconds, float)
+    })
+
+    # Agents flag error replies; a real answer may still mention "error".
+    if use_cache and not agent.failed:
+        answer_cache.store(prompt, response, scope=cache_scope)
+
+    # Older turns are summarised in the background, after the reply; the next
+    # turns use the summary once it is ready.
+    if not agent.failed:
+        get_registry().history_manager().update_summary(
+            history_key, [*history, {"role": "assistant", "content": str(response)}]
+        )
+
+    return response, agent.failed
+
+
 def use_public():
     # --- Public Chat (no login) ---
     st.title("PTI Chatbot")
@@ -41,17 +113,9 @@ def use_public():
         with st.chat_message("user"):
             st.markdown(prompt)
         with st.chat_message("assistant"):
-            with st.spinner("In progress...", show_time=True):
-                llmaIndexAgent =  LmmaIndexAgent(prompt, st.session_state.messages)
-                response = llmaIndexAgent.rag_response
-                context = llmaIndexAgent.llma_index_context
-                answer = llmaIndexAgent.llma_index_answer
-
-                # groqAgent = GroqAgent(prompt, st.session_state.messages)
-                # response = groqAgent.rag_response
-
-                print(f"Answer: {answer}")
-                st.markdown(response)
+            if "session_key" not in st.session_state:
+                st.session_state.session_key = f"public-{uuid.uuid4()}"
+            response, _ = generate_response(prompt, st.session_state.messages, st.session_state.session_key)
         st.session_state.messages.append({"role": "assistant", "content": response})
 
 
@@ -70,6 +134,8 @@ def main():
     st.html("<title>PTI chatbot</title>")
     st.html(hide_streamlit_watermark())
 
+    load_registry()
+
     # st.write(st.secrets)
 
     # --- Google Auth ---
@@ -112,29 +178,23 @@ def main():
         supabase = st.connection("supabase", type=SupabaseConnection)
         user_id = email or username or name or "unknown"
 
-        # Load chat history from Supabase
+        # Load the latest page of chat history from Supabase; older pages on demand
         if "private_messages" not in st.session_state:
-            # Try to fetch from Supabase
             try:
-                df = execute_query(supabase.table("chat_history").select("*").eq("user_id", (user_id)), ttl=0)
-
-                data = df.data if df.data else []
-                if data:
-                    df_data = pd.DataFrame(data)
-                    st.session_state.private_messages = df_data[["role", "content"]].to_dict("records")
-                else:
-                    st.session_state.private_messages = []
+                with get_telemetry().span("history_load"):
+                    messages, cursor = load_history_page(supabase, user_id)
             except Exception as e:
-                st.session_state.private_messages = []
-
-        # Show chat history in sidebar
-        for msg in st.session_state.private_messages:
-            # st.sidebar.markdown(f"**{msg['role'].capitalize()}:** {msg['content']}")
-            pass
+                get_telemetry().log("history_load_failed", error=e)
+                messages, cursor = [], None
+            st.session_state.private_messages = messages
+            st.session_state.history_cursor = cursor
 
         st.title("PTI Private Chatbot")
         st.caption("A private chatbot for the Petroleum Training Institute (Google Authenticated)")
 
+        if st.session_state.get("history_cursor") is not None:
+            st.button("Load earlier messages", on_click=load_earlier_messages, args=(supabase, user_id))
+
         # Show chat messages in main pane
         for message in st.session_state.private_messages:
             with st.chat_message(message["role"]):
@@ -149,41 +209,36 @@ def main():
 
             # Generate assistant response
             with st.chat_message("assistant"):
-                with st.spinner("In progress...", show_time=True):
-                    llmaIndexAgent =  LmmaIndexAgent(prompt, st.session_state.private_messages)
-                    response = llmaIndexAgent.rag_response
-                    context = llmaIndexAgent.llma_index_context
-                    answer = llmaIndexAgent.llma_index_answer
-
-                    # groqAgent = GroqAgent(prompt, st.session_state.private_messages)
-                    # response = groqAgent.rag_response
-
-                    print(f"Answer: {answer}")
-
-                    if "error" in str(response).lower():
-                        st.error(response)
-                    else:
-                        st.markdown(response)
-
-                        # Prepare assistant message
-                        assistant_msg = {"role": "assistant", "content": response}
-                        st.session_state.private_messages.append(assistant_msg)
-
-                        # Save both user and assistant messages to Supabase
-                        try:
-                            timestamp = datetime.datetime.now(datetime.timezone.utc).isoformat()
-                            rows = [
-                                {"user_id": user_id, "role": "user", "content": str(prompt), "timestamp": str(timestamp)},
-                                {"user_id": user_id, "role": "assistant", "content": str(response), "timestamp": str(timestamp)}
-                            ]
-                            df2 = execute_query(
-                                supabase.table("chat_history").insert(rows, count="None"),
-                                ttl=0,
-                            )
-                            # print(df2)
-                        except Exception as e:
-                            st.warning("Could not save chat to database.")
-
+                response, failed = generate_response(
+                    prompt, st.session_state.private_messages, user_id, cache_scope=f"user:{user_id}"
+                )
+
+                # Failed answers are shown to the user but not persisted.
+                if not failed:
+                    # Prepare assistant message
+                    assistant_msg = {"role": "assistant", "content": response}
+                    st.session_state.private_messages.append(assistant_msg)
+
+                    # Save both user and assistant messages to Supabase in the background
+                    timestamp = datetime.datetime.now(datetime.timezone.utc).isoformat()
+                    rows = [
+                        {"user_id": user_id, "role": "user", "content": str(prompt), "timestamp": str(timestamp)},
+                        {"user_id": user_id, "role": "assistant", "content": str(response), "timestamp": str(timestamp)}
+                    ]
+                    get_registry().chat_writer(supabase).save(rows)
+
+
+
+def load_earlier_messages(supabase, user_id):
+    try:
+        with get_telemetry().span("history_load", page="earlier"):
+            messages, cursor = load_history_page(supabase, user_id, before=st.session_state.history_cursor)
+    except Exception as e:
+        get_telemetry().log("history_load_failed", error=e)
+        st.warning("Could not load earlier messages.")
+        return
+    st.session_state.private_messages = messages + st.session_state.private_messages
+    st.session_state.history_cursor = cursor
 
 
 def hide_streamlit_watermark():
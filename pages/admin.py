@@ -0,0 +1,100 @@
+import time
+import pandas as pd
+import streamlit as st
+from common.registry import get_registry, ADMIN_EMAILS
+from common.telemetry import get_telemetry
+
+
+st.set_page_config(page_title="PTI chatbot admin", page_icon="assets/pti_logo_bg.jpeg", layout="wide")
+
+# Only for the emails listed in ADMIN_EMAILS; everyone else sees nothing.
+email = getattr(st.user, "email", None) if st.user.is_logged_in else None
+if not email or email.lower() not in ADMIN_EMAILS:
+    st.error("This page is only available to administrators.")
+    st.stop()
+
+st.title("Pipeline metrics")
+st.caption("In-process since the server started; the same data is served to Prometheus on METRICS_PORT.")
+live = st.sidebar.toggle("Live refresh (5s)", value=False)
+if st.sidebar.button("Reset metrics"):
+    get_telemetry().reset()
+
+
+def latency_section(snapshot):
+    histograms = snapshot["histograms"]
+    if not histograms:
+        st.info("No requests yet.")
+        return
+
+    def label(histogram):
+        labels = ",".join(f"{key}={value}" for key, value in histogram["labels"].items())
+        return f"{histogram['stage']} ({labels})" if labels else histogram["stage"]
+
+    st.dataframe(pd.DataFrame([
+        {
+            "stage": label(histogram),
+            "count": histogram["count"],
+            "mean_ms": 1000 * histogram["sum"] / histogram["count"] if histogram["count"] else None,
+            **{key: 1000 * histogram[key] if histogram[key] is not None else None for key in ("p50", "p95", "p99")},
+        }
+        for histogram in histograms
+    ]).set_index("stage"), use_container_width=True)
+
+    choice = st.selectbox("Latency distribution", [label(histogram) for histogram in histograms])
+    histogram = next(histogram for histogram in histograms if label(histogram) == choice)
+    st.bar_chart(pd.DataFrame(
+        {"requests": [count for _, count in histogram["buckets"]]},
+        index=[f"≤{bound:g}s" if bound != float("inf") else f">{histogram['buckets'][-2][0]:g}s" for bound, _ in histogram["buckets"]],
+    ))
+
+
+def counters_section(snapshot):
+    counters = snapshot["counters"]
+    if counters:
+        st.dataframe(pd.DataFrame([
+            {"counter": counter["name"], "labels": ",".join(f"{key}={value}" for key, value in counter["labels"].items()), "value": counter["value"]}
+            for counter in counters
+        ]), hide_index=True, use_container_width=True)
+    else:
+        st.info("No counters yet.")
+
+    with st.expander("Components (caches, router, writer)"):
+        st.json(get_registry().stats(), expanded=False)
+
+
+def recent_section(snapshot):
+    spans, events = snapshot["spans"], snapshot["events"]
+    left, right = st.columns(2)
+    with left:
+        st.subheader("Recent spans")
+        if spans:
+            st.dataframe(pd.DataFrame([
+                {**span, "start": time.strftime("%H:%M:%S", time.localtime(span["start"])), "duration_ms": 1000 * span["duration"]}
+                for span in reversed(spans)
+            ]).drop(columns=["duration"]), hide_index=True, use_container_width=True)
+    with right:
+        st.subheader("Recent events")
+        if events:
+            st.dataframe(pd.DataFrame([
+                {**event, "time": time.strftime("%H:%M:%S", time.localtime(event["time"]))}
+                for event in reversed(events)
+            ]).astype(str), hide_index=True, use_container_width=True)
+
+
+@st.fragment(run_every=5 if live else None)
+def dashboard():
+    snapshot = get_telemetry().snapshot()
+    latency, counters, recent, export = st.tabs(["Latency", "Counters", "Recent", "Prometheus"])
+    with latency:
+        latency_section(snapshot)
+    with counters:
+        counters_section(snapshot)
+    with recent:
+        recent_section(snapshot)
+    with export:
+        text = get_telemetry().prometheus(get_registry().stats())
+        st.download_button("Download metrics.txt", text, file_name="metrics.txt", mime="text/plain")
+        st.code(text, language=None)
+
+
+dashboard()
@@ -0,0 +1,549 @@
+"""
+Compact storage backends for LightRAG.
+
+LightRAG's defaults keep everything in JSON files that are parsed whole at
+startup and rewritten whole after every indexing step (the doc status and
+full-docs stores alone are ~4 MB each). These replace them:
+
+- SQLiteKVStorage / SQLiteDocStatusStorage: one row per key in
+  `lightrag.sqlite` in the working dir. Writes touch only the changed rows,
+  and LLM cache entries are stored per (mode, hash) so a cache write does
+  not re-serialize the whole mode.
+- MmapVectorStorage: vectors as contiguous float32 rows in
+  `vdb_<namespace>.f32`, memory-mapped, with the id -> row index and the
+  meta fields in SQLite. Deleted rows are reused by later inserts. Past a
+  few thousand vectors, queries go through an IVF index
+  (retrieval/ann_index.py) saved next to it as `vdb_<namespace>.ivf.npz`.
+
+`register_storages()` makes them selectable by name in LightRAG(...), and
+`migrate_json_storage()` imports an existing JSON working dir once.
+"""
+import os
+import json
+import time
+import base64
+import sqlite3
+from dataclasses import dataclass
+from typing import Any, final
+
+import numpy as np
+
+from lightrag.base import BaseKVStorage, BaseVectorStorage, DocProcessingStatus, DocStatus, DocStatusStorage
+from lightrag.utils import compute_mdhash_id
+
+from retrieval.ann_index import IVFIndex
+from common.telemetry import get_telemetry
+
+
+DB_FILE = "lightrag.sqlite"
+# SQLite's default limit on bound parameters is 999 on older builds.
+_IN_BATCH = 500
+
+
+def _connect(working_dir):
+    db = sqlite3.connect(os.path.join(working_dir, DB_FILE), check_same_thread=False)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.executescript("""
+        CREATE TABLE IF NOT EXISTS kv (
+            namespace TEXT NOT NULL,
+            mode TEXT NOT NULL DEFAULT '',
+            id TEXT NOT NULL,
+            status TEXT,
+            value TEXT NOT NULL,
+            PRIMARY KEY (namespace, mode, id)
+        );
+        CREATE INDEX IF NOT EXISTS kv_status ON kv (namespace, status);
+        CREATE TABLE IF NOT EXISTS vectors (
+            namespace TEXT NOT NULL,
+            id TEXT NOT NULL,
+            row INTEGER NOT NULL,
+            created_at REAL,
+            meta TEXT NOT NULL,
+            PRIMARY KEY (namespace, id)
+        );
+    """)
+    return db
+
+
+def _batches(items):
+    items = list(items)
+    for start in range(0, len(items), _IN_BATCH):
+        batch = items[start:start + _IN_BATCH]
+        yield batch, ",".join("?" * len(batch))
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False)
+
+
+@final
+@dataclass
+class SQLiteKVStorage(BaseKVStorage):
+    def __post_init__(self):
+        self._db = _connect(self.global_config["working_dir"])
+        # The LLM response cache is keyed by mode, then by prompt hash.
+        self._is_cache = self.namespace.endswith("cache")
+
+    async def finalize(self):
+        self._db.close()
+
+    async def index_done_callback(self) -> None:
+        # Every write is committed as it happens.
+        pass
+
+    async def get_by_id(self, id: str) -> dict[str, Any] | None:
+        if self._is_cache:
+            return self._get_mode(id)
+        row = self._db.execute("SELECT value FROM kv WHERE namespace=? AND mode='' AND id=?", (self.namespace, id)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    async def get_by_ids(self, ids: list[str]) -> list[dict[str, Any]]:
+        if self._is_cache:
+            return [self._get_mode(id) for id in ids]
+        found = {}
+        for batch, marks in _batches(ids):
+            found.update(self._db.execute(
+                f"SELECT id, value FROM kv WHERE namespace=? AND mode='' AND id IN ({marks})",
+                (self.namespace, *batch),
+            ))
+        return [json.loads(found[id]) if id in found else None for id in ids]
+
+    async def get_by_mode_and_id(self, mode: str, id: str) -> dict[str, Any] | None:
+        """One LLM cache entry as {id: entry}; LightRAG uses this instead of loading the whole mode."""
+        if not self._is_cache:
+            return None
+        row = self._db.execute("SELECT value FROM kv WHERE namespace=? AND mode=? AND id=?", (self.namespace, mode, id)).fetchone()
+        return {id: json.loads(row[0])} if row else None
+
+    async def get_all(self) -> dict[str, Any]:
+        result = {}
+        for mode, id, value in self._db.execute("SELECT mode, id, value FROM kv WHERE namespace=?", (self.namespace,)):
+            if self._is_cache:
+                result.setdefault(mode, {})[id] = json.loads(value)
+            else:
+                result[id] = json.loads(value)
+        return result
+
+    async def filter_keys(self, keys: set[str]) -> set[str]:
+        column = "mode" if self._is_cache else "id"
+        existing = set()
+        for batch, marks in _batches(keys):
+            existing.update(id for (id,) in self._db.execute(
+                f"SELECT DISTINCT {column} FROM kv WHERE namespace=? AND {column} IN ({marks})",
+                (self.namespace, *batch),
+            ))
+        return set(keys) - existing
+
+    async def upsert(self, data: dict[str, dict[str, Any]]) -> None:
+        if not data:
+            return
+        if self._is_cache:
+            rows = [(self.namespace, mode, id, None, _dumps(entry)) for mode, entries in data.items() for id, entry in entries.items()]
+        else:
+            rows = [(self.namespace, "", id, None, _dumps(value)) for id, value in data.items()]
+        with self._db:
+            self._db.executemany("INSERT OR REPLACE INTO kv (namespace, mode, id, status, value) VALUES (?, ?, ?, ?, ?)", rows)
+
+    async def delete(self, ids: list[str]) -> None:
+        # For the LLM cache the ids are modes (see drop_cache_by_modes).
+        column = "mode" if self._is_cache else "id"
+        with self._db:
+            for batch, marks in _batches(ids):
+                self._db.execute(f"DELETE FROM kv WHERE namespace=? AND {column} IN ({marks})", (self.namespace, *batch))
+
+    async def drop_cache_by_modes(self, modes: list[str] | None = None) -> bool:
+        if not modes:
+            return False
+        try:
+            await self.delete(modes)
+            return True
+        except Exception:
+            return False
+
+    async def drop(self) -> dict[str, str]:
+        try:
+            with self._db:
+                self._db.execute("DELETE FROM kv WHERE namespace=?", (self.namespace,))
+            return {"status": "success", "message": "data dropped"}
+        except Exception as e:
+            return {"status": "error", "message": str(e)}
+
+    def _get_mode(self, mode):
+        rows = self._db.execute("SELECT id, value FROM kv WHERE namespace=? AND mode=?", (self.namespace, mode)).fetchall()
+        return {id: json.loads(value) for id, value in rows} or None
+
+
+@final
+@dataclass
+class SQLiteDocStatusStorage(DocStatusStorage):
+    """Document status rows, with the status in its own indexed column for the by-status queries."""
+
+    def __post_init__(self):
+        self._db = _connect(self.global_config["working_dir"])
+
+    async def finalize(self):
+        self._db.close()
+
+    async def index_done_callback(self) -> None:
+        pass
+
+    async def get_by_id(self, id: str) -> dict[str, Any] | None:
+        row = self._db.execute("SELECT value FROM kv WHERE namespace=? AND mode='' AND id=?", (self.namespace, id)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    async def get_by_ids(self, ids: list[str]) -> list[dict[str, Any]]:
+        found = {}
+        for batch, marks in _batches(ids):
+            found.update(self._db.execute(
+                f"SELECT id, value FROM kv WHERE namespace=? AND mode='' AND id IN ({marks})",
+                (self.namespace, *batch),
+            ))
+        # Like the JSON doc status store, missing documents are left out.
+        return [json.loads(found[id]) for id in ids if id in found]
+
+    async def filter_keys(self, keys: set[str]) -> set[str]:
+        existing = set()
+        for batch, marks in _batches(keys):
+            existing.update(id for (id,) in self._db.execute(
+                f"SELECT id FROM kv WHERE namespace=? AND mode='' AND id IN ({marks})",
+                (self.namespace, *batch),
+            ))
+        return set(keys) - existing
+
+    async def get_status_counts(self) -> dict[str, int]:
+        counts = {status.value: 0 for status in DocStatus}
+        for status, count in self._db.execute("SELECT status, COUNT(*) FROM kv WHERE namespace=? GROUP BY status", (self.namespace,)):
+            counts[status] = count
+        return counts
+
+    async def get_docs_by_status(self, status: DocStatus) -> dict[str, DocProcessingStatus]:
+        result = {}
+        for id, value in self._db.execute("SELECT id, value FROM kv WHERE namespace=? AND status=?", (self.namespace, status.value)):
+            data = json.loads(value)
+            data.setdefault("content", data.get("content_summary", ""))
+            data.setdefault("file_path", "no-file-path")
+            try:
+                result[id] = DocProcessingStatus(**data)
+            except (KeyError, TypeError) as e:
+                get_telemetry().log("lightrag_bad_doc_status", doc_id=id, error=e)
+        return result
+
+    async def upsert(self, data: dict[str, dict[str, Any]]) -> None:
+        if not data:
+            return
+        rows = [
+            (self.namespace, "", id, getattr(value.get("status"), "value", value.get("status")), _dumps(value))
+            for id, value in data.items()
+        ]
+        with self._db:
+            self._db.executemany("INSERT OR REPLACE INTO kv (namespace, mode, id, status, value) VALUES (?, ?, ?, ?, ?)", rows)
+
+    async def delete(self, doc_ids: list[str]) -> None:
+        with self._db:
+            for batch, marks in _batches(doc_ids):
+                self._db.execute(f"DELETE FROM kv WHERE namespace=? AND id IN ({marks})", (self.namespace, *batch))
+
+    async def drop(self) -> dict[str, str]:
+        try:
+            with self._db:
+                self._db.execute("DELETE FROM kv WHERE namespace=?", (self.namespace,))
+            return {"status": "success", "message": "data dropped"}
+        except Exception as e:
+            return {"status": "error", "message": str(e)}
+
+
+@final
+@dataclass
+class MmapVectorStorage(BaseVectorStorage):
+    """
+    Vectors are normalized on insert, so an exact query is one matrix-vector
+    product over the mapped rows. An update writes the new vector to a free
+    row and repoints the id in the same transaction, so the file never holds
+    a half-replaced vector for a committed id.
+
+    Once the namespace holds `ann_min_vectors` vectors (set through
+    vector_db_storage_cls_kwargs, default 5000), queries use the IVF index,
+    probing `ann_nprobe` lists. New rows are added to it as they are written;
+    it is saved in index_done_callback and repaired on load if the process
+    stopped in between.
+    """
+
+    def __post_init__(self):
+        kwargs = self.global_config.get("vector_db_storage_cls_kwargs", {})
+        threshold = kwargs.get("cosine_better_than_threshold")
+        if threshold is None:
+            raise ValueError("cosine_better_than_threshold must be specified in vector_db_storage_cls_kwargs")
+        self.cosine_better_than_threshold = threshold
+
+        working_dir = self.global_config["working_dir"]
+        self._path = os.path.join(working_dir, f"vdb_{self.namespace}.f32")
+        self._index_path = os.path.join(working_dir, f"vdb_{self.namespace}.ivf.npz")
+        self._ann_options = {"min_train": kwargs.get("ann_min_vectors", 5000), "nprobe": kwargs.get("ann_nprobe")}
+        self._dim = self.embedding_func.embedding_dim
+        self._max_batch_size = self.global_config["embedding_batch_num"]
+        self._db = _connect(working_dir)
+        self._load()
+
+    def _load(self):
+        self._rows = dict(self._db.execute("SELECT id, row FROM vectors WHERE namespace=?", (self.namespace,)))
+        self._ids = {row: id for id, row in self._rows.items()}
+        self._capacity = 0
+        self._vectors = None
+        self._high = max(self._rows.values(), default=-1) + 1
+        self._map(max(self._high, 1))
+        self._live = np.zeros(self._capacity, dtype=bool)
+        self._live[list(self._ids)] = True
+        self._free = sorted(set(range(self._high)) - set(self._ids), reverse=True)
+
+        self._index = IVFIndex(**self._ann_options).load(self._index_path)
+        self._index.sync(self._vectors, list(self._ids))
+        self._train_if_needed()
+
+    def _train_if_needed(self):
+        if self._index.needs_training(len(self._ids)):
+            start = time.perf_counter()
+            self._index.fit(self._vectors, sorted(self._ids))
+            get_telemetry().log(
+                "ivf_trained", namespace=self.namespace, lists=len(self._index.centroids),
+                vectors=len(self._ids), seconds=round(time.perf_counter() - start, 1),
+            )
+
+    def _map(self, rows):
+        if rows <= self._capacity:
+            return
+        capacity = max(1024, self._capacity)
+        while capacity < rows:
+            capacity *= 2
+        size = capacity * self._dim * 4
+        with open(self._path, "ab") as file:
+            if file.tell() < size:
+                file.truncate(size)
+        self._vectors = np.memmap(self._path, dtype=np.float32, mode="r+", shape=(capacity, self._dim))
+        if self._capacity:
+            self._live = np.concatenate([self._live, np.zeros(capacity - self._capacity, dtype=bool)])
+        self._capacity = capacity
+
+    def _allocate(self, count):
+        rows = [self._free.pop() for _ in range(min(count, len(self._free)))]
+        rows.extend(range(self._high, self._high + count - len(rows)))
+        self._high = max(self._high, max(rows, default=-1) + 1)
+        self._map(self._high)
+        return rows
+
+    async def finalize(self):
+        self._db.close()
+
+    async def index_done_callback(self) -> None:
+        self._vectors.flush()
+        self._index.save(self._index_path)
+
+    async def upsert(self, data: dict[str, dict[str, Any]]) -> None:
+        if not data:
+            return
+        get_telemetry().count("lightrag_vectors_total", len(data), namespace=self.namespace)
+
+        contents = [value["content"] for value in data.values()]
+        embeddings = []
+        for start in range(0, len(contents), self._max_batch_size):
+            embeddings.append(await self.embedding_func(contents[start:start + self._max_batch_size]))
+        matrix = np.asarray(np.concatenate(embeddings), dtype=np.float32)
+        if len(matrix) != len(data):
+            get_telemetry().log("lightrag_embedding_mismatch", namespace=self.namespace, embeddings=len(matrix), records=len(data))
+            return
+        matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+        rows = self._allocate(len(data))
+        self._vectors[rows] = matrix
+        self._vectors.flush()
+
+        now = time.time()
+        replaced = [self._rows[id] for id in data if id in self._rows]
+        with self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO vectors (namespace, id, row, created_at, meta) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (self.namespace, id, row, now, _dumps({k: v for k, v in value.items() if k in self.meta_fields}))
+                    for (id, value), row in zip(data.items(), rows)
+                ],
+            )
+
+        self._release(replaced)
+        for id, row in zip(data, rows):
+            self._rows[id] = row
+            self._ids[row] = id
+            self._live[row] = True
+        self._index.add(rows, matrix)
+        self._train_if_needed()
+
+    async def query(self, query: str, top_k: int, ids: list[str] | None = None) -> list[dict[str, Any]]:
+        # Queries are not worth keeping in the persistent embedding cache.
+        embedding = await self.embedding_func([query], persist=False)
+        vector = np.asarray(embedding[0], dtype=np.float32)
+        vector /= max(float(np.linalg.norm(vector)), 1e-12)
+
+        hits = [(self._ids[row], score) for row, score in self._search(vector, top_k) if score >= self.cosine_better_than_threshold]
+        records = self._records([id for id, _ in hits])
+        return [
+            {**records[id]["meta"], "id": id, "distance": float(score), "created_at": records[id]["created_at"]}
+            for id, score in hits
+            if id in records
+        ]
+
+    def _search(self, vector, top_k):
+        """Top-k live rows as (row, cosine) pairs, best first."""
+        if not self._rows:
+            return []
+        if self._index.trained:
+            return self._index.search(self._vectors, vector, top_k)
+        scores = self._vectors[:self._high] @ vector
+        scores[~self._live[:self._high]] = -np.inf
+        top_k = min(top_k, len(self._rows))
+        best = np.argpartition(-scores, top_k - 1)[:top_k]
+        best = best[np.argsort(-scores[best])]
+        return [(int(row), float(scores[row])) for row in best]
+
+    def _records(self, ids):
+        records = {}
+        for batch, marks in _batches(ids):
+            for id, created_at, meta in self._db.execute(
+                f"SELECT id, created_at, meta FROM vectors WHERE namespace=? AND id IN ({marks})",
+                (self.namespace, *batch),
+            ):
+                records[id] = {"created_at": created_at, "meta": json.loads(meta)}
+        return records
+
+    def _release(self, rows):
+        for row in rows:
+            self._ids.pop(row, None)
+            self._live[row] = False
+            self._free.append(row)
+        self._free.sort(reverse=True)
+        self._index.remove(rows)
+
+    async def get_by_id(self, id: str) -> dict[str, Any] | None:
+        records = await self.get_by_ids([id])
+        return records[0] if records else None
+
+    async def get_by_ids(self, ids: list[str]) -> list[dict[str, Any]]:
+        records = self._records(ids)
+        return [
+            {**records[id]["meta"], "__id__": id, "__created_at__": records[id]["created_at"]}
+            for id in ids
+            if id in records
+        ]
+
+    async def delete(self, ids: list[str]):
+        ids = [id for id in ids if id in self._rows]
+        if not ids:
+            return
+        with self._db:
+            for batch, marks in _batches(ids):
+                self._db.execute(f"DELETE FROM vectors WHERE namespace=? AND id IN ({marks})", (self.namespace, *batch))
+        self._release([self._rows.pop(id) for id in ids])
+
+    async def delete_entity(self, entity_name: str) -> None:
+        await self.delete([compute_mdhash_id(entity_name, prefix="ent-")])
+
+    async def delete_entity_relation(self, entity_name: str) -> None:
+        ids = [id for (id,) in self._db.execute(
+            "SELECT id FROM vectors WHERE namespace=? AND (json_extract(meta, '$.src_id')=? OR json_extract(meta, '$.tgt_id')=?)",
+            (self.namespace, entity_name, entity_name),
+        )]
+        await self.delete(ids)
+
+    @property
+    async def client_storage(self):
+        # Document deletion scans every record through this (NanoVectorDB's layout).
+        return {"data": await self.get_by_ids(list(self._rows))}
+
+    async def search_by_prefix(self, prefix: str) -> list[dict[str, Any]]:
+        ids = [id for id in self._rows if id.startswith(prefix)]
+        return [{**record, "id": record["__id__"]} for record in await self.get_by_ids(ids)]
+
+    async def drop(self) -> dict[str, str]:
+        try:
+            with self._db:
+                self._db.execute("DELETE FROM vectors WHERE namespace=?", (self.namespace,))
+            if os.path.exists(self._path):
+                del self._vectors
+                os.remove(self._path)
+            if os.path.exists(self._index_path):
+                os.remove(self._index_path)
+            self._load()
+            return {"status": "success", "message": "data dropped"}
+        except Exception as e:
+            return {"status": "error", "message": str(e)}
+
+
+STORAGE_CLASSES = {
+    "KV_STORAGE": "SQLiteKVStorage",
+    "VECTOR_STORAGE": "MmapVectorStorage",
+    "DOC_STATUS_STORAGE": "SQLiteDocStatusStorage",
+}
+
+
+def register_storages():
+    """Make the classes above selectable by name (LightRAG only resolves names from its own table)."""
+    from lightrag.kg import STORAGES, STORAGE_IMPLEMENTATIONS, STORAGE_ENV_REQUIREMENTS
+
+    for storage_type, name in STORAGE_CLASSES.items():
+        STORAGES[name] = __name__
+        STORAGE_ENV_REQUIREMENTS[name] = []
+        implementations = STORAGE_IMPLEMENTATIONS[storage_type]["implementations"]
+        if name not in implementations:
+            implementations.append(name)
+
+
+def migrate_json_storage(working_dir):
+    """
+    One-off import of LightRAG's JSON files (kv_store_*.json, vdb_*.json) into
+    the compact storage, when it is still empty. The JSON files are renamed to
+    *.json.migrated afterwards. Returns the number of records imported.
+    """
+    db = _connect(working_dir)
+    try:
+        if db.execute("SELECT 1 FROM kv LIMIT 1").fetchone() or db.execute("SELECT 1 FROM vectors LIMIT 1").fetchone():
+            return 0
+
+        imported = 0
+        migrated = []
+        for name in sorted(os.listdir(working_dir)):
+            path = os.path.join(working_dir, name)
+            if name.startswith("kv_store_") and name.endswith(".json"):
+                namespace = name[len("kv_store_"):-len(".json")]
+                with open(path, "r", encoding="utf-8") as file:
+                    data = json.load(file)
+                if namespace.endswith("cache"):
+                    rows = [(namespace, mode, id, None, _dumps(entry)) for mode, entries in data.items() for id, entry in entries.items()]
+                else:
+                    rows = [(namespace, "", id, value.get("status") if namespace == "doc_status" else None, _dumps(value)) for id, value in data.items()]
+                with db:
+                    db.executemany("INSERT OR REPLACE INTO kv (namespace, mode, id, status, value) VALUES (?, ?, ?, ?, ?)", rows)
+                imported += len(rows)
+                migrated.append(path)
+
+            elif name.startswith("vdb_") and name.endswith(".json"):
+                namespace = name[len("vdb_"):-len(".json")]
+                with open(path, "r", encoding="utf-8") as file:
+                    data = json.load(file)
+                dim = data["embedding_dim"]
+                matrix = np.frombuffer(base64.b64decode(data["matrix"]), dtype=np.float32).reshape(-1, dim) if data["data"] else np.zeros((0, dim), dtype=np.float32)
+                matrix = matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+                with open(os.path.join(working_dir, f"vdb_{namespace}.f32"), "wb") as file:
+                    file.write(np.ascontiguousarray(matrix, dtype=np.float32).tobytes())
+
+                rows = []
+                for row, record in enumerate(data["data"]):
+                    meta = {k: v for k, v in record.items() if not k.startswith("__")}
+                    rows.append((namespace, record["__id__"], row, record.get("__created_at__"), _dumps(meta)))
+                with db:
+                    db.executemany("INSERT OR REPLACE INTO vectors (namespace, id, row, created_at, meta) VALUES (?, ?, ?, ?, ?)", rows)
+                imported += len(rows)
+                migrated.append(path)
+
+        for path in migrated:
+            os.replace(path, path + ".migrated")
+        return imported
+    finally:
+        db.close()
@@ -31,7 +31,6 @@ class RagAgent:
         self.history_messages = None
 
         google_api_key = os.getenv('GOOGLE_API_KEY')
-        print(google_api_key) 
         self.client = genai.Client(api_key=google_api_key)
 
         self.rag = asyncio.run(self.initialize_rag())
@@ -1,27 +1,19 @@
 import os
 import json
 import numpy as np
-from google import genai
-from google.genai import types
 from dotenv import load_dotenv
-from lightrag.utils import EmbeddingFunc
-from lightrag import LightRAG, QueryParam
-from sentence_transformers import SentenceTransformer
-from lightrag.kg.shared_storage import initialize_pipeline_status
+from common.registry import get_registry
+from ingestion.stream_ingest import ingest_corpus, corpus_path
+from common.event_loop import run
+from common.telemetry import get_telemetry
 
+import time
 import asyncio
-import nest_asyncio
-import torch
 
-torch.classes.__path__ = []
-
-# Apply nest_asyncio to solve event loop issues
-nest_asyncio.apply()
+# torch, sentence_transformers, google-genai and lightrag are imported inside
+# the functions that need them so importing this module stays cheap.
 
 load_dotenv()
-gemini_api_key = os.getenv("GOOGLE_API_KEY")
-
-# print(gemini_api_key)
 
 # DATA_DIR="data/pti_markdown_results_all.json"
 # WORKING_DIR = "data/lrag"
@@ -34,12 +26,16 @@ MD_DIR=os.path.abspath('./data/pti_data.txt')
 if not os.path.exists(WORKING_DIR):
     os.mkdir(WORKING_DIR)
 
+# "compact" (SQLite KV + mmap vectors, see rag/lrag_storage.py) or "json"
+# (LightRAG's default JSON files).
+LIGHTRAG_STORAGE = os.getenv("LIGHTRAG_STORAGE", "compact")
+
 
 async def llm_model_func(
     prompt, system_prompt=None, history_messages=[], keyword_extraction=False, **kwargs
 ) -> str:
-    # 1. Initialize the GenAI Client with your Gemini API Key
-    client = genai.Client(api_key=gemini_api_key)
+    # 1. Reuse the process-wide GenAI Client
+    client = get_registry().genai_client()
 
     # 2. Combine prompts: system prompt, history, and user prompt
     if history_messages is None:
@@ -64,29 +60,44 @@ async def llm_model_func(
     # Finally, add the new user prompt
     combined_prompt += f"user: {prompt}"
 
-    # 3. Call the Gemini model
-    response = client.models.generate_content(
-        # model="gemini-1.5-flash",
-        model="gemini-1.5-pro",
-        contents=[combined_prompt],
-        config=types.GenerateContentConfig(max_output_tokens=500, temperature=0.1, response_mime_type="text/plain"),
-    )
+    # 3. Generate through the router (Gemini Pro first, hedged/failed over to Groq),
+    # so a 429 during indexing does not fail the whole document.
+    response_text = await get_registry().llm_router("gemini-1.5-pro").generate(combined_prompt)
 
-    print(f"LLM: {response.text}")
+    get_telemetry().log("lightrag_llm", keyword_extraction=keyword_extraction, prompt_chars=len(combined_prompt), response_chars=len(response_text or ""))
 
     # 4. Return the response text
-    return response.text
+    return response_text
 
 
-async def embedding_func(texts: list[str]) -> np.ndarray:
-    model = SentenceTransformer("all-MiniLM-L6-v2")
-    embeddings = model.encode(texts, convert_to_numpy=True)
-    return embeddings
+async def embedding_func(texts: list[str], persist=True) -> np.ndarray:
+    # Batched with other callers on the service's worker thread (off the event
+    # loop); chunks embedded in an earlier ingestion come from the disk cache.
+    # Query text (persist=False, see MmapVectorStorage.query) is not written to it.
+    return await get_registry().embedding_service().aembed(texts, persist=persist)
 
 
 async def initialize_rag():
+    from lightrag import LightRAG
+    from lightrag.utils import EmbeddingFunc
+    from lightrag.kg.shared_storage import initialize_pipeline_status
+
+    storages = {}
+    if LIGHTRAG_STORAGE == "compact":
+        from rag.lrag_storage import register_storages, migrate_json_storage
+        register_storages()
+        storages = dict(
+            kv_storage="SQLiteKVStorage",
+            vector_storage="MmapVectorStorage",
+            doc_status_storage="SQLiteDocStatusStorage",
+        )
+        imported = await asyncio.to_thread(migrate_json_storage, WORKING_DIR)
+        if imported:
+            get_telemetry().log("lightrag_migrated", records=imported)
+
     rag = LightRAG(
         working_dir=WORKING_DIR,
+        **storages,
         llm_model_func=llm_model_func,
         embedding_func=EmbeddingFunc(
             embedding_dim=384,
@@ -103,6 +114,12 @@ async def initialize_rag():
 
 def rag_retrieve(rag, search_query: str, conversation_history=[]) -> str:
     """Retrieve relevant documents using LightRag based on a search query."""
+    return run(arag_retrieve(rag, search_query, conversation_history))
+
+
+async def arag_retrieve(rag, search_query: str, conversation_history=[]) -> str:
+    # The answer cache is checked and filled by the caller (main.generate_response).
+    from lightrag import QueryParam
 
     custom_prompt = """
         You are an internal chatbot for the Petroleum Training Institute (PTI) in Nigeria.  Your purpose is to provide comprehensive information about PTI to authorized internal personnel.  You have access to and can process all internal data, including but not limited to: student records (names, student IDs, academic performance, contact information, disciplinary records), faculty and staff information (names, roles, contact information, employment history), management structure (organizational charts, contact information, responsibilities), financial records (budgets, expenditures, etc.),  and any other information relevant to PTI's operations.
@@ -122,48 +139,90 @@ def rag_retrieve(rag, search_query: str, conversation_history=[]) -> str:
         - Target format and length: {response_type}
     """
 
-    result = rag.query(
-        search_query, 
-        param=QueryParam(
-            mode="mix", 
-            conversation_history=conversation_history,
-            history_turns=3
-        ),
-        # system_prompt=custom_prompt
-    )
+    with get_telemetry().span("lightrag_query", backend="lightrag"):
+        result = await rag.aquery(
+            search_query, 
+            param=QueryParam(
+                mode="mix", 
+                conversation_history=conversation_history,
+                history_turns=3
+            ),
+            # system_prompt=custom_prompt
+        )
+
+    get_telemetry().log("lightrag_result", chars=len(result or ""))
 
-    print(f"Result: {result}")
     return result
 
 
-def get_markdown_from_file(filename=DATA_DIR):
-    with open(filename, "r", encoding="utf-8") as file:
+def get_markdown_from_file(filename=None):
+    with open(filename or corpus_path(), "r", encoding="utf-8") as file:
         data = json.load(file)
 
-    markdowns = ""
-
-    for item in data:
-        markdowns += f"url: {item['url']} \n content: {item['markdown']} \n\n"
-
-    return markdowns
+    return "".join(f"url: {item['url']} \n content: {item['markdown']} \n\n" for item in data)
 
 def save_markdown_to_file(markdowns, filename=MD_DIR):
     with open(filename, "w", encoding="utf-8") as file:
         file.write(markdowns)
-    print("file created successfully")
+    get_telemetry().log("markdown_saved", path=filename, chars=len(markdowns))
+
 
+def rag_insert_data_to_db(rag, markdowns=None):
+    if markdowns is None:
+        # Per-URL, batched and resumable; unchanged pages are skipped.
+        stats = ingest_corpus(rag)
+        get_telemetry().log("lightrag_ingestion", **stats)
+    else:
+        run(rag.ainsert(markdowns))
 
-def rag_insert_data_to_db(rag, markdowns=get_markdown_from_file()):
-    rag.insert(markdowns)
+    # Answers cached before the re-index may be stale now.
+    get_registry().answer_cache().invalidate()
 
 
 def rag():
-    # Initialize RAG instance
-    rag = asyncio.run(initialize_rag())
+    # Initialize RAG instance on the shared event loop, where all its later calls run too
+    rag = run(initialize_rag())
 
     return rag
 
 
+class LightRagAgent:
+    """Gives the LightRAG pipeline the same interface as the other chat agents."""
+
+    def __init__(self, prompt=None, conversation_history=[], stream=False):
+        self.prompt = prompt
+        self.timings = {}
+        self.rag_response = None
+        self.rag_response_stream = None
+        # Set when the reply is an error message, so it is not cached or saved.
+        self.failed = False
+
+        # Without a prompt the agent is only set up; call `await agent.answer(...)`.
+        if prompt is None:
+            return
+
+        try:
+            run(self.answer(prompt, conversation_history))
+        except Exception as e:
+            get_telemetry().log("agent_error", backend="lightrag", error=e)
+            self.failed = True
+            self.rag_response = "An unexpected error occurred. please try again later ☹️!"
+
+        self.rag_response_stream = iter([self.rag_response]) if stream else None
+
+    async def answer(self, prompt, conversation_history=[]):
+        self.prompt = prompt
+
+        start = time.perf_counter()
+        # First use initializes LightRAG, which itself waits on this loop.
+        with get_telemetry().span("generate", backend="lightrag"):
+            lightrag = await asyncio.to_thread(get_registry().lightrag)
+            self.rag_response = await arag_retrieve(lightrag, prompt, conversation_history)
+        self.timings["generate"] = time.perf_counter() - start
+
+        return self.rag_response
+
+
 # if __name__ == "__main__":
 #     init = rag()
 #     rag_insert_data_to_db(init)
\ No newline at end of file
@@ -0,0 +1,162 @@
+import os
+
+import numpy as np
+
+
+def nlist_for(count):
+    """Number of inverted lists for `count` vectors (about 2 * sqrt(n), the usual IVF sizing)."""
+    return int(np.clip(2 * np.sqrt(count), 16, 8192))
+
+
+def _nearest(matrix, centroids, chunk=65536):
+    labels = np.empty(len(matrix), dtype=np.int32)
+    for start in range(0, len(matrix), chunk):
+        block = np.asarray(matrix[start:start + chunk], dtype=np.float32)
+        labels[start:start + chunk] = np.argmax(block @ centroids.T, axis=1)
+    return labels
+
+
+def _normalize(matrix):
+    return matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+
+class IVFIndex:
+    """
+    Inverted-file ANN index over normalized vectors stored elsewhere (a
+    memory-mapped row file): spherical k-means centroids plus the list each
+    row belongs to. A search scores the centroids, then scores exactly only
+    the rows in the `nprobe` closest lists.
+
+    The index holds row numbers, not vectors, so inserting is one assignment
+    per row and deleting just clears it. It is retrained from scratch once the
+    collection has grown `retrain_growth` times past the size it was trained
+    on, since centroids fitted on a small sample stop describing it. Below
+    `min_train` vectors exact search is fast enough and nothing is trained.
+    """
+
+    def __init__(self, nprobe=None, min_train=5000, retrain_growth=4.0, iterations=12, seed=0):
+        self.nprobe = nprobe
+        self.min_train = min_train
+        self.retrain_growth = retrain_growth
+        self.iterations = iterations
+        self.seed = seed
+
+        self.centroids = None
+        self.assign = np.full(0, -1, dtype=np.int32)
+        self.trained_size = 0
+        self._lists = None
+
+    @property
+    def trained(self):
+        return self.centroids is not None
+
+    def needs_training(self, count):
+        if not self.trained:
+            return count >= self.min_train
+        return count > self.retrain_growth * self.trained_size
+
+    def fit(self, vectors, rows):
+        """Train centroids on (a sample of) `rows` of `vectors`, then assign every row."""
+        rows = np.asarray(rows, dtype=np.int64)
+        rng = np.random.default_rng(self.seed)
+        nlist = min(nlist_for(len(rows)), len(rows))
+
+        # ~40 points per centroid is plenty for k-means; sorted rows read the mmap sequentially.
+        sample = np.sort(rng.choice(rows, min(len(rows), nlist * 40), replace=False))
+        points = np.asarray(vectors[sample], dtype=np.float32)
+        centroids = points[rng.choice(len(points), nlist, replace=False)].copy()
+
+        for _ in range(self.iterations):
+            labels = _nearest(points, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, points)
+            counts = np.bincount(labels, minlength=nlist)
+            empty = counts == 0
+            # Re-seed empty lists with random points so no centroid is wasted.
+            sums[empty] = points[rng.choice(len(points), int(empty.sum()), replace=False)]
+            centroids = _normalize(sums)
+
+        self.centroids = centroids.astype(np.float32)
+        self.assign = np.full(int(rows.max()) + 1 if len(rows) else 0, -1, dtype=np.int32)
+        for start in range(0, len(rows), 65536):
+            block = rows[start:start + 65536]
+            self.assign[block] = _nearest(vectors[block], self.centroids)
+        self.trained_size = len(rows)
+        self._lists = None
+
+    def add(self, rows, matrix):
+        if not self.trained or len(rows) == 0:
+            return
+        rows = np.asarray(rows, dtype=np.int64)
+        self._grow(int(rows.max()) + 1)
+        self.assign[rows] = _nearest(matrix, self.centroids)
+        self._lists = None
+
+    def remove(self, rows):
+        rows = np.asarray([row for row in rows if row < len(self.assign)], dtype=np.int64)
+        if len(rows):
+            self.assign[rows] = -1
+            self._lists = None
+
+    def sync(self, vectors, live_rows):
+        """Repair assignments after a crash between a vector write and the next save()."""
+        if not self.trained:
+            return
+        live_rows = np.asarray(live_rows, dtype=np.int64)
+        self._grow(int(live_rows.max()) + 1 if len(live_rows) else 0)
+        live = np.zeros(len(self.assign), dtype=bool)
+        live[live_rows] = True
+        self.remove(np.nonzero(~live & (self.assign >= 0))[0])
+        missing = live_rows[self.assign[live_rows] < 0]
+        if len(missing):
+            self.add(missing, vectors[missing])
+
+    def search(self, vectors, query, top_k, nprobe=None):
+        """Approximate top-k as (row, cosine) pairs, best first."""
+        lists, offsets = self._inverted_lists()
+        nlist = len(self.centroids)
+        nprobe = min(nprobe or self.nprobe or max(8, nlist // 16), nlist)
+
+        centroid_scores = self.centroids @ query
+        probe = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        candidates = np.sort(np.concatenate([lists[offsets[i]:offsets[i + 1]] for i in probe]))
+        if len(candidates) == 0:
+            return []
+
+        scores = np.asarray(vectors[candidates], dtype=np.float32) @ query
+        top_k = min(top_k, len(candidates))
+        best = np.argpartition(-scores, top_k - 1)[:top_k]
+        best = best[np.argsort(-scores[best])]
+        return [(int(candidates[i]), float(scores[i])) for i in best]
+
+    def _inverted_lists(self):
+        # Rebuilt lazily after inserts/deletes: rows grouped by list, plus list boundaries.
+        if self._lists is None:
+            rows = np.nonzero(self.assign >= 0)[0]
+            labels = self.assign[rows]
+            order = np.argsort(labels, kind="stable")
+            offsets = np.searchsorted(labels[order], np.arange(len(self.centroids) + 1))
+            self._lists = (rows[order], offsets)
+        return self._lists
+
+    def _grow(self, size):
+        if size > len(self.assign):
+            self.assign = np.concatenate([self.assign, np.full(size - len(self.assign), -1, dtype=np.int32)])
+
+    def save(self, path):
+        if not self.trained:
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        with open(path + ".tmp", "wb") as file:
+            np.savez(file, centroids=self.centroids, assign=self.assign, trained_size=self.trained_size)
+        os.replace(path + ".tmp", path)
+
+    def load(self, path):
+        if os.path.exists(path):
+            with np.load(path) as data:
+                self.centroids = data["centroids"]
+                self.assign = data["assign"]
+                self.trained_size = int(data["trained_size"])
+            self._lists = None
+        return self
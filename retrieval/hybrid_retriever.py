@@ -0,0 +1,143 @@
+import re
+import math
+import numpy as np
+from ingestion.chunk_store import ChunkStore, build_chunk_store, update_chunk_store, CHUNK_STORE_DIR
+
+
+INDEX_DIR = CHUNK_STORE_DIR
+
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have how i in is it its of on or that the
+this to was were what when where which who why will with you your
+""".split())
+
+
+def tokenize(text):
+    return [token for token in re.findall(r"\w+", text.lower()) if token not in STOPWORDS]
+
+
+def build_index(embed, filename=None, index_dir=INDEX_DIR, batch_size=64):
+    """
+    Chunk the corpus (the cleaned one when it exists) along its markdown
+    structure, embed every chunk and write the chunk store to `index_dir`.
+
+    `embed` takes a list of texts and returns an (n, dim) array.
+    """
+    return build_chunk_store(embed, filename, index_dir, batch_size)
+
+
+class BM25Index:
+    """Okapi BM25 over an inverted index of term -> (chunk ids, term frequencies)."""
+
+    def __init__(self, texts, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.size = len(texts)
+
+        postings = {}
+        lengths = np.zeros(self.size, dtype=np.float32)
+        for doc_id, text in enumerate(texts):
+            counts = {}
+            tokens = tokenize(text)
+            lengths[doc_id] = len(tokens)
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, count in counts.items():
+                postings.setdefault(token, []).append((doc_id, count))
+
+        self.avg_length = float(lengths.mean()) if self.size else 0.0
+        self._length_norm = self.k1 * (1 - self.b + self.b * lengths / max(self.avg_length, 1e-9))
+        self._postings = {}
+        for token, entries in postings.items():
+            doc_ids = np.fromiter((doc_id for doc_id, _ in entries), dtype=np.int32, count=len(entries))
+            freqs = np.fromiter((count for _, count in entries), dtype=np.float32, count=len(entries))
+            idf = math.log(1 + (self.size - len(entries) + 0.5) / (len(entries) + 0.5))
+            self._postings[token] = (doc_ids, freqs, idf)
+
+    def scores(self, query):
+        scores = np.zeros(self.size, dtype=np.float32)
+        for token in set(tokenize(query)):
+            posting = self._postings.get(token)
+            if posting is None:
+                continue
+            doc_ids, freqs, idf = posting
+            scores[doc_ids] += idf * freqs * (self.k1 + 1) / (freqs + self._length_norm[doc_ids])
+        return scores
+
+
+class LocalHybridRetriever:
+    """
+    In-process replacement for the LlamaCloud dense + sparse retriever.
+
+    Dense scores come from a memory-mapped float32 matrix of normalized MiniLM
+    chunk embeddings and sparse scores from BM25; both are min-max scaled and
+    fused as `alpha * dense + (1 - alpha) * sparse`, so alpha=1 is pure vector
+    search and alpha=0 pure keyword search, as in LlamaCloud.
+    """
+
+    def __init__(self, embed_query, index_dir=INDEX_DIR, alpha=0.5, top_k=3):
+        self.embed_query = embed_query
+        self.alpha = alpha
+        self.top_k = top_k
+
+        self.store = ChunkStore(index_dir)
+        self.embeddings = self.store.embeddings
+        self.bm25 = BM25Index(self.store.texts)
+
+    def dense_scores(self, query):
+        vector = np.asarray(self.embed_query(query), dtype=np.float32).reshape(-1)
+        vector /= max(float(np.linalg.norm(vector)), 1e-12)
+        return self.embeddings @ vector
+
+    def retrieve(self, query, top_k=None, alpha=None):
+        top_k = top_k or self.top_k
+        alpha = self.alpha if alpha is None else alpha
+
+        scores = np.zeros(len(self.store), dtype=np.float32)
+        if alpha > 0:
+            scores += alpha * _min_max(self.dense_scores(query))
+        if alpha < 1:
+            scores += (1 - alpha) * _min_max(self.bm25.scores(query))
+
+        top_k = min(top_k, len(scores))
+        if top_k == 0:
+            return []
+        best = np.argpartition(-scores, top_k - 1)[:top_k]
+        best = best[np.argsort(-scores[best])]
+
+        return [
+            {**self.store[int(i)], "score": float(scores[i])}
+            for i in best
+        ]
+
+
+def format_chunks(chunks):
+    return "\n\n".join(f"url: {chunk['url']} \n content: {chunk['text']}" for chunk in chunks)
+
+
+def _min_max(scores):
+    low = float(scores.min())
+    spread = float(scores.max()) - low
+    if spread <= 0:
+        return np.zeros_like(scores, dtype=np.float32)
+    return ((scores - low) / spread).astype(np.float32)
+
+
+if __name__ == "__main__":
+    import argparse
+    from common.registry import get_registry
+
+    parser = argparse.ArgumentParser(description="Build the local chunk store, or update it to match the corpus.")
+    parser.add_argument("--update", action="store_true", help="Only re-embed pages whose chunks changed (run after ingestion.preprocess)")
+    args = parser.parse_args()
+
+    # Unchanged chunks come out of the embedding cache instead of the model.
+    embed = get_registry().embedding_service().embed
+
+    if args.update:
+        kept, embedded, diff = update_chunk_store(embed, store_dir=INDEX_DIR)
+        print(f"Pages added {len(diff['added'])}, changed {len(diff['changed'])}, removed {len(diff['removed'])}")
+        print(f"Kept {kept} chunks, embedded {embedded} new chunks into {INDEX_DIR}")
+    else:
+        count = build_index(embed)
+        print(f"Indexed {count} chunks into {INDEX_DIR}")
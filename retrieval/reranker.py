@@ -0,0 +1,114 @@
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def text_key(text):
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class CrossEncoderReranker:
+    """
+    Second retrieval stage: a local cross-encoder reads each (query, chunk)
+    pair and keeps the best `top_n` of a wide, cheaply retrieved candidate list.
+
+    Candidates are scored in batches in first-stage order. Once `patience`
+    batches in a row have not changed the top n, the rest of the list is
+    skipped, since the tail of a reasonable first stage rarely wins. Scores are
+    cached per (query hash, chunk id), so repeated questions and overlapping
+    candidate lists do not go through the model again.
+    """
+
+    def __init__(self, score_pairs, model_name="", batch_size=8, patience=1, cache_size=8192):
+        self._score_pairs = score_pairs
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.patience = patience
+        self.cache_size = cache_size
+
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._stats = {
+            "calls": 0,
+            "candidates": 0,
+            "scored": 0,
+            "cache_hits": 0,
+            "skipped": 0,
+            "cutoffs": 0,
+            "rerank_s": 0.0,
+        }
+
+    def rerank(self, query, candidates, top_n=3, text=lambda c: c["text"], key=None):
+        """
+        Best `top_n` candidates as (candidate, score) pairs, best first.
+
+        `text` gives the chunk text of a candidate and `key` a stable chunk id
+        for the score cache (a hash of the text by default).
+        """
+        start = time.perf_counter()
+        texts = [text(candidate) for candidate in candidates]
+        ids = [key(candidate) if key else text_key(chunk) for candidate, chunk in zip(candidates, texts)]
+        query_key = text_key(f"{self.model_name}\0{query}")
+
+        scores = np.full(len(candidates), -np.inf, dtype=np.float32)
+        pending = []
+        with self._lock:
+            for i, chunk_id in enumerate(ids):
+                cached = self._cache.get((query_key, chunk_id))
+                if cached is None:
+                    pending.append(i)
+                else:
+                    self._cache.move_to_end((query_key, chunk_id))
+                    scores[i] = cached
+
+        hits = len(candidates) - len(pending)
+        scored = 0
+        top = self._top(scores, top_n)
+        stale = 0
+        for offset in range(0, len(pending), self.batch_size):
+            batch = pending[offset:offset + self.batch_size]
+            batch_scores = np.asarray(self._score_pairs([(query, texts[i]) for i in batch]), dtype=np.float32).reshape(-1)
+            scores[batch] = batch_scores
+            scored += len(batch)
+            self._remember(query_key, [ids[i] for i in batch], batch_scores)
+
+            # Early cutoff: stop once the top n has held for `patience` batches.
+            new_top = self._top(scores, top_n)
+            stale = stale + 1 if new_top == top else 0
+            top = new_top
+            if stale >= self.patience and offset + self.batch_size < len(pending):
+                break
+
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self._stats["calls"] += 1
+            self._stats["candidates"] += len(candidates)
+            self._stats["scored"] += scored
+            self._stats["cache_hits"] += hits
+            self._stats["skipped"] += len(pending) - scored
+            self._stats["cutoffs"] += int(scored < len(pending))
+            self._stats["rerank_s"] += elapsed
+
+        return [(candidates[i], float(scores[i])) for i in self._top(scores, top_n)]
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["cached_scores"] = len(self._cache)
+        stats["ms_per_call"] = 1000 * stats["rerank_s"] / stats["calls"] if stats["calls"] else None
+        return stats
+
+    def _top(self, scores, top_n):
+        # Unscored candidates (-inf) never make the cut.
+        order = [int(i) for i in np.argsort(-scores, kind="stable")[:top_n]]
+        return [i for i in order if np.isfinite(scores[i])]
+
+    def _remember(self, query_key, chunk_ids, scores):
+        with self._lock:
+            for chunk_id, score in zip(chunk_ids, scores):
+                self._cache[(query_key, chunk_id)] = float(score)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The repo is run from its root (streamlit run main.py, python -m ...); make
+# its namespace packages importable however pytest is started.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,68 @@
+import numpy as np
+
+from retrieval.ann_index import IVFIndex
+
+
+def clustered_vectors(count=6000, dim=32, clusters=40, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    vectors = centers[rng.integers(clusters, size=count)] + 0.3 * rng.normal(size=(count, dim))
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors.astype(np.float32)
+
+
+def exact_top_k(vectors, rows, query, k):
+    scores = vectors[rows] @ query
+    return set(np.asarray(rows)[np.argsort(-scores)[:k]].tolist())
+
+
+def recall(index, vectors, rows, queries, k=10):
+    hits = 0
+    for query in queries:
+        found = {row for row, _ in index.search(vectors, query, k)}
+        hits += len(found & exact_top_k(vectors, rows, query, k))
+    return hits / (k * len(queries))
+
+
+def test_recall_at_default_nprobe():
+    vectors = clustered_vectors()
+    rows = np.arange(len(vectors))
+    index = IVFIndex(min_train=1000)
+    index.fit(vectors, rows)
+
+    assert recall(index, vectors, rows, vectors[:50]) >= 0.9
+
+
+def test_added_and_removed_rows_are_searched_correctly():
+    vectors = clustered_vectors()
+    index = IVFIndex(min_train=1000)
+    index.fit(vectors, np.arange(5000))
+
+    index.add(np.arange(5000, 6000), vectors[5000:])
+    index.remove(np.arange(0, 500))
+    live = np.arange(500, 6000)
+
+    results = [row for query in vectors[5000:5020] for row, _ in index.search(vectors, query, 5)]
+    assert all(row >= 500 for row in results)
+    assert recall(index, vectors, live, vectors[5000:5050]) >= 0.9
+
+
+def test_save_and_load_round_trip(tmp_path):
+    vectors = clustered_vectors(count=2000)
+    index = IVFIndex(min_train=1000)
+    index.fit(vectors, np.arange(len(vectors)))
+    path = str(tmp_path / "ivf.npz")
+    index.save(path)
+
+    loaded = IVFIndex()
+    loaded.load(path)
+
+    assert loaded.search(vectors, vectors[0], 5) == index.search(vectors, vectors[0], 5)
+
+
+def test_training_thresholds():
+    index = IVFIndex(min_train=100, retrain_growth=4.0)
+
+    assert not index.needs_training(99) and index.needs_training(100)
+    index.fit(clustered_vectors(count=200), np.arange(200))
+    assert not index.needs_training(800) and index.needs_training(801)
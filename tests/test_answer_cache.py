@@ -0,0 +1,80 @@
+import numpy as np
+
+from common.answer_cache import SemanticAnswerCache
+
+
+VECTORS = {
+    "what is the acceptance fee": [1.0, 0.0, 0.0],
+    "how much is the acceptance fee": [0.99, 0.14, 0.0],
+    "where is the library": [0.0, 0.0, 1.0],
+}
+
+
+def make_cache(**options):
+    calls = []
+
+    def embed(text):
+        calls.append(text)
+        return np.asarray(VECTORS[text], dtype=np.float32)
+
+    return SemanticAnswerCache(embed, dim=3, **options), calls
+
+
+def test_exact_repeat_skips_the_embedding():
+    cache, calls = make_cache()
+    cache.store("What is the acceptance fee?", "N25,000")
+    calls.clear()
+
+    assert cache.lookup("what is the  acceptance fee") == "N25,000"
+    assert calls == []
+
+
+def test_near_duplicate_hits_and_unrelated_misses():
+    cache, _ = make_cache(threshold=0.9)
+    cache.store("What is the acceptance fee?", "N25,000")
+
+    assert cache.lookup("How much is the acceptance fee?") == "N25,000"
+    assert cache.lookup("Where is the library?") is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_scopes_do_not_share_answers():
+    cache, _ = make_cache(threshold=0.9)
+    cache.store("What is the acceptance fee?", "private answer", scope="user:a@pti.edu.ng")
+
+    assert cache.lookup("What is the acceptance fee?") is None
+    assert cache.lookup("How much is the acceptance fee?", scope="user:b@pti.edu.ng") is None
+    assert cache.lookup("How much is the acceptance fee?", scope="user:a@pti.edu.ng") == "private answer"
+
+
+def test_same_prompt_is_stored_per_scope():
+    cache, _ = make_cache()
+    cache.store("Where is the library?", "public answer")
+    cache.store("Where is the library?", "private answer", scope="user:a")
+
+    assert cache.lookup("Where is the library?") == "public answer"
+    assert cache.lookup("Where is the library?", scope="user:a") == "private answer"
+    assert cache.stats()["entries"] == 2
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache, _ = make_cache(max_entries=2)
+    cache.store("What is the acceptance fee?", "fee")
+    cache.store("Where is the library?", "library")
+    cache.lookup("Where is the library?")
+
+    cache.store("How much is the acceptance fee?", "fee again")
+
+    assert cache.lookup("Where is the library?") == "library"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_invalidate_drops_every_scope():
+    cache, _ = make_cache()
+    cache.store("Where is the library?", "public")
+    cache.store("Where is the library?", "private", scope="user:a")
+
+    cache.invalidate()
+
+    assert cache.lookup("Where is the library?") is None
+    assert cache.lookup("Where is the library?", scope="user:a") is None
@@ -0,0 +1,73 @@
+import re
+import types
+
+from common.chat_store import load_history_page
+
+
+class FakeQuery:
+    """The slice of the Supabase query builder load_history_page uses, over in-memory rows."""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def select(self, columns):
+        return self
+
+    def eq(self, column, value):
+        return FakeQuery([row for row in self.rows if row[column] == value])
+
+    def or_(self, condition):
+        timestamp, tie, row_id = re.fullmatch(r'timestamp\.lt\."(.+)",and\(timestamp\.eq\."(.+)",id\.lt\.(\d+)\)', condition).groups()
+        return FakeQuery([
+            row for row in self.rows
+            if row["timestamp"] < timestamp or (row["timestamp"] == tie and row["id"] < int(row_id))
+        ])
+
+    def order(self, column, desc=False):
+        return FakeQuery(sorted(self.rows, key=lambda row: row[column], reverse=desc))
+
+    def limit(self, count):
+        return FakeQuery(self.rows[:count])
+
+    def execute(self):
+        return types.SimpleNamespace(data=list(self.rows))
+
+
+class FakeSupabase:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def table(self, name):
+        return FakeQuery(self.rows)
+
+
+def history(user_id, turns):
+    # A question and its answer share a timestamp, as main.py saves them.
+    rows = []
+    for turn in range(turns):
+        timestamp = f"2026-01-01T00:{turn:02d}:00+00:00"
+        rows.append({"id": len(rows) + 1, "user_id": user_id, "role": "user", "content": f"q{turn}", "timestamp": timestamp})
+        rows.append({"id": len(rows) + 1, "user_id": user_id, "role": "assistant", "content": f"a{turn}", "timestamp": timestamp})
+    return rows
+
+
+def test_pages_cover_history_once_in_order():
+    supabase = FakeSupabase(history("u1", 7) + history("u2", 3))
+
+    pages = []
+    messages, cursor = load_history_page(supabase, "u1", page_size=3)
+    pages.append(messages)
+    while cursor is not None:
+        messages, cursor = load_history_page(supabase, "u1", before=cursor, page_size=3)
+        pages.append(messages)
+
+    contents = [message["content"] for page in reversed(pages) for message in page]
+    assert contents == [text for turn in range(7) for text in (f"q{turn}", f"a{turn}")]
+    # A page boundary falls between a question and its answer (same timestamp).
+    assert len(pages) == 5
+
+
+def test_last_page_has_no_cursor():
+    messages, cursor = load_history_page(FakeSupabase(history("u1", 2)), "u1", page_size=4)
+
+    assert len(messages) == 4 and cursor is None
@@ -0,0 +1,90 @@
+import os
+import json
+
+import numpy as np
+
+from ingestion.chunk_store import ChunkStore, build_chunk_store, update_chunk_store, write_chunk_store, CURRENT_FILE
+
+
+class CountingEmbed:
+    def __init__(self):
+        self.texts = []
+
+    def __call__(self, texts):
+        self.texts.extend(texts)
+        rng = np.random.default_rng(len(self.texts))
+        return rng.normal(size=(len(texts), 8))
+
+
+def write_corpus(path, pages):
+    path.write_text(json.dumps([{"url": url, "markdown": markdown} for url, markdown in pages.items()]), encoding="utf-8")
+
+
+PAGES = {
+    "https://pti.edu.ng/admissions": "# Admissions\n\nApply through JAMB and the PTI portal.",
+    "https://pti.edu.ng/fees": "# Fees\n\nThe acceptance fee is paid online.",
+    "https://pti.edu.ng/contact": "# Contact\n\nEmail the registry.",
+}
+
+
+def test_update_re_embeds_only_changed_pages(tmp_path):
+    corpus = tmp_path / "corpus.json"
+    store_dir = str(tmp_path / "store")
+    write_corpus(corpus, PAGES)
+    build_chunk_store(CountingEmbed(), str(corpus), store_dir)
+
+    pages = dict(PAGES)
+    pages["https://pti.edu.ng/fees"] = "# Fees\n\nThe acceptance fee is now paid at the bursary."
+    del pages["https://pti.edu.ng/contact"]
+    pages["https://pti.edu.ng/hostels"] = "# Hostels\n\nFirst year students are housed on campus."
+    write_corpus(corpus, pages)
+
+    embed = CountingEmbed()
+    kept, embedded, diff = update_chunk_store(embed, str(corpus), store_dir)
+
+    assert diff == {
+        "added": ["https://pti.edu.ng/hostels"],
+        "changed": ["https://pti.edu.ng/fees"],
+        "removed": ["https://pti.edu.ng/contact"],
+    }
+    assert all("bursary" in text or "Hostels" in text for text in embed.texts)
+    store = ChunkStore(store_dir)
+    assert sorted(set(store.columns["url"])) == sorted(pages)
+    assert len(store.embeddings) == len(store) == kept + embedded
+
+
+def test_update_without_changes_keeps_the_version(tmp_path):
+    corpus = tmp_path / "corpus.json"
+    store_dir = str(tmp_path / "store")
+    write_corpus(corpus, PAGES)
+    build_chunk_store(CountingEmbed(), str(corpus), store_dir)
+    version = ChunkStore(store_dir).version_dir
+
+    _, embedded, _ = update_chunk_store(CountingEmbed(), str(corpus), store_dir)
+
+    assert embedded == 0 and ChunkStore(store_dir).version_dir == version
+
+
+def test_readers_keep_their_version_across_a_swap(tmp_path):
+    store_dir = str(tmp_path / "store")
+    chunks = [{"url": "u", "heading": "h", "text": f"text {i}", "tokens": 2} for i in range(3)]
+    write_chunk_store(chunks, np.ones((3, 4)), store_dir)
+    reader = ChunkStore(store_dir)
+
+    write_chunk_store(chunks[:2], np.ones((2, 4)), store_dir)
+    write_chunk_store(chunks[:1], np.ones((1, 4)), store_dir)
+
+    assert len(reader) == len(reader.embeddings) == 3
+    assert len(ChunkStore(store_dir)) == 1
+    versions = [name for name in os.listdir(store_dir) if name != CURRENT_FILE]
+    assert len(versions) == 2
+
+
+def test_pre_versioning_store_is_still_readable(tmp_path):
+    store_dir = tmp_path / "store"
+    store_dir.mkdir()
+    np.save(store_dir / "embeddings.npy", np.ones((2, 4), dtype=np.float32))
+    rows = [{"id": i, "url": "u", "heading": "h", "text": f"t{i}", "tokens": 1} for i in range(2)]
+    (store_dir / "chunks.jsonl").write_text("\n".join(json.dumps(row) for row in rows))
+
+    assert ChunkStore(str(store_dir)).texts == ["t0", "t1"]
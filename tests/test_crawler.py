@@ -0,0 +1,111 @@
+import json
+import zlib
+import asyncio
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+
+from ingestion.crawler import acrawl, raw_scrape, CrawlManifest
+
+
+BASE = "http://localhost:8000"
+
+
+class Site:
+    """Local stand-in for the site: serves `pages` with ETags and answers conditional GETs."""
+
+    def __init__(self, pages):
+        self.pages = dict(pages)
+        self.requests = []
+
+    def etag(self, path):
+        return f'"{zlib.crc32(self.pages[path].encode())}"'
+
+    def handle(self, request):
+        path = request.url.path
+        self.requests.append((path, request.headers.get("if-none-match")))
+        if path not in self.pages:
+            return httpx.Response(404)
+        if request.headers.get("if-none-match") == self.etag(path):
+            return httpx.Response(304)
+        return httpx.Response(200, text=self.pages[path], headers={"etag": self.etag(path), "content-type": "text/plain"})
+
+
+def crawl(site, paths, tmp_path, **options):
+    async def main():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(site.handle)) as client:
+            return await acrawl(
+                [BASE + path for path in paths],
+                scrape=raw_scrape,
+                corpus_path=str(tmp_path / "corpus.json"),
+                manifest_path=str(tmp_path / "crawl_manifest.jsonl"),
+                diff_path=str(tmp_path / "crawl_diff.json"),
+                client=client,
+                **options,
+            )
+
+    return asyncio.run(main())
+
+
+def corpus(tmp_path):
+    with open(tmp_path / "corpus.json", encoding="utf-8") as file:
+        return {item["url"]: item["markdown"] for item in json.load(file)}
+
+
+PAGES = {f"/page{i}": f"Page {i} text" for i in range(6)}
+
+
+def test_first_crawl_adds_every_page(tmp_path):
+    diff = crawl(Site(PAGES), PAGES, tmp_path)
+
+    assert sorted(diff["added"]) == sorted(BASE + path for path in PAGES)
+    assert corpus(tmp_path)[BASE + "/page0"] == "Page 0 text"
+
+
+def test_unchanged_pages_answer_304_and_are_not_scraped(tmp_path):
+    site = Site(PAGES)
+    crawl(site, PAGES, tmp_path)
+    site.requests.clear()
+
+    diff = crawl(site, PAGES, tmp_path)
+
+    assert diff["unchanged"] == len(PAGES) and not diff["added"] and not diff["changed"]
+    assert all(etag == site.etag(path) for path, etag in site.requests)
+
+
+def test_changed_body_missing_page_and_dropped_url(tmp_path):
+    site = Site(PAGES)
+    crawl(site, PAGES, tmp_path)
+
+    site.pages["/page1"] = "Page 1 text, updated"
+    del site.pages["/page2"]
+    listed = [path for path in PAGES if path != "/page3"] + ["/page9"]
+    site.pages["/page9"] = "A new page"
+
+    diff = crawl(site, listed, tmp_path)
+
+    assert diff["changed"] == [BASE + "/page1"]
+    assert sorted(diff["removed"]) == [BASE + "/page2", BASE + "/page3"]
+    assert diff["added"] == [BASE + "/page9"]
+    pages = corpus(tmp_path)
+    assert pages[BASE + "/page1"] == "Page 1 text, updated"
+    assert BASE + "/page2" not in pages and BASE + "/page3" not in pages
+    assert json.loads((tmp_path / "crawl_diff.json").read_text())["changed"] == [BASE + "/page1"]
+    assert BASE + "/page3" not in CrawlManifest(str(tmp_path / "crawl_manifest.jsonl")).active()
+
+
+def test_mass_removal_is_refused_without_writing(tmp_path):
+    site = Site(PAGES)
+    crawl(site, PAGES, tmp_path)
+    before = corpus(tmp_path)
+    manifest_before = (tmp_path / "crawl_manifest.jsonl").read_text()
+
+    with pytest.raises(RuntimeError, match="would remove 5 of 6 pages"):
+        crawl(site, ["/page0"], tmp_path)
+
+    assert corpus(tmp_path) == before
+    assert (tmp_path / "crawl_manifest.jsonl").read_text() == manifest_before
+
+    diff = crawl(site, ["/page0"], tmp_path, allow_mass_removal=True)
+    assert len(diff["removed"]) == 5 and list(corpus(tmp_path)) == [BASE + "/page0"]
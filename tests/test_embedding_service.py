@@ -0,0 +1,145 @@
+import threading
+
+import numpy as np
+import pytest
+
+from common.embedding_service import EmbeddingService, EmbeddingStore, content_key, normalize
+
+
+DIM = 8
+
+
+def vector_for(text):
+    # Deterministic per text, so any row mix-up shows as a wrong vector.
+    rng = np.random.default_rng(sum(text.encode()) * 7919 + len(text))
+    return normalize(rng.normal(size=DIM))[0]
+
+
+class Model:
+    def __init__(self):
+        self.encoded = []
+
+    def __call__(self, texts, batch_size):
+        self.encoded.extend(texts)
+        return np.stack([vector_for(text) for text in texts])
+
+
+def make_service(store_dir, model=None, dtype="float32"):
+    model = model or Model()
+    store = EmbeddingStore(str(store_dir), "test-model", DIM, dtype=dtype, initial_rows=4)
+    return EmbeddingService(model, "test-model", dim=DIM, batch_size=4, store=store), model
+
+
+def keys_for(texts):
+    return [content_key("test-model", text) for text in texts]
+
+
+def test_stored_vectors_are_served_without_the_model(tmp_path):
+    service, model = make_service(tmp_path)
+    texts = [f"chunk {i}" for i in range(6)]
+
+    first = service.embed(texts)
+    model.encoded.clear()
+    second = service.embed(texts + ["new chunk"])
+
+    assert np.allclose(first, second[:6])
+    assert model.encoded == ["new chunk"]
+    assert service.stats()["store_hits"] == 6
+
+
+def test_store_survives_reopening(tmp_path):
+    service, _ = make_service(tmp_path)
+    texts = [f"chunk {i}" for i in range(10)]
+    service.embed(texts)
+
+    reopened, model = make_service(tmp_path)
+
+    assert np.allclose(reopened.embed(texts), np.stack([vector_for(text) for text in texts]))
+    assert model.encoded == []
+
+
+def test_int8_store_round_trips_closely(tmp_path):
+    service, _ = make_service(tmp_path, dtype="int8")
+    texts = ["chunk a", "chunk b"]
+    served = service.embed(texts)
+
+    reopened, _ = make_service(tmp_path, dtype="int8")
+
+    assert np.allclose(reopened.embed(texts), served)
+    assert np.allclose(served, np.stack([vector_for(text) for text in texts]), atol=0.02)
+
+
+def test_queries_are_not_persisted(tmp_path):
+    service, model = make_service(tmp_path)
+
+    service.embed_query("what is the acceptance fee")
+    service.embed_query("what is the acceptance fee")
+
+    assert len(service.store) == 0
+    assert model.encoded == ["what is the acceptance fee"]
+
+
+def test_store_built_for_another_model_is_discarded(tmp_path):
+    service, _ = make_service(tmp_path)
+    service.embed(["chunk"])
+
+    store = EmbeddingStore(str(tmp_path), "other-model", DIM)
+
+    assert len(store) == 0
+
+
+def test_two_writers_do_not_overwrite_each_other(tmp_path):
+    # Two stores on one directory stand in for the app and an index rebuild.
+    app = EmbeddingStore(str(tmp_path), "test-model", DIM, initial_rows=4)
+    rebuild = EmbeddingStore(str(tmp_path), "test-model", DIM, initial_rows=4)
+    app_texts = [f"app {i}" for i in range(5)]
+    rebuild_texts = [f"rebuild {i}" for i in range(7)]
+
+    app.put(keys_for(app_texts), np.stack([vector_for(text) for text in app_texts]))
+    rebuild.put(keys_for(rebuild_texts + app_texts[:2]), np.stack([vector_for(text) for text in rebuild_texts + app_texts[:2]]))
+
+    reopened = EmbeddingStore(str(tmp_path), "test-model", DIM)
+    texts = app_texts + rebuild_texts
+    assert len(reopened) == len(texts)
+    assert np.allclose(reopened.get(keys_for(texts)), np.stack([vector_for(text) for text in texts]))
+    # The first writer sees the second's rows once it writes again.
+    app.put(keys_for(["app 5"]), vector_for("app 5")[None])
+    assert np.allclose(app.get(keys_for(rebuild_texts)), np.stack([vector_for(text) for text in rebuild_texts]))
+
+
+def test_concurrent_writers_keep_keys_and_rows_aligned(tmp_path):
+    stores = [EmbeddingStore(str(tmp_path), "test-model", DIM, initial_rows=4) for _ in range(2)]
+
+    def write(store, name):
+        for batch in range(20):
+            texts = [f"{name} {batch} {i}" for i in range(3)] + [f"shared {batch}"]
+            store.put(keys_for(texts), np.stack([vector_for(text) for text in texts]))
+
+    threads = [threading.Thread(target=write, args=(store, f"writer{n}")) for n, store in enumerate(stores)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    reopened = EmbeddingStore(str(tmp_path), "test-model", DIM)
+    texts = [f"writer{n} {batch} {i}" for n in range(2) for batch in range(20) for i in range(3)] + [f"shared {batch}" for batch in range(20)]
+    assert len(reopened) == len(texts)
+    assert np.allclose(reopened.get(keys_for(texts)), np.stack([vector_for(text) for text in texts]))
+
+
+def test_torn_key_line_is_dropped(tmp_path):
+    store = EmbeddingStore(str(tmp_path), "test-model", DIM, initial_rows=4)
+    store.put(keys_for(["a"]), vector_for("a")[None])
+    with open(tmp_path / "keys.txt", "a", encoding="utf-8") as file:
+        file.write("deadbeef")
+
+    reopened = EmbeddingStore(str(tmp_path), "test-model", DIM)
+    reopened.put(keys_for(["b"]), vector_for("b")[None])
+
+    assert len(EmbeddingStore(str(tmp_path), "test-model", DIM)) == 2
+    assert np.allclose(reopened.get(keys_for(["a", "b"])), np.stack([vector_for("a"), vector_for("b")]))
+
+
+def test_unsupported_dtype_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        EmbeddingStore(str(tmp_path), "test-model", DIM, dtype="float16")
@@ -0,0 +1,146 @@
+import asyncio
+import threading
+
+from common.history import HistoryManager, estimate_tokens
+
+
+def conversation(count, prefix="m", size=1):
+    return [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": f"{prefix}{i} " * size}
+        for i in range(count)
+    ]
+
+
+class Summarizer:
+    def __init__(self):
+        self.prompts = []
+
+    async def __call__(self, prompt):
+        self.prompts.append(prompt)
+        return f"summary {len(self.prompts)}"
+
+
+def summarise(manager, key, messages):
+    future = manager.update_summary(key, messages)
+    if future is not None:
+        future.result(timeout=5)
+    return future
+
+
+def test_compact_sends_unsummarised_messages_verbatim():
+    summarize = Summarizer()
+    manager = HistoryManager(summarize, keep_messages=4, summarize_every=2)
+    messages = conversation(10)
+
+    assert manager.compact("k", messages) == messages
+    assert summarize.prompts == []
+
+
+def test_recent_messages_are_kept_verbatim_after_the_summary():
+    manager = HistoryManager(Summarizer(), keep_messages=4, summarize_every=2)
+    summarise(manager, "k", conversation(10))
+
+    compacted = manager.compact("k", conversation(10))
+
+    assert compacted[0]["role"] == "system" and compacted[0]["content"].endswith("summary 1")
+    assert [message["content"] for message in compacted[1:]] == [message["content"] for message in conversation(10)[-4:]]
+
+
+def test_summary_waits_for_enough_new_messages():
+    summarize = Summarizer()
+    manager = HistoryManager(summarize, keep_messages=4, summarize_every=4)
+
+    assert manager.update_summary("k", conversation(7)) is None
+    assert summarise(manager, "k", conversation(8)) is not None
+    assert manager.update_summary("k", conversation(9)) is None
+    assert len(summarize.prompts) == 1
+
+
+def test_compact_does_not_wait_for_a_running_update():
+    release = threading.Event()
+    started = threading.Event()
+
+    async def slow(prompt):
+        started.set()
+        while not release.is_set():
+            await asyncio.sleep(0.01)
+        return "slow summary"
+
+    manager = HistoryManager(slow, keep_messages=2, summarize_every=2)
+    messages = conversation(6)
+
+    future = manager.update_summary("k", messages)
+    assert started.wait(5)
+    assert manager.update_summary("k", messages) is None
+    assert manager.compact("k", messages) == messages
+
+    release.set()
+    future.result(timeout=5)
+    assert manager.compact("k", messages)[0]["content"].endswith("slow summary")
+
+
+def test_summary_is_extended_incrementally():
+    summarize = Summarizer()
+    manager = HistoryManager(summarize, keep_messages=2, summarize_every=2)
+    messages = conversation(6)
+
+    summarise(manager, "k", messages)
+    summarise(manager, "k", messages + conversation(2, prefix="n"))
+
+    assert len(summarize.prompts) == 2
+    assert "m0" not in summarize.prompts[1] and "m4" in summarize.prompts[1]
+
+
+def test_loading_earlier_pages_keeps_the_summary():
+    summarize = Summarizer()
+    manager = HistoryManager(summarize, keep_messages=2, summarize_every=2)
+    messages = conversation(8)
+    summarise(manager, "k", messages)
+
+    extended = conversation(40, prefix="old", size=50) + messages
+    compacted = manager.compact("k", extended)
+
+    assert manager.update_summary("k", extended) is None
+    assert len(summarize.prompts) == 1
+    assert compacted[0]["content"].endswith("summary 1")
+
+
+def test_summariser_input_is_capped():
+    summarize = Summarizer()
+    manager = HistoryManager(summarize, keep_messages=2, summarize_every=2, summary_input_tokens=500)
+
+    summarise(manager, "k", conversation(60, size=40))
+
+    assert estimate_tokens(summarize.prompts[0]) < 800
+    assert "m57" in summarize.prompts[0] and "m0 " not in summarize.prompts[0]
+
+
+def test_failed_summary_keeps_messages_verbatim():
+    async def failing(prompt):
+        raise RuntimeError("quota exceeded")
+
+    manager = HistoryManager(failing, keep_messages=2, summarize_every=2)
+    messages = conversation(6)
+    summarise(manager, "k", messages)
+
+    assert manager.compact("k", messages) == messages
+
+
+def test_replaced_conversation_starts_over():
+    summarize = Summarizer()
+    manager = HistoryManager(summarize, keep_messages=2, summarize_every=2)
+    summarise(manager, "k", conversation(6))
+
+    summarise(manager, "k", conversation(6, prefix="x"))
+
+    assert len(summarize.prompts) == 2 and "(none)" in summarize.prompts[1]
+
+
+def test_token_budget_drops_oldest_and_keeps_question():
+    manager = HistoryManager(None, keep_messages=6, token_budget=50)
+    messages = conversation(6, size=20)
+
+    compacted = manager.compact("k", messages)
+
+    assert compacted[-1] == messages[-1]
+    assert sum(estimate_tokens(message["content"]) for message in compacted) <= 50 or len(compacted) == 1
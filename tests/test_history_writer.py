@@ -0,0 +1,65 @@
+import time
+
+from common.chat_store import ChatHistoryWriter
+
+
+class FlakyConnection:
+    def __init__(self):
+        self.down = True
+        self.rows = []
+
+    def table(self, name):
+        return self
+
+    def insert(self, rows, count=None):
+        self._pending = rows
+        return self
+
+    def execute(self):
+        if self.down:
+            raise ConnectionError("database unreachable")
+        self.rows.extend(self._pending)
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_writer_journals_failed_rows_and_replays_them(tmp_path):
+    connection = FlakyConnection()
+    writer = ChatHistoryWriter(
+        connection, journal_path=str(tmp_path / "journal.sqlite3"),
+        flush_interval=0.02, max_retries=2, backoff=0, replay_interval=0,
+    )
+    rows = [{"user_id": "u1", "role": "user", "content": "q", "timestamp": "t"},
+            {"user_id": "u1", "role": "assistant", "content": "a", "timestamp": "t"}]
+
+    writer.save(rows)
+    wait_for(lambda: writer.journaled == 2)
+    assert connection.rows == []
+
+    connection.down = False
+    wait_for(lambda: writer.stats()["journal_pending"] == 0)
+    writer.close()
+
+    assert connection.rows == rows
+    assert writer.stats()["replayed"] == 2
+
+
+def test_writer_replays_journal_left_by_a_previous_process(tmp_path):
+    journal_path = str(tmp_path / "journal.sqlite3")
+    connection = FlakyConnection()
+    first = ChatHistoryWriter(connection, journal_path=journal_path, flush_interval=0.02, max_retries=1, backoff=0, replay_interval=60)
+    first.save([{"user_id": "u1", "role": "user", "content": "q", "timestamp": "t"}])
+    wait_for(lambda: first.journaled == 1)
+    first.close()
+
+    connection.down = False
+    second = ChatHistoryWriter(connection, journal_path=journal_path, flush_interval=0.02, backoff=0, replay_interval=0)
+    wait_for(lambda: len(connection.rows) == 1)
+    second.close()
+
+    assert second.stats()["journal_pending"] == 0
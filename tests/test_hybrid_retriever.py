@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from ingestion.chunk_store import write_chunk_store
+from retrieval.hybrid_retriever import BM25Index, LocalHybridRetriever, tokenize
+
+
+TEXTS = [
+    "The acceptance fee is paid at the bursary.",
+    "Hostel allocation for first year students opens in October.",
+    "HND admission requires an OND and one year of industrial training.",
+    "The library opens at eight.",
+]
+# One axis per chunk; the dense side of each query is set explicitly below.
+EMBEDDINGS = np.eye(len(TEXTS), dtype=np.float32)
+
+
+@pytest.fixture
+def retriever(tmp_path):
+    chunks = [{"url": f"https://pti.edu.ng/{i}", "heading": "", "text": text, "tokens": 10} for i, text in enumerate(TEXTS)]
+    write_chunk_store(chunks, EMBEDDINGS, str(tmp_path))
+    vectors = {}
+    retriever = LocalHybridRetriever(lambda query: vectors[query], index_dir=str(tmp_path))
+    retriever.vectors = vectors
+    return retriever
+
+
+def test_tokenize_drops_stopwords_and_case():
+    assert tokenize("What is the HND Admission fee?") == ["hnd", "admission", "fee"]
+
+
+def test_bm25_ranks_term_matches_and_ignores_unknown_terms():
+    index = BM25Index(TEXTS)
+
+    scores = index.scores("acceptance fee")
+
+    assert int(np.argmax(scores)) == 0
+    assert scores[1:].sum() == 0
+    assert not index.scores("zzz").any()
+
+
+def test_bm25_favours_rarer_terms():
+    index = BM25Index(["fee fee hostel", "fee library", "fee"])
+
+    assert index.scores("hostel")[0] > index.scores("fee")[0]
+
+
+def test_alpha_selects_dense_sparse_or_both(retriever):
+    # Keywords point at chunk 0, the embedding at chunk 3.
+    retriever.vectors["acceptance fee"] = EMBEDDINGS[3]
+
+    assert retriever.retrieve("acceptance fee", top_k=1, alpha=0)[0]["text"] == TEXTS[0]
+    assert retriever.retrieve("acceptance fee", top_k=1, alpha=1)[0]["text"] == TEXTS[3]
+
+    fused = retriever.retrieve("acceptance fee", top_k=2, alpha=0.5)
+    assert {chunk["text"] for chunk in fused} == {TEXTS[0], TEXTS[3]}
+    assert fused[0]["score"] == pytest.approx(0.5) and fused[1]["score"] == pytest.approx(0.5)
+
+
+def test_fusion_prefers_chunks_both_sides_agree_on(retriever):
+    retriever.vectors["hostel allocation"] = 0.8 * EMBEDDINGS[1] + 0.6 * EMBEDDINGS[2]
+
+    results = retriever.retrieve("hostel allocation", top_k=4, alpha=0.5)
+
+    assert results[0]["text"] == TEXTS[1] and results[0]["score"] == pytest.approx(1.0)
+    assert [chunk["score"] for chunk in results] == sorted((chunk["score"] for chunk in results), reverse=True)
+
+
+def test_top_k_limits_and_defaults(retriever):
+    retriever.vectors["library"] = EMBEDDINGS[3]
+
+    assert len(retriever.retrieve("library")) == retriever.top_k == 3
+    assert len(retriever.retrieve("library", top_k=10)) == len(TEXTS)
+    assert retriever.retrieve("library", top_k=1)[0]["url"] == "https://pti.edu.ng/3"
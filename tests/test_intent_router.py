@@ -0,0 +1,85 @@
+import re
+import json
+import zlib
+
+import numpy as np
+import pytest
+
+from common.answer_cache import normalize_query
+from common.intent_router import IntentRouter, build_faq
+
+
+def embed(texts):
+    # Bag of words hashed into a fixed vector: identical wording scores 1.0.
+    vectors = np.zeros((len(texts), 512), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for word in re.findall(r"\w+", text.lower()):
+            vectors[row, zlib.crc32(word.encode()) % 512] += 1
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+@pytest.fixture
+def router(tmp_path):
+    return IntentRouter(embed, faq_path=str(tmp_path / "missing.json"))
+
+
+@pytest.mark.parametrize("message, intent", [
+    ("hi", "greeting"),
+    ("Good morning sir", "greeting"),
+    ("thanks!", "thanks"),
+    ("thank you so much", "thanks"),
+    ("bye", "goodbye"),
+    ("see you later", "goodbye"),
+    ("who are you", "identity"),
+    ("how are you doing today", "how_are_you"),
+])
+def test_rules_match_small_talk(router, message, intent):
+    assert router.match_rules(normalize_query(message)) == intent
+
+
+@pytest.mark.parametrize("message", ["ok", "ok so", "later", "cool", "great", "yes please", "is it ok", "perfect"])
+def test_rules_leave_follow_ups_to_the_agent(router, message):
+    assert router.match_rules(normalize_query(message)) is None
+
+
+@pytest.mark.parametrize("message", ["is it ok?", "thank you so much?", "hello?", "what are the fees?", "ok", "yes please"])
+def test_follow_ups_and_questions_go_to_the_agent(router, message):
+    assert router.route(message) == ("info", None)
+
+
+@pytest.mark.parametrize("message, intent", [("how are you?", "how_are_you"), ("who are you?", "identity")])
+def test_small_talk_questions_are_answered(router, message, intent):
+    routed, answer = router.route(message)
+
+    assert routed == intent and answer
+
+
+def test_faq_hits_return_the_stored_answer(tmp_path):
+    path = tmp_path / "faq.json"
+    path.write_text('[{"question": "How much is the acceptance fee?", "variants": ["acceptance fee amount"], "answer": "N25,000"}]')
+    router = IntentRouter(embed, faq_path=str(path))
+
+    assert router.route("How much is the acceptance fee") == ("faq", "N25,000")
+    assert router.route("Where is the library") == ("info", None)
+
+
+class Agent:
+    """Stub chat agent: questions containing "outage" fail like a real agent does."""
+
+    async def answer(self, prompt, conversation_history=[]):
+        self.failed = "outage" in prompt
+        return "Sorry, there was an error." if self.failed else f"Answer to {prompt}"
+
+
+def test_build_faq_skips_failed_answers(tmp_path, monkeypatch):
+    monkeypatch.setattr("common.backends.get_agent_class", lambda backend=None: Agent)
+    path = tmp_path / "faq.json"
+
+    written, skipped = build_faq(["Fees?", "outage question", "Hostel?"], str(path))
+
+    assert (written, skipped) == (2, ["outage question"])
+    assert [entry["question"] for entry in json.loads(path.read_text())] == ["Fees?", "Hostel?"]
+
+    # A run where everything failed leaves the previous answer set alone.
+    assert build_faq(["outage again"], str(path)) == (0, ["outage again"])
+    assert len(json.loads(path.read_text())) == 2
@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+
+from common.llm_router import LLMRouter, Provider
+
+
+class StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+def provider(name, reply=None, error=None, delay=0.0, chunks=None):
+    calls = []
+
+    async def generate(prompt, system=None):
+        calls.append((prompt, system))
+        await asyncio.sleep(delay)
+        if error is not None:
+            raise error
+        return reply
+
+    async def stream(prompt, system=None):
+        calls.append((prompt, system))
+        await asyncio.sleep(delay)
+        if error is not None:
+            raise error
+        for chunk in chunks or [reply]:
+            yield chunk
+
+    result = Provider(name, generate, stream)
+    result.calls = calls
+    return result
+
+
+def test_fails_over_on_retriable_error():
+    primary = provider("groq:x", error=StatusError(429))
+    fallback = provider("gemini:y", reply="from gemini")
+    router = LLMRouter([primary, fallback])
+
+    assert asyncio.run(router.generate("q", system="sys")) == "from gemini"
+    assert fallback.calls == [("q", "sys")]
+    assert router.metrics()["failovers"] == 1
+
+
+def test_non_retriable_error_is_raised():
+    router = LLMRouter([provider("a", error=StatusError(400)), provider("b", reply="unused")])
+
+    with pytest.raises(StatusError):
+        asyncio.run(router.generate("q"))
+
+
+def test_slow_primary_is_hedged():
+    router = LLMRouter([provider("slow", reply="slow", delay=1.0), provider("fast", reply="fast")], hedge_after=0.05)
+
+    assert asyncio.run(router.generate("q")) == "fast"
+    metrics = router.metrics()
+    assert metrics["hedges"] == 1 and metrics["hedge_wins"] == 1
+
+
+def test_stream_fails_over_before_first_chunk():
+    router = LLMRouter([provider("a", error=StatusError(503)), provider("b", chunks=["he", "llo"])])
+
+    async def collect():
+        return [chunk async for chunk in router.stream("q")]
+
+    assert asyncio.run(collect()) == ["he", "llo"]
+
+
+def test_exhausted_raises_last_error():
+    router = LLMRouter([provider("a", error=StatusError(503)), provider("b", error=StatusError(502))])
+
+    with pytest.raises(StatusError):
+        asyncio.run(router.generate("q"))
+    assert router.metrics()["exhausted"] == 1
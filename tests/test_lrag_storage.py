@@ -0,0 +1,164 @@
+import json
+import base64
+import asyncio
+
+import numpy as np
+import pytest
+
+pytest.importorskip("lightrag")
+
+from lightrag.base import DocStatus
+from lightrag.utils import EmbeddingFunc
+
+from rag.lrag_storage import SQLiteKVStorage, SQLiteDocStatusStorage, MmapVectorStorage, migrate_json_storage
+
+
+DIM = 4
+AXES = {"pti": [1, 0, 0, 0], "fees": [0, 1, 0, 0], "hostel": [0, 0, 1, 0], "library": [0, 0, 0, 1]}
+
+
+class Embed:
+    def __init__(self):
+        self.calls = []
+
+    async def __call__(self, texts, persist=True):
+        self.calls.append((list(texts), persist))
+        return np.array([AXES[text.split()[0]] for text in texts], dtype=np.float32)
+
+
+def config(tmp_path):
+    return {
+        "working_dir": str(tmp_path),
+        "embedding_batch_num": 2,
+        "vector_db_storage_cls_kwargs": {"cosine_better_than_threshold": 0.5},
+    }
+
+
+def vector_storage(tmp_path, embed, namespace="entities"):
+    return MmapVectorStorage(
+        namespace=namespace, global_config=config(tmp_path),
+        embedding_func=EmbeddingFunc(embedding_dim=DIM, max_token_size=512, func=embed),
+        meta_fields={"entity_name"},
+    )
+
+
+def kv_storage(cls, tmp_path, namespace):
+    return cls(namespace=namespace, global_config=config(tmp_path), embedding_func=None)
+
+
+def test_kv_round_trip(tmp_path):
+    async def main():
+        store = kv_storage(SQLiteKVStorage, tmp_path, "full_docs")
+        await store.upsert({"doc-1": {"content": "PTI admissions"}, "doc-2": {"content": "Fees"}})
+        await store.finalize()
+
+        store = kv_storage(SQLiteKVStorage, tmp_path, "full_docs")
+        assert await store.get_by_id("doc-1") == {"content": "PTI admissions"}
+        assert await store.get_by_ids(["doc-2", "missing"]) == [{"content": "Fees"}, None]
+        assert await store.filter_keys({"doc-1", "doc-3"}) == {"doc-3"}
+        await store.delete(["doc-1"])
+        assert await store.get_by_id("doc-1") is None
+        # Namespaces share the database file but not their keys.
+        assert await kv_storage(SQLiteKVStorage, tmp_path, "text_chunks").get_by_id("doc-2") is None
+
+    asyncio.run(main())
+
+
+def test_llm_cache_is_stored_per_mode(tmp_path):
+    async def main():
+        cache = kv_storage(SQLiteKVStorage, tmp_path, "llm_response_cache")
+        await cache.upsert({"mix": {"h1": {"return": "a"}}, "global": {"h2": {"return": "b"}}})
+        await cache.upsert({"mix": {"h3": {"return": "c"}}})
+
+        assert await cache.get_by_id("mix") == {"h1": {"return": "a"}, "h3": {"return": "c"}}
+        assert await cache.get_by_mode_and_id("global", "h2") == {"h2": {"return": "b"}}
+        assert await cache.drop_cache_by_modes(["mix"])
+        assert await cache.get_by_id("mix") is None and await cache.get_by_id("global") is not None
+
+    asyncio.run(main())
+
+
+def test_doc_status_counts_and_lookup(tmp_path):
+    def status(state):
+        return {
+            "status": state, "content_summary": "PTI page", "content_length": 8, "chunks_count": 1,
+            "created_at": "2026-01-01T00:00:00", "updated_at": "2026-01-01T00:00:00", "file_path": "https://pti.edu.ng",
+        }
+
+    async def main():
+        store = kv_storage(SQLiteDocStatusStorage, tmp_path, "doc_status")
+        await store.upsert({"doc-1": status(DocStatus.PROCESSED), "doc-2": status(DocStatus.FAILED)})
+
+        counts = await store.get_status_counts()
+        assert counts[DocStatus.PROCESSED.value] == 1 and counts[DocStatus.FAILED.value] == 1
+        failed = await store.get_docs_by_status(DocStatus.FAILED)
+        assert list(failed) == ["doc-2"] and failed["doc-2"].file_path == "https://pti.edu.ng"
+        assert [doc["status"] for doc in await store.get_by_ids(["doc-1", "missing"])] == [DocStatus.PROCESSED.value]
+
+    asyncio.run(main())
+
+
+def test_vectors_round_trip_through_reopen_query_and_delete(tmp_path):
+    async def main():
+        embed = Embed()
+        store = vector_storage(tmp_path, embed)
+        await store.upsert({
+            "ent-1": {"content": "pti institute", "entity_name": "PTI"},
+            "ent-2": {"content": "fees schedule", "entity_name": "Fees"},
+            "ent-3": {"content": "hostel blocks", "entity_name": "Hostel"},
+        })
+        await store.index_done_callback()
+        await store.finalize()
+
+        store = vector_storage(tmp_path, embed)
+        hits = await store.query("fees please", top_k=2)
+        assert [hit["id"] for hit in hits] == ["ent-2"]
+        assert hits[0]["entity_name"] == "Fees" and hits[0]["distance"] == pytest.approx(1.0)
+        assert embed.calls[-1] == (["fees please"], False)
+
+        # An update moves the id to a new row; the old one is reused later.
+        await store.upsert({"ent-2": {"content": "library opening hours", "entity_name": "Library"}})
+        assert await store.query("fees", top_k=3) == []
+        assert [hit["id"] for hit in await store.query("library", top_k=3)] == ["ent-2"]
+
+        await store.delete(["ent-1"])
+        assert await store.query("pti", top_k=3) == []
+        assert [record["__id__"] for record in await store.get_by_ids(["ent-1", "ent-3"])] == ["ent-3"]
+        await store.index_done_callback()
+
+        reopened = vector_storage(tmp_path, embed)
+        assert [hit["id"] for hit in await reopened.query("hostel", top_k=3)] == ["ent-3"]
+        assert await reopened.get_by_id("ent-1") is None
+
+    asyncio.run(main())
+
+
+def test_json_working_dir_is_migrated_once(tmp_path):
+    (tmp_path / "kv_store_full_docs.json").write_text(json.dumps({"doc-1": {"content": "PTI admissions"}}))
+    (tmp_path / "kv_store_doc_status.json").write_text(json.dumps({"doc-1": {"status": "processed", "content_summary": "PTI"}}))
+    (tmp_path / "kv_store_llm_response_cache.json").write_text(json.dumps({"mix": {"h1": {"return": "cached"}}}))
+    matrix = np.array([AXES["pti"], AXES["hostel"]], dtype=np.float32) * 3
+    (tmp_path / "vdb_entities.json").write_text(json.dumps({
+        "embedding_dim": DIM,
+        "data": [{"__id__": "ent-1", "__created_at__": 1.0, "entity_name": "PTI"},
+                 {"__id__": "ent-2", "__created_at__": 2.0, "entity_name": "Hostel"}],
+        "matrix": base64.b64encode(matrix.tobytes()).decode(),
+    }))
+
+    assert migrate_json_storage(str(tmp_path)) == 5
+    assert sorted(path.name for path in tmp_path.glob("*.migrated")) == [
+        "kv_store_doc_status.json.migrated", "kv_store_full_docs.json.migrated",
+        "kv_store_llm_response_cache.json.migrated", "vdb_entities.json.migrated",
+    ]
+    assert not list(tmp_path.glob("*.json"))
+    assert migrate_json_storage(str(tmp_path)) == 0
+
+    async def main():
+        assert await kv_storage(SQLiteKVStorage, tmp_path, "full_docs").get_by_id("doc-1") == {"content": "PTI admissions"}
+        assert await kv_storage(SQLiteKVStorage, tmp_path, "llm_response_cache").get_by_mode_and_id("mix", "h1") == {"h1": {"return": "cached"}}
+        assert (await kv_storage(SQLiteDocStatusStorage, tmp_path, "doc_status").get_status_counts())["processed"] == 1
+        hits = await vector_storage(tmp_path, Embed()).query("hostel", top_k=2)
+        assert [(hit["id"], hit["entity_name"]) for hit in hits] == [("ent-2", "Hostel")]
+        assert hits[0]["distance"] == pytest.approx(1.0)
+
+    asyncio.run(main())
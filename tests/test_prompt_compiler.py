@@ -0,0 +1,57 @@
+from common.history import estimate_tokens
+from common.prompt_compiler import PromptCompiler
+
+
+INSTRUCTIONS = [
+    ("role", "You are the PTI assistant.\n* Answer in markdown."),
+    ("format", "* **Answer in markdown.**\nBe concise."),
+]
+
+
+def test_system_prompt_drops_repeated_instructions():
+    compiler = PromptCompiler(INSTRUCTIONS)
+
+    assert compiler.system_prompt.count("markdown") == 1
+    assert "Be concise." in compiler.system_prompt
+
+
+def test_everything_fits_within_budget():
+    compiler = PromptCompiler(INSTRUCTIONS, token_budget=4000)
+
+    prompt, tokens = compiler.compile("What are the fees?", ["chunk one", "chunk two"], "user: hi\nassistant: hello")
+
+    assert "chunk one" in prompt and "chunk two" in prompt and "assistant: hello" in prompt
+    assert tokens["chunks_dropped"] == 0
+
+
+def test_context_is_trimmed_before_history():
+    compiler = PromptCompiler(INSTRUCTIONS, token_budget=400, min_chunk_tokens=50)
+    chunks = [f"best chunk {'a' * 800}", f"second chunk {'b' * 800}", f"worst chunk {'c' * 800}"]
+    history = "user: earlier question\nassistant: earlier answer"
+
+    prompt, tokens = compiler.compile("What are the fees?", chunks, history)
+
+    assert tokens["total"] <= 400
+    assert "best chunk" in prompt and "worst chunk" not in prompt
+    assert "earlier answer" in prompt
+    assert "What are the fees?" in prompt
+
+
+def test_history_is_dropped_oldest_first_when_needed():
+    compiler = PromptCompiler(INSTRUCTIONS, token_budget=200)
+    history = "\n".join(f"user: old question {i} {'x' * 200}" for i in range(10)) + "\nassistant: latest"
+
+    prompt, tokens = compiler.compile("Question?", [], history)
+
+    assert tokens["total"] <= 200
+    assert "latest" in prompt and "old question 0" not in prompt
+
+
+def test_question_is_always_sent():
+    compiler = PromptCompiler(INSTRUCTIONS, token_budget=10)
+    question = "Where is the registry? " * 20
+
+    prompt, _ = compiler.compile(question, ["context " * 100])
+
+    assert question.strip() in prompt
+    assert estimate_tokens(prompt) >= estimate_tokens(question)
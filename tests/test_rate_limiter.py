@@ -0,0 +1,92 @@
+import time
+import asyncio
+
+from common.rate_limiter import RateLimiter, SingleFlight, ModelQuota, INTERACTIVE, INGESTION
+
+
+def test_pinned_model_version_shares_base_quota():
+    limiter = RateLimiter({"gemini-1.5-flash-8b": (15, 1_000_000)})
+
+    quota = limiter.quota("gemini-1.5-flash-8b-001")
+
+    assert quota is limiter.quota("gemini-1.5-flash-8b")
+    assert quota.requests.capacity == 15
+
+
+def test_versioned_entry_wins_over_base():
+    limiter = RateLimiter({"gemini-1.5-flash-8b": (15, 1_000_000), "gemini-1.5-flash-8b-001": (5, 1_000)})
+
+    assert limiter.quota("gemini-1.5-flash-8b-001").requests.capacity == 5
+    assert limiter.quota("groq/compound").requests.capacity == 60
+
+
+def test_quota_delays_requests_over_the_limit():
+    async def main():
+        # 600 rpm = one request per 0.1s once the burst is spent.
+        quota = ModelQuota("m", rpm=600, tpm=10**9)
+        quota.requests.level = 1
+        start = time.monotonic()
+        await quota.acquire(1)
+        await quota.acquire(1)
+        return time.monotonic() - start, quota.stats()
+
+    elapsed, stats = asyncio.run(main())
+
+    assert elapsed >= 0.08
+    assert stats["granted"] == 2 and stats["delayed"] == 1
+
+
+def test_interactive_lane_is_served_before_queued_ingestion():
+    async def main():
+        quota = ModelQuota("m", rpm=600, tpm=10**9)
+        quota.requests.level = 0
+        order = []
+
+        async def call(name, priority):
+            await quota.acquire(1, priority)
+            order.append(name)
+
+        ingestion = asyncio.ensure_future(call("ingestion", INGESTION))
+        await asyncio.sleep(0)
+        interactive = asyncio.ensure_future(call("chat", INTERACTIVE))
+        await asyncio.gather(ingestion, interactive)
+        return order
+
+    assert asyncio.run(main()) == ["chat", "ingestion"]
+
+
+def test_single_flight_shares_one_call():
+    calls = []
+
+    async def main():
+        flight = SingleFlight()
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "answer"
+
+        results = await asyncio.gather(*(flight.do("key", work) for _ in range(5)))
+        return results, flight.coalesced
+
+    results, coalesced = asyncio.run(main())
+
+    assert results == ["answer"] * 5
+    assert len(calls) == 1 and coalesced == 4
+
+
+def test_single_flight_caller_cancel_does_not_cancel_others():
+    async def main():
+        flight = SingleFlight()
+
+        async def work():
+            await asyncio.sleep(0.02)
+            return "done"
+
+        first = asyncio.ensure_future(flight.do("key", work))
+        second = asyncio.ensure_future(flight.do("key", work))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(main()) == "done"
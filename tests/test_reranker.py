@@ -0,0 +1,66 @@
+import pytest
+
+from retrieval.reranker import CrossEncoderReranker
+
+
+class Model:
+    """Stub cross-encoder: the score is the number written in the chunk."""
+
+    def __init__(self):
+        self.scored = []
+
+    def __call__(self, pairs):
+        self.scored.extend(chunk for _, chunk in pairs)
+        return [float(chunk.split()[-1]) for _, chunk in pairs]
+
+
+def candidates(*scores):
+    return [{"id": f"c{i}", "text": f"chunk {score}"} for i, score in enumerate(scores)]
+
+
+def test_results_come_back_best_first():
+    reranker = CrossEncoderReranker(Model(), batch_size=8)
+
+    ranked = reranker.rerank("acceptance fee", candidates(0.2, 0.9, 0.1, 0.5), top_n=3)
+
+    assert [(c["id"], score) for c, score in ranked] == [("c1", pytest.approx(0.9)), ("c3", pytest.approx(0.5)), ("c0", pytest.approx(0.2))]
+
+
+def test_cached_pairs_are_not_rescored():
+    model = Model()
+    reranker = CrossEncoderReranker(model, batch_size=8)
+    first = candidates(0.2, 0.9, 0.1)
+    reranker.rerank("acceptance fee", first, key=lambda c: c["id"])
+    model.scored.clear()
+
+    # Same query: only the new chunk reaches the model, and cached scores still rank.
+    ranked = reranker.rerank("acceptance fee", first + [{"id": "c3", "text": "chunk 0.95"}], top_n=2, key=lambda c: c["id"])
+
+    assert model.scored == ["chunk 0.95"]
+    assert [c["id"] for c, _ in ranked] == ["c3", "c1"]
+    assert reranker.stats()["cache_hits"] == 3
+
+    # Another query is a different cache key.
+    reranker.rerank("hostel", first, key=lambda c: c["id"])
+    assert model.scored == ["chunk 0.95"] + [c["text"] for c in first]
+
+
+def test_tail_is_skipped_once_the_top_holds():
+    model = Model()
+    reranker = CrossEncoderReranker(model, batch_size=2, patience=1)
+
+    ranked = reranker.rerank("fees", candidates(0.9, 0.8, 0.1, 0.2, 0.3, 0.4), top_n=2)
+
+    # The second batch left the top 2 unchanged, so the third is never scored.
+    assert model.scored == ["chunk 0.9", "chunk 0.8", "chunk 0.1", "chunk 0.2"]
+    assert [c["id"] for c, _ in ranked] == ["c0", "c1"]
+    stats = reranker.stats()
+    assert stats["skipped"] == 2 and stats["cutoffs"] == 1 and stats["ms_per_call"] is not None
+
+
+def test_cache_is_bounded():
+    reranker = CrossEncoderReranker(Model(), cache_size=2)
+
+    reranker.rerank("fees", candidates(0.1, 0.2, 0.3))
+
+    assert reranker.stats()["cached_scores"] == 2
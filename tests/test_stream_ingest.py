@@ -0,0 +1,96 @@
+import json
+import asyncio
+
+import pytest
+
+from ingestion.stream_ingest import iter_json_array, IngestionManifest, doc_id_for_url
+
+
+@pytest.mark.parametrize("items", [
+    [123, 456],
+    [{"url": "a", "markdown": "x" * 50}, {"url": "b", "markdown": "é ü"}],
+    ["text", 7, 1.5, True, None, [1, 2], {"nested": [3]}],
+    [],
+])
+@pytest.mark.parametrize("buffer_size", [1, 2, 3, 7, 1 << 16])
+def test_iter_json_array_matches_json_load(tmp_path, items, buffer_size):
+    path = tmp_path / "corpus.json"
+    path.write_text(json.dumps(items, indent=2, ensure_ascii=False), encoding="utf-8")
+
+    assert list(iter_json_array(str(path), buffer_size)) == items
+
+
+def test_iter_json_array_rejects_non_array(tmp_path):
+    path = tmp_path / "corpus.json"
+    path.write_text('{"url": "a"}', encoding="utf-8")
+
+    with pytest.raises(ValueError):
+        list(iter_json_array(str(path)))
+
+
+def test_manifest_last_line_wins_and_skips_torn_line(tmp_path):
+    path = str(tmp_path / "manifest.jsonl")
+    manifest = IngestionManifest(path)
+    manifest.record([{"doc_id": "d1", "url": "a", "hash": "h1", "status": "failed"}])
+    manifest.record([{"doc_id": "d1", "url": "a", "hash": "h1", "status": "processed"}])
+    with open(path, "a", encoding="utf-8") as file:
+        file.write('{"doc_id": "d2", "url"')
+
+    reloaded = IngestionManifest(path)
+
+    assert reloaded.is_current("d1", "h1")
+    assert not reloaded.is_current("d1", "other")
+    assert "d2" not in reloaded.entries
+
+
+class FakeDocStatus:
+    def __init__(self):
+        self.statuses = {}
+
+    async def get_docs_by_status(self, status):
+        return {}
+
+    async def get_by_id(self, doc_id):
+        return self.statuses.get(doc_id)
+
+    async def get_by_ids(self, ids):
+        # Like LightRAG's stores: missing documents are left out.
+        return [self.statuses[doc_id] for doc_id in ids if doc_id in self.statuses]
+
+
+class FakeRag:
+    """Drops some documents without a status, as LightRAG does with duplicate contents."""
+
+    def __init__(self, dropped):
+        self.doc_status = FakeDocStatus()
+        self.dropped = dropped
+
+    async def ainsert(self, texts, ids, file_paths, split_by_character=None):
+        for doc_id, url in zip(ids, file_paths):
+            if url not in self.dropped:
+                self.doc_status.statuses[doc_id] = {"status": "processed"}
+
+    async def adelete_by_doc_id(self, doc_id):
+        self.doc_status.statuses.pop(doc_id, None)
+
+
+def test_ingest_matches_statuses_by_doc_id(tmp_path):
+    pytest.importorskip("lightrag")
+    from ingestion.stream_ingest import aingest_corpus
+
+    pages = [
+        {"url": "https://pti.edu.ng/a", "markdown": "# A\n\nadmissions"},
+        {"url": "https://pti.edu.ng/b", "markdown": "# B\n\nfees"},
+        {"url": "https://pti.edu.ng/c", "markdown": "# C\n\ncontacts"},
+    ]
+    corpus = tmp_path / "corpus.json"
+    corpus.write_text(json.dumps(pages), encoding="utf-8")
+    manifest_path = str(tmp_path / "manifest.jsonl")
+
+    rag = FakeRag(dropped={"https://pti.edu.ng/b"})
+    stats = asyncio.run(aingest_corpus(rag, str(corpus), batch_size=8, manifest_path=manifest_path))
+
+    entries = IngestionManifest(manifest_path).entries
+    assert stats["inserted"] == 2 and stats["failed"] == 1
+    assert entries[doc_id_for_url("https://pti.edu.ng/b")]["status"] == "failed"
+    assert entries[doc_id_for_url("https://pti.edu.ng/c")]["status"] == "processed"